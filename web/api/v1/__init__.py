@@ -1,5 +1,6 @@
 """Main module for API v1"""
 
+from config import configuration as config
 from api.v1.endpoints import get_api_endpoint
 from api.v1.objects import (
     MeasurementTypes,
@@ -18,16 +19,19 @@ from api.v1.objects import (
     HighestMeasurementMultiple,
     SimilarFeatures,
     SimilarCelltypes,
+    SimilarCelltypesAcrossOrganisms,
     CelltypeXOrgan,
     OrganXOrganism,
     CelltypeXOrganism,
     CelltypeLocation,
     Neighborhood,
     InteractionPartners,
+    LigandReceptorScores,
     Homologs,
     ApproximationFile,
     FullAtlasFiles,
     HomologyDistances,
+    CacheStats,
 )
 
 __all__ = ("api_dict",)
@@ -48,11 +52,13 @@ api_dict = {
         "neighborhood": Neighborhood,
         "markers": Markers,
         "interaction_partners": InteractionPartners,
+        "ligand_receptor_scores": LigandReceptorScores,
         "homologs": Homologs,
         "highest_measurement": HighestMeasurement,
         "highest_measurement_multiple": HighestMeasurementMultiple,
         "similar_features": SimilarFeatures,
         "similar_celltypes": SimilarCelltypes,
+        "similar_celltypes_across_organisms": SimilarCelltypesAcrossOrganisms,
         "celltypexorgan": CelltypeXOrgan,
         "organxorganism": OrganXOrganism,
         "celltypexorganism": CelltypeXOrganism,
@@ -63,3 +69,7 @@ api_dict = {
         "homology_distances": HomologyDistances,
     },
 }
+
+# Server-internal statistics are only exposed if enabled in the config
+if config["admin"]["cache_stats"]:
+    api_dict["objects"]["cache_stats"] = CacheStats
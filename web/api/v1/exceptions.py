@@ -31,8 +31,15 @@ def required_parameters(*required_args):
 
         def func(*args_inner, **kwargs_inner):
             """Decorated function."""
+            # Parameters are in the query string, or in a JSON body for POST requests
+            if request.method == "POST":
+                args = request.get_json(silent=True)
+                if not isinstance(args, dict):
+                    args = {}
+            else:
+                args = request.args
             for arg in required_args:
-                if request.args.get(arg, None) is None:
+                if args.get(arg, None) is None:
                     abort(
                         400,
                         message=f'The "{arg}" parameter is required.',
@@ -13,6 +13,7 @@ from api.v1.objects.highest_measurement import HighestMeasurement
 from api.v1.objects.highest_measurement_multiple import HighestMeasurementMultiple
 from api.v1.objects.similar_features import SimilarFeatures
 from api.v1.objects.similar_celltypes import SimilarCelltypes
+from api.v1.objects.similar_celltypes_across_organisms import SimilarCelltypesAcrossOrganisms
 from api.v1.objects.celltypexorgan import CelltypeXOrgan
 from api.v1.objects.organxorganism import OrganXOrganism
 from api.v1.objects.celltypexorganism import CelltypeXOrganism
@@ -20,10 +21,12 @@ from api.v1.objects.celltype_location import CelltypeLocation
 from api.v1.objects.neighborhood import Neighborhood
 from api.v1.objects.dotplot import Dotplot
 from api.v1.objects.interaction_partners import InteractionPartners
+from api.v1.objects.ligand_receptor_scores import LigandReceptorScores
 from api.v1.objects.homologs import Homologs
 from api.v1.objects.approximation_file import ApproximationFile
 from api.v1.objects.full_atlas_files import FullAtlasFiles
 from api.v1.objects.homology_distances import HomologyDistances
+from api.v1.objects.cache_stats import CacheStats
 
 
 __all__ = (
@@ -42,6 +45,7 @@ __all__ = (
     "HighestMeasurementMultiple",
     "Markers",
     "SimilarCelltypes",
+    "SimilarCelltypesAcrossOrganisms",
     "SimilarFeatures",
     "CelltypeXOrgan",
     "OrganXOrganism",
@@ -49,8 +53,10 @@ __all__ = (
     "DataSources",
     "CelltypeLocation",
     "InteractionPartners",
+    "LigandReceptorScores",
     "Homologs",
     "ApproximationFile",
     "FullAtlasFiles",
     "HomologyDistances",
+    "CacheStats",
 )
@@ -8,8 +8,7 @@ from models import (
     get_averages,
     get_celltypes,
     get_celltype_location,
-    get_feature_index,
-    get_feature_names,
+    resolve_features,
 )
 from api.v1.exceptions import (
     FeatureStringFormatError,
@@ -81,14 +80,11 @@ class Average(Resource):
 
 
         # NOTE: this is just about capitalisation (should rename it really)
-        features_corrected = []
-        features_all = get_feature_names(
-            organism=organism,
+        features_corrected = resolve_features(
+            organism,
+            features,
             measurement_type=measurement_type,
-        )
-        for fea in features:
-            idx = get_feature_index(organism, fea.lower(), measurement_type=measurement_type)
-            features_corrected.append(features_all[idx])
+        )["name"].tolist()
 
         result = {
             "organism": organism,
@@ -0,0 +1,23 @@
+# Web imports
+from flask_restful import Resource
+
+# Helper functions
+from models import (
+    get_file_handle_stats,
+    get_chunk_cache_stats,
+)
+from api.v1.exceptions import (
+    model_exceptions,
+)
+
+
+class CacheStats(Resource):
+    """Get usage statistics of the server-side caches"""
+
+    @model_exceptions
+    def get(self):
+        """Get hit/miss/eviction counters for open files and decompressed chunks"""
+        return {
+            "file_handles": get_file_handle_stats(),
+            "chunks": get_chunk_cache_stats(),
+        }
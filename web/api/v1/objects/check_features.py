@@ -4,9 +4,7 @@ from flask_restful import Resource, abort
 
 # Helper functions
 from models import (
-    get_features,
-    get_feature_index,
-    get_feature_names,
+    resolve_features,
 )
 from api.v1.exceptions import (
     required_parameters,
@@ -30,25 +28,13 @@ class HasFeatures(Resource):
         features = args.get("features")
         features = clean_feature_string(features, organism, measurement_type)
 
-        features_lowercase = get_features(
-            organism=organism,
+        resolved = resolve_features(
+            organism,
+            features,
             measurement_type=measurement_type,
         )
-
-        is_found = []
-        features_corrected = []
-        features_all = get_feature_names(
-            organism=organism,
-            measurement_type=measurement_type,
-        )
-        for fea in features:
-            if fea.lower() not in features_lowercase:
-                is_found.append(False)
-                features_corrected.append(fea)
-            else:
-                is_found.append(True)
-                idx = get_feature_index(organism, fea.lower(), measurement_type=measurement_type)
-                features_corrected.append(features_all[idx])
+        features_corrected = resolved["name"].tolist()
+        is_found = (~resolved["missing"]).tolist()
 
         return {
             "measurement_type": measurement_type,
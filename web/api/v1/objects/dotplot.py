@@ -5,12 +5,10 @@ from flask_restful import Resource, abort
 # Helper functions
 from config import configuration as config
 from models import (
-    get_averages,
-    get_fraction_detected,
+    get_dotplot_data,
     get_celltypes,
     get_celltype_location,
-    get_feature_index,
-    get_feature_names,
+    resolve_features,
     OrganismNotFoundError,
     OrganNotFoundError,
     CellTypeNotFoundError,
@@ -61,13 +59,7 @@ class Dotplot(Resource):
 
         if organ is not None:
             organ = clean_organ_string(organ)
-            avgs = get_averages(
-                organism=organism,
-                organ=organ,
-                features=features,
-                measurement_type=measurement_type,
-            )
-            fracs = get_fraction_detected(
+            dotplot_data = get_dotplot_data(
                 organism=organism,
                 organ=organ,
                 features=features,
@@ -80,13 +72,7 @@ class Dotplot(Resource):
             ))
         else:
             cell_type = clean_celltype_string(cell_type)
-            avgs = get_averages(
-                organism=organism,
-                cell_type=cell_type,
-                features=features,
-                measurement_type=measurement_type,
-            )
-            fracs = get_fraction_detected(
+            dotplot_data = get_dotplot_data(
                 organism=organism,
                 cell_type=cell_type,
                 features=features,
@@ -98,21 +84,18 @@ class Dotplot(Resource):
                 measurement_type=measurement_type,
             ))
 
-        features_corrected = []
-        features_all = get_feature_names(
-            organism=organism,
+        features_corrected = resolve_features(
+            organism,
+            features,
             measurement_type=measurement_type,
-        )
-        for fea in features:
-            idx = get_feature_index(organism, fea.lower(), measurement_type=measurement_type)
-            features_corrected.append(features_all[idx])
+        )["name"].tolist()
 
         result = {
             "organism": organism,
             "measurement_type": measurement_type,
             "features": features_corrected,
-            "average": avgs.tolist(),
-            "fraction_detected": fracs.tolist(),
+            "average": dotplot_data["average"].tolist(),
+            "fraction_detected": dotplot_data["fraction"].tolist(),
             "unit": unit,
         }
         if organ is not None:
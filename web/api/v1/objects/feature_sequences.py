@@ -1,13 +1,16 @@
 # Web imports
-from flask import request
+from flask import (
+    request,
+    Response,
+    stream_with_context,
+)
 from flask_restful import Resource, abort
 
 # Helper functions
 from models import (
-    get_features,
-    get_feature_index,
-    get_feature_names,
+    resolve_features,
     get_feature_sequences,
+    get_feature_sequences_fasta,
 )
 from api.v1.exceptions import (
     required_parameters,
@@ -30,24 +33,29 @@ class FeatureSequences(Resource):
         organism = args.get("organism")
         features = args.get("features")
         features = clean_feature_string(features, organism, measurement_type)
+        output_format = args.get("format", "json").lower()
+        if output_format not in ("json", "fasta"):
+            abort(400, message='The "format" parameter should be "json" or "fasta".')
 
-        features_lowercase = get_features(
-            organism=organism,
+        # NOTE: this is just about capitalisation, missing features are left as they are
+        features_corrected = resolve_features(
+            organism,
+            features,
             measurement_type=measurement_type,
-        )
+        )["name"].tolist()
 
-        features_corrected = []
-        sequences = []
-        features_all = get_feature_names(
-            organism=organism,
-            measurement_type=measurement_type,
-        )
-        for fea in features:
-            if fea.lower() not in features_lowercase:
-                features_corrected.append(fea)
-            else:
-                idx = get_feature_index(organism, fea.lower(), measurement_type=measurement_type)
-                features_corrected.append(features_all[idx])
+        # Large requests can be streamed as FASTA instead of building a JSON in memory
+        if output_format == "fasta":
+            _, records = get_feature_sequences_fasta(
+                organism,
+                features_corrected,
+                measurement_type=measurement_type,
+            )
+            return Response(
+                stream_with_context(records),
+                mimetype="text/x-fasta",
+                headers={"Content-Disposition": f"attachment; filename={organism}_sequences.fasta"},
+            )
 
         features, sequences, sequence_type = get_feature_sequences(
             organism,
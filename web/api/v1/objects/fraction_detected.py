@@ -7,8 +7,7 @@ from models import (
     get_fraction_detected,
     get_celltypes,
     get_celltype_location,
-    get_feature_index,
-    get_feature_names,
+    resolve_features,
 )
 from api.v1.exceptions import (
     FeatureStringFormatError,
@@ -72,14 +71,11 @@ class FractionDetected(Resource):
                 measurement_type=measurement_type,
             ))
 
-        features_corrected = []
-        features_all = get_feature_names(
-            organism=organism,
+        features_corrected = resolve_features(
+            organism,
+            features,
             measurement_type=measurement_type,
-        )
-        for fea in features:
-            idx = get_feature_index(organism, fea.lower(), measurement_type=measurement_type)
-            features_corrected.append(features_all[idx])
+        )["name"].tolist()
 
         result = {
             "organism": organism,
@@ -5,8 +5,7 @@ from flask_restful import Resource, abort
 # Helper functions
 from config import configuration as config
 from models import (
-    get_feature_index,
-    get_feature_names,
+    resolve_features,
     get_highest_measurement_multiple,
 )
 from api.v1.exceptions import (
@@ -56,18 +55,16 @@ class HighestMeasurementMultiple(Resource):
         features_neg = result.get("features_negative", [])
 
         # NOTE: this is just about capitalisation (should rename it really)
-        features_corrected = []
-        features_neg_corrected = []
-        features_all = get_feature_names(
-            organism=organism,
+        features_corrected = resolve_features(
+            organism,
+            features,
             measurement_type=measurement_type,
-        )
-        for fea in features:
-            idx = get_feature_index(organism, fea.lower(), measurement_type=measurement_type)
-            features_corrected.append(features_all[idx])
-        for fea in features_neg:
-            idx = get_feature_index(organism, fea.lower(), measurement_type=measurement_type)
-            features_neg_corrected.append(features_all[idx])
+        )["name"].tolist()
+        features_neg_corrected = resolve_features(
+            organism,
+            features_neg,
+            measurement_type=measurement_type,
+        )["name"].tolist()
 
 
         result = {
@@ -25,18 +25,36 @@ class HomologyDistances(Resource):
     )
     @model_exceptions
     def get(self):
-        """Get list of cell types for an organ and organism"""
-        args = request.args
+        """Get homology distances for pairs of features"""
+        return self._get_distances(request.args)
+
+    @required_parameters(
+        "source_organism", "target_organism", "source_features", "target_features"
+    )
+    @model_exceptions
+    def post(self):
+        """Get homology distances for pairs of features sent as JSON.
+
+        Long lists of pairs do not fit in a URL, so they can be posted as lists instead.
+        """
+        return self._get_distances(request.get_json())
+
+    def _get_distances(self, args):
         source_organism = args.get("source_organism")
         target_organism = args.get("target_organism")
 
         source_features = args.get("source_features")
+        # JSON bodies can have lists of features rather than comma-separated strings
+        if isinstance(source_features, list):
+            source_features = ",".join(map(str, source_features))
         source_features = clean_feature_string(
             source_features,
             source_organism,
             measurement_type="gene_expression",
         )
         target_features = args.get("target_features")
+        if isinstance(target_features, list):
+            target_features = ",".join(map(str, target_features))
         target_features = clean_feature_string(
             target_features,
             target_organism,
@@ -4,7 +4,7 @@ from flask_restful import Resource, abort
 
 # Helper functions
 from models import (
-    get_feature_index,
+    get_feature_indices,
     get_feature_names,
     get_interaction_partners,
 )
@@ -31,14 +31,16 @@ class InteractionPartners(Resource):
         features = clean_feature_string(features, organism, measurement_type)
 
         # NOTE: this is just about capitalisation (should rename it really)
-        features_corrected = []
+        idxs = get_feature_indices(
+            organism,
+            features,
+            measurement_type=measurement_type,
+        )
         features_all = get_feature_names(
             organism=organism,
             measurement_type=measurement_type,
         )
-        for fea in features:
-            idx = get_feature_index(organism, fea.lower(), measurement_type=measurement_type)
-            features_corrected.append(features_all[idx])
+        features_corrected = list(features_all[idxs])
 
         result = get_interaction_partners(
             organism,
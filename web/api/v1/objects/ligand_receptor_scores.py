@@ -0,0 +1,61 @@
+# Web imports
+from flask import request
+from flask_restful import Resource, abort
+
+# Helper functions
+from models import (
+    get_ligand_receptor_scores,
+)
+from api.v1.exceptions import (
+    required_parameters,
+    model_exceptions,
+)
+from api.v1.utils import (
+    clean_organ_string,
+)
+
+
+class LigandReceptorScores(Resource):
+    """Get the strongest ligand-receptor interactions between cell types of an organ"""
+
+    @required_parameters('organism', 'organ')
+    @model_exceptions
+    def get(self):
+        """Get top ligand-receptor interactions between sender and receiver cell types"""
+        args = request.args
+        organism = args.get("organism")
+        organ = args.get("organ")
+        organ = clean_organ_string(organ)
+
+        number = args.get("number", 50)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            abort(400, message='The "number" parameter should be an integer.')
+        if number <= 0:
+            abort(400, message='The "number" parameter should be positive.')
+
+        min_fraction = args.get("min_fraction", 0.1)
+        try:
+            min_fraction = float(min_fraction)
+        except (TypeError, ValueError):
+            abort(400, message='The "min_fraction" parameter should be a number.')
+        if (min_fraction < 0) or (min_fraction > 1):
+            abort(400, message='The "min_fraction" parameter should be between 0 and 1.')
+
+        result = get_ligand_receptor_scores(
+            organism=organism,
+            organ=organ,
+            number=number,
+            min_fraction=min_fraction,
+        )
+
+        return {
+            "organism": organism,
+            "organ": organ,
+            "senders": list(result["senders"]),
+            "receivers": list(result["receivers"]),
+            "ligands": list(result["ligands"]),
+            "receptors": list(result["receptors"]),
+            "scores": list(result["scores"].astype(float)),
+        }
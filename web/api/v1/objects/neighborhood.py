@@ -7,8 +7,7 @@ from config import configuration as config
 from models import (
     get_celltypes,
     get_neighborhoods,
-    get_feature_index,
-    get_feature_names,
+    resolve_features,
 )
 from api.v1.exceptions import (
     required_parameters,
@@ -59,14 +58,11 @@ class Neighborhood(Resource):
             convex_hulls = [hull.tolist() for hull in neis['convex_hull']]
 
         if (features is not None) and len(features):
-            features_corrected = []
-            features_all = get_feature_names(
-                organism=organism,
+            features_corrected = resolve_features(
+                organism,
+                features,
                 measurement_type=measurement_type,
-            )
-            for fea in features:
-                idx = get_feature_index(organism, fea.lower(), measurement_type=measurement_type)
-                features_corrected.append(features_all[idx])
+            )["name"].tolist()
 
         result = {
             "measurement_type": measurement_type,
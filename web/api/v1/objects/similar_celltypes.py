@@ -4,8 +4,7 @@ from flask_restful import Resource, abort
 
 # Helper functions
 from models import (
-    get_feature_index,
-    get_feature_names,
+    resolve_features,
     get_similar_celltypes,
 )
 from api.v1.exceptions import (
@@ -58,14 +57,11 @@ class SimilarCelltypes(Resource):
             measurement_type=measurement_type,
         )
 
-        features_corrected = []
-        features_all = get_feature_names(
-            organism=organism,
+        features_corrected = resolve_features(
+            organism,
+            features,
             measurement_type=measurement_type,
-        )
-        for fea in features:
-            idx = get_feature_index(organism, fea.lower(), measurement_type=measurement_type)
-            features_corrected.append(features_all[idx])
+        )["name"].tolist()
 
         return {
             "measurement_type": measurement_type,
@@ -0,0 +1,62 @@
+# Web imports
+from flask import request
+from flask_restful import Resource, abort
+
+# Helper functions
+from models import (
+    get_similar_celltypes_across_organisms,
+)
+from api.v1.exceptions import (
+    required_parameters,
+    model_exceptions,
+)
+from api.v1.utils import (
+    clean_organ_string,
+    clean_celltype_string,
+)
+
+
+class SimilarCelltypesAcrossOrganisms(Resource):
+    """Get cell types in other organisms similar to the focal one"""
+
+    @required_parameters('organism', 'organ', 'celltype', 'number')
+    @model_exceptions
+    def get(self):
+        """Get list of cell types in other organisms similar to the focal one"""
+        args = request.args
+        organism = args.get("organism")
+        organ = args.get("organ")
+        organ = clean_organ_string(organ)
+        cell_type = args.get("celltype")
+        cell_type = clean_celltype_string(cell_type)
+        target_organisms = args.get("target_organisms", None)
+        if target_organisms is not None:
+            target_organisms = [org.strip() for org in target_organisms.split(",") if org.strip()]
+        per_organism = str(args.get("per_organism", 'false')).lower() != 'false'
+
+        number = args.get("number")
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            abort(400, message='The "number" parameter should be an integer.')
+        if number <= 0:
+            abort(400, message='The "number" parameter should be positive.')
+
+        result = get_similar_celltypes_across_organisms(
+            organism=organism,
+            organ=organ,
+            celltype=cell_type,
+            target_organisms=target_organisms,
+            number=number,
+            per_organism=per_organism,
+        )
+
+        return {
+            "organism": organism,
+            "organ": organ,
+            "celltype": cell_type,
+            "similar_organisms": list(result["organisms"]),
+            "similar_organs": list(result["organs"]),
+            "similar_celltypes": list(result["celltypes"]),
+            "distances": list(result["distances"].astype(float)),
+        }
@@ -28,6 +28,7 @@ class SimilarFeatures(Resource):
         feature = args.get("feature")
         number = args.get("number")
         method = args.get("method", "correlation")
+        exact = str(args.get("exact", "false")).lower() != "false"
 
         try:
             number = int(number)
@@ -50,6 +51,7 @@ class SimilarFeatures(Resource):
             method=method,
             measurement_type=measurement_type,
             similar_type=measurement_type,
+            exact=exact,
         )
 
         features_all = get_feature_names(
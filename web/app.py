@@ -10,6 +10,10 @@ from flask_restful import Api
 from flask_cors import CORS
 from config import configuration as config
 from api import api_dict
+from models import (
+    load_catalog,
+    load_presence_index,
+)
 
 
 ##############################
@@ -34,6 +38,11 @@ for api_version in api_authorized_versions:
 # Cross-origin request handler
 CORS(app, resources=authorized_resources)
 
+# Index organs and cell types of all atlases in memory
+load_catalog()
+# Cell types across organisms, for cross-organism tables
+load_presence_index()
+
 
 # Main loop
 if __name__ == "__main__":
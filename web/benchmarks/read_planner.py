@@ -0,0 +1,76 @@
+"""Benchmark the chunk-aware read planner against plain h5py column selections.
+
+Run from the "web" folder so that config.yml is found, e.g.:
+
+    python benchmarks/read_planner.py --organism h_sapiens --organ lung \
+        --measurement-type chromatin_accessibility
+"""
+import argparse
+import pathlib
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from models.paths import get_atlas_path
+from models.utils import ApproximationFile
+from models.utils import chunk_cache, read_columns
+
+
+def _time(func, repeats):
+    timings = []
+    for i in range(repeats):
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+    return np.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--organism", default="h_sapiens")
+    parser.add_argument("--organ", default="lung")
+    parser.add_argument("--measurement-type", default="gene_expression")
+    parser.add_argument("--measurement-subtype", default="average")
+    parser.add_argument("--nfeatures", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    approx_path = get_atlas_path(args.organism)
+    with ApproximationFile(approx_path) as db:
+        db_dataset = db["measurements"][args.measurement_type]["data"]["tissue->celltype"][
+            args.organ
+        ][args.measurement_subtype]
+        print(f"Dataset: {db_dataset.name}, shape {db_dataset.shape}, chunks {db_dataset.chunks}")
+        print(f"{'features':>8} {'h5py (ms)':>10} {'cold (ms)':>10} {'warm (ms)':>10} {'speedup':>8}")
+
+        ncols = db_dataset.shape[1]
+        for nfeatures in args.nfeatures:
+            columns = np.sort(rng.choice(ncols, size=min(nfeatures, ncols), replace=False))
+
+            def read_h5py():
+                return db_dataset[:, columns]
+
+            def read_cold():
+                chunk_cache.clear()
+                return read_columns(db_dataset, columns)
+
+            def read_warm():
+                return read_columns(db_dataset, columns)
+
+            assert (read_h5py() == read_cold()).all()
+
+            t_h5py = _time(read_h5py, args.repeats)
+            t_cold = _time(read_cold, args.repeats)
+            t_warm = _time(read_warm, args.repeats)
+            print(
+                f"{nfeatures:>8} {1000 * t_h5py:>10.2f} {1000 * t_cold:>10.2f} "
+                f"{1000 * t_warm:>10.2f} {t_h5py / t_cold:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark approximate similar features (LSH index) against the exact search.
+
+Build the index first, then run from the "web" folder, e.g.:
+
+    python build_indices.py similar_ann --organisms h_sapiens
+    python benchmarks/similar_ann.py --organism h_sapiens --organ lung --nqueries 100
+"""
+import argparse
+import pathlib
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from models.features import get_feature_names
+from models.similar import (
+    _get_similar_features_ann,
+    _get_similar_features_blocked,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--organism", default="h_sapiens")
+    parser.add_argument("--organ", default="lung")
+    parser.add_argument("--measurement-type", default="chromatin_accessibility")
+    parser.add_argument("--method", default="correlation", choices=["correlation", "cosine"])
+    parser.add_argument("--number", type=int, default=10)
+    parser.add_argument("--nqueries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.measurement_type == "gene_expression":
+        measurement_subtype = "fraction"
+    else:
+        measurement_subtype = "average"
+
+    rng = np.random.default_rng(args.seed)
+    nfeatures = len(get_feature_names(args.organism, args.measurement_type))
+    queries = rng.choice(nfeatures, size=min(args.nqueries, nfeatures), replace=False)
+
+    recalls = []
+    timings_exact = []
+    timings_ann = []
+    nfallback = 0
+    for idx in queries:
+        func_args = (
+            args.organism, args.organ, idx, args.number + 1, args.method,
+            args.measurement_type, measurement_subtype,
+        )
+        t0 = time.perf_counter()
+        idx_exact = _get_similar_features_blocked(*func_args)[0]
+        t1 = time.perf_counter()
+        result_ann = _get_similar_features_ann(*func_args)
+        t2 = time.perf_counter()
+        timings_exact.append(t1 - t0)
+        timings_ann.append(t2 - t1)
+
+        if result_ann is None:
+            nfallback += 1
+            continue
+        # Leave the focal feature itself out of the comparison
+        idx_exact = set(idx_exact) - {idx}
+        idx_ann = set(result_ann[0]) - {idx}
+        recalls.append(len(idx_exact & idx_ann) / max(1, len(idx_exact)))
+
+    print(f"Queries: {len(queries)}, features: {nfeatures}, top {args.number}")
+    print(f"Exact: {1000 * np.median(timings_exact):.2f} ms (median)")
+    print(f"ANN: {1000 * np.median(timings_ann):.2f} ms (median)")
+    if len(recalls):
+        print(f"Recall@{args.number}: {np.mean(recalls):.3f} (mean), {np.min(recalls):.3f} (min)")
+    print(f"Too few candidates (would fall back to exact): {nfallback}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark top-k selection against a full argsort on synthetic scores.
+
+Run from the "web" folder, e.g.:
+
+    python benchmarks/topk.py --nvalues 20000 100000 1000000 --number 10 100
+"""
+import argparse
+import pathlib
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from models.topk import top_k
+
+
+def _time(func, repeats):
+    timings = []
+    for i in range(repeats):
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+    return np.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--nvalues", type=int, nargs="+", default=[20000, 100000, 1000000])
+    parser.add_argument("--number", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'values':>8} {'number':>6} {'argsort (ms)':>12} {'top_k (ms)':>10} {'speedup':>8}")
+    for nvalues in args.nvalues:
+        # Quantised data have lots of ties, so mimic that
+        values = rng.integers(0, 256, size=nvalues).astype(np.float32) / 255
+        for number in args.number:
+            def select_argsort():
+                return values.argsort()[::-1][:number]
+
+            def select_top_k():
+                return top_k(values, number)
+
+            # Same values, although ties may come in a different order
+            assert np.array_equal(
+                np.sort(values[select_argsort()]), np.sort(values[select_top_k()]),
+            )
+
+            t_argsort = _time(select_argsort, args.repeats)
+            t_top_k = _time(select_top_k, args.repeats)
+            print(
+                f"{nvalues:>8} {number:>6} {1000 * t_argsort:>12.2f} "
+                f"{1000 * t_top_k:>10.2f} {t_argsort / t_top_k:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
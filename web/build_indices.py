@@ -0,0 +1,166 @@
+"""Build precomputed indices that speed up the API.
+
+Indices are written next to the data they are derived from and are ignored by the API if
+that data changes later on, so rebuilding is always safe. Run from this folder so that
+config.yml is found, e.g.:
+
+    python build_indices.py markers
+    python build_indices.py markers --organisms h_sapiens m_musculus --number 100
+    python build_indices.py features
+    python build_indices.py similar_features --methods correlation cosine
+    python build_indices.py similar_ann
+    python build_indices.py celltype_vectors
+    python build_indices.py homologs --max-distance 60
+    python build_indices.py interactions
+    python build_indices.py presence
+"""
+import argparse
+
+from config import configuration as config
+from models import get_organisms
+from models.marker_index import build_marker_index
+from models.feature_store import build_feature_store
+from models.similar_index import build_similar_index
+from models.similar_ann import build_similar_ann
+from models.celltype_homology import build_celltype_vectors
+from models.exceptions import (
+    OrganismNotFoundError,
+    MeasurementTypeNotFoundError,
+)
+from models.homolog_graph import build_homolog_graph
+from models.interactions import build_interaction_graph
+from models.presence import build_presence_index
+
+
+def _get_all_organisms():
+    organisms = set()
+    for measurement_type in config["feature_types"]:
+        organisms |= set(get_organisms(measurement_type=measurement_type))
+    return sorted(organisms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build precomputed indices for the API.")
+    subparsers = parser.add_subparsers(dest="index", required=True)
+
+    parser_markers = subparsers.add_parser(
+        "markers", help="Top markers for every cell type, versus other cell types and organs.",
+    )
+    parser_markers.add_argument("--organisms", nargs="+", default=None)
+    parser_markers.add_argument("--number", type=int, default=100)
+
+    parser_features = subparsers.add_parser(
+        "features", help="Feature-major store of organism-wide profiles.",
+    )
+    parser_features.add_argument("--organisms", nargs="+", default=None)
+
+    parser_similar = subparsers.add_parser(
+        "similar_features", help="Nearest features of every feature within each organ.",
+    )
+    parser_similar.add_argument("--organisms", nargs="+", default=None)
+    parser_similar.add_argument("--number", type=int, default=100)
+    parser_similar.add_argument(
+        "--methods", nargs="+", default=["correlation"], choices=["correlation", "cosine"],
+    )
+    parser_similar.add_argument("--measurement-types", nargs="+", default=["gene_expression"])
+
+    parser_ann = subparsers.add_parser(
+        "similar_ann", help="Approximate nearest neighbour index of feature profiles.",
+    )
+    parser_ann.add_argument("--organisms", nargs="+", default=None)
+    parser_ann.add_argument(
+        "--methods", nargs="+", default=["correlation", "cosine"], choices=["correlation", "cosine"],
+    )
+    parser_ann.add_argument(
+        "--measurement-types", nargs="+", default=["chromatin_accessibility"],
+    )
+    parser_ann.add_argument("--tables", type=int, default=10)
+    parser_ann.add_argument("--bits", type=int, default=None)
+
+    parser_vectors = subparsers.add_parser(
+        "celltype_vectors",
+        help="Cell types in protein embedding space, for similar cell types across organisms.",
+    )
+    parser_vectors.add_argument("--organisms", nargs="+", default=None)
+
+    parser_homologs = subparsers.add_parser(
+        "homologs", help="Homolog graph between all pairs of organisms with protein embeddings.",
+    )
+    parser_homologs.add_argument("--organisms", nargs="+", default=None)
+    parser_homologs.add_argument("--max-distance", type=float, default=60)
+
+    parser_interactions = subparsers.add_parser(
+        "interactions", help="Binary cache of the cell-cell interaction tables.",
+    )
+    parser_interactions.add_argument("--organisms", nargs="+", default=None)
+
+    parser_presence = subparsers.add_parser(
+        "presence", help="Cell types across organs and organisms, for cross-organism tables.",
+    )
+    parser_presence.add_argument("--measurement-types", nargs="+", default=None)
+
+    args = parser.parse_args()
+
+    # Homologs are a single graph across organisms, derived from the embeddings
+    if args.index == "homologs":
+        print("Building homolog graph")
+        build_homolog_graph(organisms=args.organisms, max_distance=args.max_distance)
+        return
+
+    # Presence is a single index across organisms, derived from all approximations
+    if args.index == "presence":
+        print("Building presence index")
+        build_presence_index(measurement_types=args.measurement_types)
+        return
+
+    organisms = args.organisms
+    if organisms is None:
+        organisms = _get_all_organisms()
+
+    if args.index == "markers":
+        for organism in organisms:
+            print(f"Building marker index: {organism}")
+            build_marker_index(organism, number=args.number)
+    elif args.index == "features":
+        for organism in organisms:
+            print(f"Building feature-major store: {organism}")
+            build_feature_store(organism)
+    elif args.index == "similar_features":
+        for organism in organisms:
+            print(f"Building nearest features: {organism}")
+            build_similar_index(
+                organism,
+                number=args.number,
+                methods=args.methods,
+                measurement_types=args.measurement_types,
+            )
+    elif args.index == "similar_ann":
+        for organism in organisms:
+            print(f"Building approximate nearest neighbours: {organism}")
+            build_similar_ann(
+                organism,
+                methods=args.methods,
+                measurement_types=args.measurement_types,
+                ntables=args.tables,
+                nbits=args.bits,
+            )
+    elif args.index == "celltype_vectors":
+        for organism in organisms:
+            print(f"Building cell type vectors: {organism}")
+            # Not all organisms have gene expression and protein embeddings
+            try:
+                build_celltype_vectors(organism)
+            except (OrganismNotFoundError, MeasurementTypeNotFoundError):
+                print(f"Skipped, no gene expression or protein embeddings: {organism}")
+    elif args.index == "interactions":
+        for organism in organisms:
+            print(f"Building interaction graph: {organism}")
+            # Not all organisms have an interaction table
+            try:
+                build_interaction_graph(organism)
+            except OrganismNotFoundError:
+                print(f"Skipped, no interaction table: {organism}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""In-memory catalog of organs, cell types and cell counts for each atlas.
+
+Organs, cell types and their abundances are tiny compared to the measurements, yet they are
+needed by nearly every request. The catalog reads them once per approximation file into
+read-only structures, so lookups never touch the disk. Each organism is rebuilt only if its
+approximation file changes on disk (see `get_file_fingerprint`).
+"""
+from collections import namedtuple
+from types import MappingProxyType
+
+from models.paths import get_atlas_path
+from models.manifest import get_manifest
+from models.utils import (
+    ApproximationFile,
+    get_file_fingerprint,
+)
+from models.exceptions import (
+    MeasurementTypeNotFoundError,
+    OrganNotFoundError,
+)
+
+
+# Catalog of one measurement type within one organism:
+#   organs: sorted tuple of organs
+#   celltypes: read-only mapping organ -> read-only array of cell types (file order)
+#   cell_counts: read-only mapping organ -> read-only array of cell numbers
+#   celltypes_all: read-only array of cell types across the whole organism
+#   celltype_organs: read-only mapping cell type -> sorted tuple of organs
+MeasurementCatalog = namedtuple(
+    "MeasurementCatalog",
+    ["organs", "celltypes", "cell_counts", "celltypes_all", "celltype_organs"],
+)
+
+# This dict has organisms as keys and (fingerprint, {measurement_type: MeasurementCatalog})
+# tuples as values
+catalogs = {}
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+def _build_organism_catalog(approx_path):
+    """Read organs, cell types and cell counts for all measurement types in a file."""
+    measurements = {}
+    with ApproximationFile(approx_path) as db:
+        # Old file formats etc.
+        if "measurements" not in db:
+            return measurements
+
+        for measurement_type, group in db["measurements"].items():
+            gby = group["grouped_by"]["tissue->celltype"]
+            organs = sorted(gby["values"]["tissue"].asstr()[:])
+            celltypes_all = _read_only(gby["values"]["celltype"].asstr()[:])
+
+            celltypes = {}
+            cell_counts = {}
+            celltype_organs = {}
+            for organ in organs:
+                data = group["data"]["tissue->celltype"][organ]
+                celltypes[organ] = _read_only(data["obs_names"].asstr()[:])
+                cell_counts[organ] = _read_only(data["cell_count"][:])
+                for celltype in celltypes[organ]:
+                    celltype_organs.setdefault(celltype, {})[organ] = None
+
+            measurements[measurement_type] = MeasurementCatalog(
+                organs=tuple(organs),
+                celltypes=MappingProxyType(celltypes),
+                cell_counts=MappingProxyType(cell_counts),
+                celltypes_all=celltypes_all,
+                celltype_organs=MappingProxyType(
+                    {ct: tuple(organs_ct) for ct, organs_ct in celltype_organs.items()}
+                ),
+            )
+    return measurements
+
+
+def load_catalog(organism=None):
+    """Build the catalog for one or all organisms and store it in memory."""
+    if organism is not None:
+        approx_path = get_atlas_path(organism)
+        fingerprint = get_file_fingerprint(approx_path)
+        catalogs[organism] = (fingerprint, _build_organism_catalog(approx_path))
+        return
+
+    for organism in get_manifest():
+        load_catalog(organism)
+
+
+def get_measurement_catalog(organism, measurement_type="gene_expression"):
+    """Get the catalog for one organism and measurement type, rebuilding it if stale."""
+    approx_path = get_atlas_path(organism)
+    fingerprint = get_file_fingerprint(approx_path)
+    if (organism not in catalogs) or (catalogs[organism][0] != fingerprint):
+        catalogs[organism] = (fingerprint, _build_organism_catalog(approx_path))
+
+    measurements = catalogs[organism][1]
+    if measurement_type not in measurements:
+        raise MeasurementTypeNotFoundError(
+            f"Measurement type not found: {measurement_type}",
+            measurement_type=measurement_type,
+        )
+    return measurements[measurement_type]
+
+
+def get_organ_catalog(organism, organ, measurement_type="gene_expression"):
+    """Get cell types and cell counts for one organ."""
+    catalog = get_measurement_catalog(organism, measurement_type=measurement_type)
+    if organ not in catalog.celltypes:
+        raise OrganNotFoundError(
+            f"Organ not found: {organ}",
+            organ=organ,
+        )
+    return {
+        "celltypes": catalog.celltypes[organ],
+        "cell_counts": catalog.cell_counts[organ],
+    }
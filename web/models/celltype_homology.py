@@ -0,0 +1,235 @@
+"""Cell type similarity across organisms, using PROST protein embeddings.
+
+Genes of different species cannot be compared by name, but their PROST embeddings live in a
+shared space. Each (organ, cell type) is summarised as the average embedding of the genes it
+expresses above the organism baseline, weighted by how much above baseline they are. After
+removing the organism-wide mean and normalising, these cell type vectors can be compared
+across species with a cosine distance.
+
+Computing the vectors of an organism means reading the expression of every organ, so they
+are built offline (see build_indices.py) into a file next to the approximation. Vectors are
+loaded the first time an organism is needed and then kept in memory, so adding an organism
+only involves that organism. If the file is missing, or the approximation file or the
+embeddings have changed since, the vectors of that organism are computed on the fly instead.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+from models.paths import (
+    get_atlas_path,
+    get_protein_embeddings_path,
+    get_celltype_vectors_path,
+)
+from models.utils import (
+    ApproximationFile,
+    get_source_fingerprint,
+    read_columns,
+)
+from models.exceptions import (
+    OrganismNotFoundError,
+)
+from models.organisms import get_organisms
+from models.catalog import get_measurement_catalog
+from models.features import get_feature_names
+from models.celltypes import get_organ_celltype_index
+from models.quantisation import get_quantisation
+from models.homology import _get_prost_embeddings
+from models.topk import top_k, top_k_per_group
+
+
+# This dict has organisms as keys and (source fingerprints, cell type vectors) tuples as
+# values, the sources being the approximation file and the embeddings
+celltype_vectors = {}
+
+
+def _build_celltype_vectors(organism):
+    """Summarise every (organ, cell type) of an organism in embedding space."""
+    measurement_type = "gene_expression"
+    catalog = get_measurement_catalog(organism, measurement_type=measurement_type)
+
+    # Align genes with embeddings (the first embedding wins for duplicate names)
+    embeddings = _get_prost_embeddings(organism=organism)
+    idx_embeddings = pd.Series(np.arange(len(embeddings["features"])), index=embeddings["features"])
+    idx_embeddings = idx_embeddings[~idx_embeddings.index.duplicated()]
+    idx_embeddings = idx_embeddings.reindex(get_feature_names(organism, measurement_type)).values
+    columns = np.flatnonzero(~np.isnan(idx_embeddings))
+    embeddings = embeddings["embeddings"][idx_embeddings[columns].astype(np.int64)]
+
+    # Matrix of measurements (rows are all (organ, cell type) pairs). Nearly all genes of every
+    # organ are read once, so keep them out of the cache of hot chunks
+    approx_path = get_atlas_path(organism)
+    with ApproximationFile(approx_path) as db:
+        dequantise = "quantisation" in db["measurements"][measurement_type]
+        group = db["measurements"][measurement_type]["data"]["tissue->celltype"]
+        mat = np.vstack([
+            read_columns(group[organ]["average"], columns, cache=False)
+            for organ in catalog.organs
+        ])
+    if dequantise:
+        mat = get_quantisation(organism, measurement_type)[mat]
+
+    # Weight genes by how much each cell type expresses them above the organism baseline
+    mat = np.log1p(mat.astype(np.float32))
+    weights = np.clip(mat - mat.mean(axis=0), 0, None)
+    weights /= np.maximum(weights.sum(axis=1, keepdims=True), 1e-9)
+    vectors = weights @ embeddings
+
+    # Remove what all cell types of this organism share, then normalise
+    vectors -= vectors.mean(axis=0)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+    return {
+        "organs": np.repeat(
+            catalog.organs,
+            [len(catalog.celltypes[organ]) for organ in catalog.organs],
+        ),
+        "celltypes": np.concatenate([catalog.celltypes[organ] for organ in catalog.organs]),
+        "vectors": vectors,
+    }
+
+
+def _get_source_fingerprints(organism):
+    return (
+        get_source_fingerprint(get_atlas_path(organism)),
+        get_source_fingerprint(get_protein_embeddings_path()),
+    )
+
+
+def _load_celltype_vectors(vectors_path):
+    """Load precomputed cell type vectors, with the fingerprints of their sources."""
+    with ApproximationFile(vectors_path) as h5:
+        sources = (
+            (int(h5.attrs["source_mtime_ns"]), int(h5.attrs["source_size"])),
+            (int(h5.attrs["embeddings_mtime_ns"]), int(h5.attrs["embeddings_size"])),
+        )
+        vectors = {
+            "organs": h5["organs"].asstr()[:],
+            "celltypes": h5["celltypes"].asstr()[:],
+            "vectors": h5["vectors"][:],
+        }
+    return sources, vectors
+
+
+def get_celltype_vectors(organism):
+    """Get the embedding-space vectors of all cell types of an organism, loading them once."""
+    sources = _get_source_fingerprints(organism)
+    if (organism in celltype_vectors) and (celltype_vectors[organism][0] == sources):
+        return celltype_vectors[organism][1]
+
+    vectors = None
+    vectors_path = get_celltype_vectors_path(organism)
+    if vectors_path.exists():
+        sources_file, vectors = _load_celltype_vectors(vectors_path)
+        # The vectors must have been built from the current approximation and embeddings
+        if sources_file != sources:
+            vectors = None
+    if vectors is None:
+        vectors = _build_celltype_vectors(organism)
+
+    celltype_vectors[organism] = (sources, vectors)
+    return vectors
+
+
+def build_celltype_vectors(organism):
+    """Precompute the cell type vectors of an organism and write them next to the approximation."""
+    sources = _get_source_fingerprints(organism)
+    vectors = _build_celltype_vectors(organism)
+
+    vectors_path = get_celltype_vectors_path(organism)
+    vectors_path_tmp = vectors_path.with_name(vectors_path.name + ".tmp")
+    with ApproximationFile(vectors_path_tmp, "w") as h5:
+        h5.attrs["source_mtime_ns"] = sources[0][0]
+        h5.attrs["source_size"] = sources[0][1]
+        h5.attrs["embeddings_mtime_ns"] = sources[1][0]
+        h5.attrs["embeddings_size"] = sources[1][1]
+        h5.create_dataset("organs", data=vectors["organs"].astype("S"))
+        h5.create_dataset("celltypes", data=vectors["celltypes"].astype("S"))
+        h5.create_dataset("vectors", data=vectors["vectors"])
+
+    # Replace atomically, so readers never see a partially written file
+    os.replace(vectors_path_tmp, vectors_path)
+
+
+def get_similar_celltypes_across_organisms(
+    organism,
+    organ,
+    celltype,
+    target_organisms=None,
+    number=10,
+    per_organism=False,
+):
+    """Get (organism, organ, cell type) triples in other species similar to the focal one.
+
+    Args:
+        organism: The organism of the focal cell type.
+        organ: The organ of the focal cell type.
+        celltype: The focal cell type.
+        target_organisms: Organisms to search. None means all other organisms with gene
+            expression and protein embeddings.
+        number: The number of similar cell types to return.
+        per_organism: Whether to return the top cell types of each target organism, rather
+            than across all of them. If this is True, up to #organisms x number entries are
+            returned.
+
+    Returns:
+        dictionary with the following key-value pairs:
+           "organisms": numpy 1D array of organisms of the similar cell types,
+           "organs": numpy 1D array of the corresponding organs,
+           "celltypes": numpy 1D array of similar cell types,
+           "distances": numpy 1D array of cosine distances in embedding space
+    """
+    # Locate the focal cell type
+    celltype_index_dict = get_organ_celltype_index(organism, organ, celltype)
+    vectors_query = get_celltype_vectors(organism)
+    idx = np.flatnonzero(vectors_query["organs"] == organ)[celltype_index_dict["index"]]
+    vector = vectors_query["vectors"][idx]
+
+    if target_organisms is None:
+        target_organisms = []
+        for organism_target in get_organisms(measurement_type="gene_expression"):
+            if organism_target == organism:
+                continue
+            # Not all organisms have protein embeddings
+            try:
+                get_celltype_vectors(organism_target)
+            except OrganismNotFoundError:
+                continue
+            target_organisms.append(organism_target)
+
+    organisms = []
+    organs = []
+    celltypes = []
+    distances = []
+    for organism_target in target_organisms:
+        vectors_target = get_celltype_vectors(organism_target)
+        organisms.append(np.repeat(organism_target, len(vectors_target["celltypes"])))
+        organs.append(vectors_target["organs"])
+        celltypes.append(vectors_target["celltypes"])
+        distances.append(1 - vectors_target["vectors"] @ vector)
+
+    if len(distances) == 0:
+        return {
+            "organisms": np.array([]),
+            "organs": np.array([]),
+            "celltypes": np.array([]),
+            "distances": np.array([]),
+        }
+
+    organisms = np.concatenate(organisms)
+    organs = np.concatenate(organs)
+    celltypes = np.concatenate(celltypes)
+    distances = np.concatenate(distances)
+
+    # Take closest cell types
+    if per_organism:
+        idx_top = top_k_per_group(distances, organisms, number, largest=False)
+    else:
+        idx_top = top_k(distances, number, largest=False)
+
+    return {
+        "organisms": organisms[idx_top],
+        "organs": organs[idx_top],
+        "celltypes": celltypes[idx_top],
+        "distances": distances[idx_top],
+    }
@@ -1,42 +1,172 @@
-"""Module to access, validate, and correct cell types."""
+"""Module to access, validate, and correct cell types.
 
-from levenshtein_finder import LevenshteinFinder
+Cell types are looked up on nearly every request, often in loops over organs. Each list of
+cell types is therefore indexed once: a dict for exact matches, plus an inverted index of
+characters (built the first time a name needs correcting) to find candidates for typos.
+Indices of single organs and of whole organisms are kept in memory and rebuilt together
+with the catalog they come from (see `models.catalog`).
+"""
+from collections import Counter
 
+from config import configuration as config
 from models.exceptions import (
     CellTypeNotFoundError,
 )
+from models.catalog import (
+    get_measurement_catalog,
+    get_organ_catalog,
+)
 
 
-def get_celltype_index(celltype, celltypes, max_distance=3):
-    """Get cell type index and correct cell type name if requested."""
-    celltypes = list(celltypes)
+# This dict has (organism, measurement_type, organ) as keys and (catalog cell types,
+# CelltypeIndex) tuples as values. The index is stale if the catalog is not the same object
+organ_celltype_indices = {}
+
+# This dict has (organism, measurement_type) as keys and (catalog, CelltypeIndex) tuples as
+# values, the index being over all cell types of the organism
+organism_celltype_indices = {}
+
+
+class CelltypeIndex():
+    """Exact and approximate lookup of cell types in a fixed list."""
+
+    def __init__(self, celltypes):
+        self.celltypes = list(celltypes)
+        # Like list.index, duplicates point to the first one
+        self.positions = {}
+        for i, celltype in enumerate(self.celltypes):
+            self.positions.setdefault(celltype, i)
+        self.characters = None
+
+    def _get_close(self, celltype, max_distance):
+        """Get (distance, index) of cell types within max_distance edits, closest first."""
+        if self.characters is None:
+            characters = {}
+            for i, name in enumerate(self.celltypes):
+                for char in set(name):
+                    characters.setdefault(char, []).append(i)
+            self.characters = characters
+
+        # Candidates share at least one character, characters of no cell type match nothing
+        chars = set(celltype)
+        nshared = Counter()
+        for char in chars:
+            nshared.update(self.characters.get(char, []))
+
+        close = []
+        for i, count in nshared.items():
+            name = self.celltypes[i]
+            # Each edit changes the length by one at most, and drops one query character at most
+            if abs(len(name) - len(celltype)) > max_distance:
+                continue
+            if len(chars) - count > max_distance:
+                continue
+            distance = _levenshtein(celltype, name)
+            if distance <= max_distance:
+                close.append((distance, i))
+        close.sort()
+        return close
+
+    def search(self, celltype, max_distance=3):
+        """Get cell type index and correct cell type name if requested."""
+        if celltype in self.positions:
+            result = {
+                "index": self.positions[celltype],
+                "celltype": celltype,
+            }
+            return result
+
+        if max_distance < 1:
+            raise CellTypeNotFoundError(
+                f"No cell type called {celltype} found.",
+                cell_type=celltype,
+            )
+
+        # Autocorrection
+        # NOTE: this list is longer then one only for ties, in which case the first should be fine
+        celltypes_close = self._get_close(celltype, max_distance)
+        if len(celltypes_close) == 0:
+            raise CellTypeNotFoundError(
+                f"No cell type called {celltype} found.",
+                cell_type=celltype,
+            )
 
-    if celltype in celltypes:
+        idx = celltypes_close[0][1]
         result = {
-            "index": celltypes.index(celltype),
-            "celltype": celltype,
+            "index": idx,
+            "celltype": self.celltypes[idx],
         }
         return result
 
-    if max_distance < 1:
-        raise CellTypeNotFoundError(
-            f"No cell type called {celltype} found.",
-            cell_type=celltype,
-        )
-
-    # Autocorrection
-    finder = LevenshteinFinder()
-    finder.indexing(celltypes)
-    # NOTE: this list is longer then one only for ties, in which case the first should be fine
-    celltypes_close = finder.search(celltype, max_distance=max_distance)
-    if len(celltypes_close) == 0:
-        raise CellTypeNotFoundError(
-            f"No cell type called {celltype} found.",
-            cell_type=celltype,
-        )
-
-    result = {
-        "index": celltypes_close[0]["idx"],
-        "celltype": celltypes_close[0]["data"],
-    }
-    return result
+
+def _levenshtein(string1, string2):
+    """Get the edit distance between two strings."""
+    if len(string1) < len(string2):
+        string1, string2 = string2, string1
+    previous = list(range(len(string2) + 1))
+    for i, char1 in enumerate(string1):
+        current = [i + 1]
+        for j, char2 in enumerate(string2):
+            current.append(min(
+                previous[j + 1] + 1,
+                current[j] + 1,
+                previous[j] + (char1 != char2),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def _get_celltype_aliases():
+    """Get a dict from each cell type to the others that can replace it, in config order."""
+    aliases = {}
+    for group in config["celltype_aliases"]:
+        for celltype in group:
+            aliases[celltype] = [alias for alias in group if alias != celltype]
+    return aliases
+
+
+def get_celltype_index(celltype, celltypes, max_distance=3):
+    """Get cell type index and correct cell type name if requested."""
+    return CelltypeIndex(celltypes).search(celltype, max_distance=max_distance)
+
+
+def get_organ_celltype_index(
+    organism,
+    organ,
+    celltype,
+    measurement_type="gene_expression",
+    max_distance=3,
+):
+    """Get cell type index within an organ, using a prebuilt index of that organ."""
+    celltypes = get_organ_catalog(organism, organ, measurement_type=measurement_type)["celltypes"]
+    key = (organism, measurement_type, organ)
+    if (key not in organ_celltype_indices) or (organ_celltype_indices[key][0] is not celltypes):
+        organ_celltype_indices[key] = (celltypes, CelltypeIndex(celltypes))
+    return organ_celltype_indices[key][1].search(celltype, max_distance=max_distance)
+
+
+def resolve_celltype(
+    organism,
+    celltype,
+    measurement_type="gene_expression",
+    max_distance=0,
+):
+    """Get the name of a cell type in an organism, across all organs.
+
+    Cell types that are not found are replaced by their aliases (see celltype_aliases in the
+    config, e.g. macrophages are called hemocytes in some organisms) and, if max_distance is
+    at least one, autocorrected.
+    """
+    catalog = get_measurement_catalog(organism, measurement_type=measurement_type)
+    key = (organism, measurement_type)
+    if (key not in organism_celltype_indices) or (organism_celltype_indices[key][0] is not catalog):
+        index = CelltypeIndex(catalog.celltype_organs.keys())
+        organism_celltype_indices[key] = (catalog, index)
+    index = organism_celltype_indices[key][1]
+
+    if celltype in index.positions:
+        return celltype
+    for alias in _get_celltype_aliases().get(celltype, []):
+        if alias in index.positions:
+            return alias
+    return index.search(celltype, max_distance=max_distance)["celltype"]
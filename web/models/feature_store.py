@@ -0,0 +1,212 @@
+"""Feature-major companion store for organism-wide profiles of single features.
+
+The approximation files are organised by organ, with cell types as rows and features as
+columns, which suits queries within an organ. Questions like "where is this gene highest?"
+need one feature across all (organ, cell type) pairs instead, which means touching every
+organ. The companion store is the transpose: for each measurement type, one row per feature
+with all (organ, cell type) columns laid out contiguously, so a feature's whole-organism
+profile is a single read.
+
+The store is built offline (see build_indices.py) and written next to the approximation
+file. If it is missing or out of date, profiles are gathered from the approximation file
+instead, organ by organ but through a single handle.
+"""
+import os
+import numpy as np
+import hdf5plugin
+
+from models.paths import (
+    get_atlas_path,
+    get_feature_store_path,
+)
+from models.utils import (
+    ApproximationFile,
+    get_file_fingerprint,
+    get_source_fingerprint,
+    read_columns,
+)
+from models.exceptions import (
+    TooManyFeaturesError,
+)
+from models.catalog import get_measurement_catalog
+from models.quantisation import get_quantisation
+from models.measurement import _get_feature_order
+
+
+# This dict has organisms as keys and (store file fingerprint, {measurement_type: labels})
+# tuples as values, where labels are the source fingerprint, organs, and cell types of the
+# store columns
+feature_stores = {}
+
+
+def _get_measurement_subtypes(measurement_type):
+    # For ATAC-Seq, fraction detected is the same as average
+    if measurement_type in ("chromatin_accessibility",):
+        return ("average",)
+    return ("average", "fraction")
+
+
+def _load_feature_store_labels(store_path):
+    """Load the column labels of a feature store (the data stay on disk)."""
+    labels = {}
+    with ApproximationFile(store_path) as h5:
+        source = (int(h5.attrs["source_mtime_ns"]), int(h5.attrs["source_size"]))
+        for measurement_type, group in h5.items():
+            labels[measurement_type] = {
+                "source": source,
+                "quantised": bool(group.attrs["quantised"]),
+                "organs": group["organs"].asstr()[:],
+                "celltypes": group["celltypes"].asstr()[:],
+            }
+    return labels
+
+
+def get_feature_store_labels(organism, measurement_type):
+    """Get the column labels of the feature store, or None if missing or out of date."""
+    store_path = get_feature_store_path(organism)
+    if not store_path.exists():
+        return None
+
+    fingerprint = get_file_fingerprint(store_path)
+    if (organism not in feature_stores) or (feature_stores[organism][0] != fingerprint):
+        feature_stores[organism] = (fingerprint, _load_feature_store_labels(store_path))
+    labels = feature_stores[organism][1].get(measurement_type)
+
+    # The store must have been built from the current approximation
+    if (labels is None) or (labels["source"] != get_source_fingerprint(get_atlas_path(organism))):
+        return None
+
+    return labels
+
+
+def _read_profiles_from_store(organism, idx_sorted, measurement_type, labels):
+    """Read feature rows from the feature-major store."""
+    result = {
+        "organs": labels["organs"],
+        "celltypes": labels["celltypes"],
+        "quantised": labels["quantised"],
+    }
+    with ApproximationFile(get_feature_store_path(organism)) as h5:
+        group = h5[measurement_type]
+        for measurement_subtype in _get_measurement_subtypes(measurement_type):
+            result[measurement_subtype] = group[measurement_subtype][idx_sorted]
+    return result
+
+
+def _read_profiles_from_atlas(organism, idx_sorted, measurement_type):
+    """Gather feature columns from every organ of the approximation file."""
+    catalog = get_measurement_catalog(organism, measurement_type=measurement_type)
+    result = {
+        "organs": np.repeat(
+            catalog.organs,
+            [len(catalog.celltypes[organ]) for organ in catalog.organs],
+        ),
+        "celltypes": np.concatenate([catalog.celltypes[organ] for organ in catalog.organs]),
+    }
+
+    approx_path = get_atlas_path(organism)
+    with ApproximationFile(approx_path) as db:
+        result["quantised"] = "quantisation" in db["measurements"][measurement_type]
+        group = db["measurements"][measurement_type]["data"]["tissue->celltype"]
+        for measurement_subtype in _get_measurement_subtypes(measurement_type):
+            result[measurement_subtype] = np.hstack([
+                read_columns(group[organ][measurement_subtype], idx_sorted).T
+                for organ in catalog.organs
+            ])
+    return result
+
+
+def get_feature_profiles(
+    organism,
+    features,
+    measurement_type="gene_expression",
+    nmax=500,
+):
+    """Get organism-wide profiles of some features across all (organ, cell type) pairs.
+
+    Returns:
+        dictionary with the following key-value pairs:
+           "organs": numpy 1D array with the organ of each column,
+           "celltypes": numpy 1D array with the cell type of each column,
+           "average": numpy 2D array where each row is a **feature**,
+           "fraction": numpy 2D array where each row is a **feature**
+    """
+    if len(features) > nmax:
+        nfeas = len(features)
+        raise TooManyFeaturesError(f"Number of requested features exceeds {nmax}: {nfeas}")
+
+    # Check that the measurement type exists
+    get_measurement_catalog(organism, measurement_type=measurement_type)
+
+    idx_sorted, idx_sort_back = _get_feature_order(organism, features, measurement_type)
+
+    labels = get_feature_store_labels(organism, measurement_type)
+    if labels is not None:
+        result = _read_profiles_from_store(organism, idx_sorted, measurement_type, labels)
+    else:
+        result = _read_profiles_from_atlas(organism, idx_sorted, measurement_type)
+
+    # Restore the original order and, if the data is quantised, undo the quantisation
+    quantised = result.pop("quantised")
+    for measurement_subtype in _get_measurement_subtypes(measurement_type):
+        data = result[measurement_subtype][idx_sort_back]
+        if quantised:
+            data = get_quantisation(organism, measurement_type)[data]
+        result[measurement_subtype] = data
+
+    if "fraction" not in result:
+        result["fraction"] = result["average"]
+
+    return result
+
+
+def build_feature_store(organism, block_size=65536):
+    """Write the feature-major store of an organism next to its approximation file.
+
+    Args:
+        block_size: Number of features transposed at a time, to bound memory usage.
+    """
+    approx_path = get_atlas_path(organism)
+    source_fingerprint = get_source_fingerprint(approx_path)
+
+    store_path = get_feature_store_path(organism)
+    store_path_tmp = store_path.with_name(store_path.name + ".tmp")
+    with ApproximationFile(approx_path) as db, ApproximationFile(store_path_tmp, "w") as h5:
+        h5.attrs["source_mtime_ns"] = source_fingerprint[0]
+        h5.attrs["source_size"] = source_fingerprint[1]
+
+        for measurement_type, db_mt in db["measurements"].items():
+            catalog = get_measurement_catalog(organism, measurement_type=measurement_type)
+            organs = catalog.organs
+            celltypes = np.concatenate([catalog.celltypes[organ] for organ in organs])
+            ncolumns = len(celltypes)
+
+            group = h5.create_group(measurement_type)
+            group.attrs["quantised"] = "quantisation" in db_mt
+            group.create_dataset(
+                "organs",
+                data=np.repeat(organs, [len(catalog.celltypes[organ]) for organ in organs]).astype("S"),
+            )
+            group.create_dataset("celltypes", data=celltypes.astype("S"))
+
+            db_organs = db_mt["data"]["tissue->celltype"]
+            for measurement_subtype in _get_measurement_subtypes(measurement_type):
+                dtype = db_organs[organs[0]][measurement_subtype].dtype
+                nfeatures = db_organs[organs[0]][measurement_subtype].shape[1]
+                # A chunk is a few whole rows, so a feature profile is one small read
+                dataset = group.create_dataset(
+                    measurement_subtype,
+                    shape=(nfeatures, ncolumns),
+                    dtype=dtype,
+                    chunks=(min(16, nfeatures), ncolumns),
+                    **hdf5plugin.Zstd(clevel=22),
+                )
+                for start in range(0, nfeatures, block_size):
+                    stop = min(start + block_size, nfeatures)
+                    dataset[start:stop] = np.vstack([
+                        db_organs[organ][measurement_subtype][:, start:stop]
+                        for organ in organs
+                    ]).T
+
+    # Replace atomically, so readers never see a partially written store
+    os.replace(store_path_tmp, store_path)
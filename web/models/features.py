@@ -23,6 +23,12 @@ from models.exceptions import (
 # are increasing integers to be used as an index in the h5 file
 feature_series = {}
 
+# This dict has (organism, measurement_type) as keys and pandas series as
+# values. Each series is a de-duplicated hash index: the *index* is the unique
+# lowercase feature names, the values are the integer index of their first
+# occurrence in the h5 file. It is used to resolve many features at once.
+feature_lookup = {}
+
 
 def load_features(organism, measurement_type="gene_expression"):
     """Preload list of features for an organism"""
@@ -35,12 +41,25 @@ def load_features(organism, measurement_type="gene_expression"):
             )
         features = db['measurements'][measurement_type]["var_names"].asstr()[:]
     features_lower = pd.Index(features).str.lower()
+
+    # FIXME: same gene with just difference in capitalisation (fly)
+    # we want to fix the upstream data before we come up with clever
+    # tricks here, for now take the first (this fully masks the second gene)
+    is_first = ~features_lower.duplicated(keep="first")
+    lookup = pd.Series(
+        np.arange(len(features))[is_first],
+        index=features_lower[is_first],
+    )
+    # Build the hash table now rather than on the first request
+    lookup.index.get_indexer(lookup.index[:1])
+
     features_lower = pd.Series(
         np.arange(len(features)),
         index=features_lower,
     ).to_frame(name="index")
     features_lower["name"] = features
     feature_series[(organism, measurement_type)] = features_lower
+    feature_lookup[(organism, measurement_type)] = lookup
 
 
 def get_features(organism, measurement_type="gene_expression"):
@@ -52,31 +71,64 @@ def get_features(organism, measurement_type="gene_expression"):
     return features
 
 
-def get_feature_index(
+def resolve_features(
     organism,
-    feature_name,
+    feature_names,
     measurement_type="gene_expression",
 ):
-    """Get the numeric index for a single feature in the h5 file"""
+    """Resolve many feature names in one vectorised pass.
+
+    Feature names are matched case-insensitively.
+
+    Returns:
+        dictionary with the following key-value pairs:
+           "index": numpy 1D array with the index of each feature in the h5 file (-1 if missing),
+           "name": numpy 1D array with the correctly capitalised names (unchanged if missing),
+           "missing": numpy 1D boolean array, True for features that were not found
+    """
     if (organism, measurement_type) not in feature_series:
         load_features(organism, measurement_type)
 
-    try:
-        idx = feature_series[(organism, measurement_type)].at[feature_name, "index"]
-    except KeyError as exc:
+    lookup = feature_lookup[(organism, measurement_type)]
+    feature_names = np.asarray(feature_names, dtype=object)
+    positions = lookup.index.get_indexer(pd.Index(feature_names, dtype=object).str.lower())
+    missing = positions == -1
+
+    index = lookup.values[positions]
+    index[missing] = -1
+
+    names = np.asarray(
+        feature_series[(organism, measurement_type)]["name"].values,
+        dtype=object,
+    )[index]
+    names[missing] = feature_names[missing]
+
+    return {
+        "index": index,
+        "name": names,
+        "missing": missing,
+    }
+
+
+def get_feature_index(
+    organism,
+    feature_name,
+    measurement_type="gene_expression",
+):
+    """Get the numeric index for a single feature in the h5 file"""
+    resolved = resolve_features(
+        organism,
+        [feature_name],
+        measurement_type=measurement_type,
+    )
+    if resolved["missing"][0]:
         print(f'{feature_name} not found')
         raise FeatureNotFoundError(
             f"Feature not found: {feature_name}",
             feature=feature_name,
-        ) from exc
-
-    # FIXME: same gene with just difference in capitalisation (fly)
-    # we want to fix the upstream data before we come up with clever
-    # tricks here, for now take the first (this fully masks the second gene)
-    if isinstance(idx, pd.Series):
-        idx = idx.values[0]
+        )
 
-    return idx
+    return resolved["index"][0]
 
 
 def get_feature_indices(
@@ -85,25 +137,18 @@ def get_feature_indices(
     measurement_type="gene_expression",
 ):
     """Get the numeric index for multiple features."""
-    result = []
-    missing = []
-    for feature_name in feature_names:
-        try:
-            idx = get_feature_index(
-                organism,
-                feature_name,
-                measurement_type=measurement_type,
-            )
-            result.append(idx)
-        except FeatureNotFoundError:
-            missing.append(feature_name)
-
-    if len(missing):
+    resolved = resolve_features(
+        organism,
+        feature_names,
+        measurement_type=measurement_type,
+    )
+    if resolved["missing"].any():
+        missing = list(np.asarray(feature_names, dtype=object)[resolved["missing"]])
         raise SomeFeaturesNotFoundError(
             "Some features not found: " + ", ".join(missing) + ".",
             features=missing,
         )
-    return result
+    return resolved["index"]
 
 
 def get_feature_names(
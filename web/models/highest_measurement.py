@@ -13,10 +13,8 @@ from models.exceptions import (
     NeighborhoodNotFoundError,
 )
 from models.features import filter_existing_features
-from models.measurement import (
-    get_averages,
-    get_fraction_detected,
-)
+from models.topk import top_k, top_k_per_group
+from models.feature_store import get_feature_profiles
 
 
 def get_highest_measurement(
@@ -42,77 +40,40 @@ def get_highest_measurement(
            "organs": list of the corresponding organs,
            "average": numpy 1D array with the average expression
     """
-    from models import get_organs, get_celltypes
-
-    organs = get_organs(
-        organism,
-        measurement_type=measurement_type,
-    )
-    result = {
-        "celltypes": [],
-        "organs": [],
-        "average": [],
-        "fraction_detected": [],
-    }
-    found_once = False
-    for organ in organs:
-        celltypes = get_celltypes(
+    # The whole-organism profile of the feature is a single read
+    try:
+        profiles = get_feature_profiles(
             organism,
-            organ,
+            [feature],
             measurement_type=measurement_type,
         )
-        try:
-            avg_organ = get_averages(
-                organism,
-                [feature],
-                organ=organ,
-                measurement_type=measurement_type,
-            )[0]
-            found_once = True
-            frac_organ = get_fraction_detected(
-                organism,
-                [feature],
-                organ=organ,
-                measurement_type=measurement_type,
-            )[0]
-        except SomeFeaturesNotFoundError:
-            # NOTE: you cannot be the highest expressor if you are zero
-            continue
-
-        if per_organ:
-            # Find top expressors, per organ
-            idx_top_organ = avg_organ.argsort()[::-1][:number]
-            result["celltypes"].extend([celltypes[i] for i in idx_top_organ])
-            result["organs"].extend([organ for i in idx_top_organ])
-            result["average"].append(avg_organ[idx_top_organ])
-            result["fraction_detected"].append(frac_organ[idx_top_organ])
-
-        else:
-            result["celltypes"].extend(celltypes)
-            result["organs"].extend([organ for ct in celltypes])
-            result["average"].append(avg_organ)
-            result["fraction_detected"].append(frac_organ)
-
-    if not found_once:
+    except SomeFeaturesNotFoundError:
         raise FeatureNotFoundError(
             f"Feature not found: {feature}.",
             feature=feature,
         )
 
-    result["average"] = np.concatenate(result["average"])
-    result["fraction_detected"] = np.concatenate(result["fraction_detected"])
+    result = {
+        "celltypes": list(profiles["celltypes"]),
+        "organs": list(profiles["organs"]),
+        "average": profiles["average"][0],
+        "fraction_detected": profiles["fraction"][0],
+    }
 
-    if not per_organ:
+    if per_organ:
+        # Find top expressors, per organ
+        idx_top = top_k_per_group(result["average"], result["organs"], number)
+    else:
         # Find top expressors
-        idx_top = result["average"].argsort()[::-1][:number]
+        idx_top = top_k(result["average"], number)
 
         # Exclude zero expressors
-        idx_top = [i for i in idx_top if result["average"][i] > 0]
+        idx_top = idx_top[result["average"][idx_top] > 0]
 
-        result["celltypes"] = [result["celltypes"][i] for i in idx_top]
-        result["organs"] = [result["organs"][i] for i in idx_top]
-        result["average"] = result["average"][idx_top]
-        result["fraction_detected"] = result["fraction_detected"][idx_top]
+    result["celltypes"] = [result["celltypes"][i] for i in idx_top]
+    result["organs"] = [result["organs"][i] for i in idx_top]
+    result["average"] = result["average"][idx_top]
+    result["fraction_detected"] = result["fraction_detected"][idx_top]
 
     return result
 
@@ -143,8 +104,6 @@ def get_highest_measurement_multiple(
            "average": numpy 2D array with the average expression
            "score": numpy 1D array of scores (highest means higher expression)
     """
-    from models import get_organs, get_celltypes
-
     # NOTE: I tried a few versions of this, geometric average expression seems to work
     # pretty well actually... compared to a few fancier things at least
     def _score_measurements(matrix, signs):
@@ -155,17 +114,7 @@ def get_highest_measurement_multiple(
         #mat = np.exp(mat - 1)
         return signs @ mat / len(signs)
 
-    organs = get_organs(
-        organism,
-        measurement_type=measurement_type,
-    )
-    result = {
-        "celltypes": [],
-        "organs": [],
-        "average": [],
-        "fraction_detected": [],
-        "scores": [],
-    }
+    result = {}
 
     features_found = filter_existing_features(organism, features, measurement_type=measurement_type)
     if len(features_found) == 0:    
@@ -188,58 +137,32 @@ def get_highest_measurement_multiple(
     signs = -np.ones(len(features_both))
     signs[:len(features)] = 1
 
-    for organ in organs:
-        celltypes = get_celltypes(
-            organism,
-            organ,
-            measurement_type=measurement_type,
-        )
+    # The whole-organism profiles of all features are a single read
+    profiles = get_feature_profiles(
+        organism,
+        features_both,
+        measurement_type=measurement_type,
+    )
+    result["celltypes"] = list(profiles["celltypes"])
+    result["organs"] = list(profiles["organs"])
+    result["average"] = profiles["average"]
+    result["fraction_detected"] = profiles["fraction"]
+    result["score"] = _score_measurements(result["average"], signs)
 
-        avg_organ = get_averages(
-            organism,
-            features_both,
-            organ=organ,
-            measurement_type=measurement_type,
-        ).T
-        frac_organ = get_fraction_detected(
-            organism,
-            features_both,
-            organ=organ,
-            measurement_type=measurement_type,
-        ).T
-
-        if per_organ:
-            # Find top expressors, per organ
-            score = _score_measurements(avg_organ.T, signs)
-            result["score"].append(score)
-            idx_top_organ = score.argsort()[::-1][:number]
-            result["celltypes"].extend([celltypes[i] for i in idx_top_organ])
-            result["organs"].extend([organ for i in idx_top_organ])
-            result["average"].append(avg_organ[idx_top_organ])
-            result["fraction_detected"].append(frac_organ[idx_top_organ])
-
-        else:
-            result["celltypes"].extend(celltypes)
-            result["organs"].extend([organ for ct in celltypes])
-            result["average"].append(avg_organ)
-            result["fraction_detected"].append(frac_organ)
-
-    result["average"] = np.vstack(result["average"]).T
-    result["fraction_detected"] = np.vstack(result["fraction_detected"]).T
     if per_organ:
-        result["score"] = np.concatenate(result["score"])
+        # Find top expressors, per organ
+        idx_top = top_k_per_group(result["score"], result["organs"], number)
     else:
         # Find top expressors
-        result["score"] = _score_measurements(result["average"], signs)
-        idx_top = result["score"].argsort()[::-1][:number]
+        idx_top = top_k(result["score"], number)
 
         # Exclude zero expressors
-        idx_top = [i for i in idx_top if result["score"][i] > 0]
+        idx_top = idx_top[result["score"][idx_top] > 0]
 
-        result["celltypes"] = [result["celltypes"][i] for i in idx_top]
-        result["organs"] = [result["organs"][i] for i in idx_top]
-        result["average"] = result["average"][:, idx_top]
-        result["fraction_detected"] = result["fraction_detected"][:, idx_top]
-        result["score"] = result["score"][idx_top]
+    result["celltypes"] = [result["celltypes"][i] for i in idx_top]
+    result["organs"] = [result["organs"][i] for i in idx_top]
+    result["average"] = result["average"][:, idx_top]
+    result["fraction_detected"] = result["fraction_detected"][:, idx_top]
+    result["score"] = result["score"][idx_top]
 
     return result
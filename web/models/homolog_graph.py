@@ -0,0 +1,186 @@
+"""Precomputed homolog graph between the features of every pair of organisms.
+
+Homologs are found by comparing PROST embeddings of the query features with every feature
+of the target organism, and the same distances are recomputed every time someone asks for,
+say, human to mouse homologs of common genes. The graph stores, for every ordered pair of
+organisms, all (query, target) pairs closer than a radius (the default max_distance), as a
+sparse matrix in CSR form: the edges of a query feature are one slice. It is built offline
+(see build_indices.py) into a single file next to the embeddings, and ignored if the
+embeddings change later on.
+
+Distances are stored in int8 embedding units (256 times the PROST distance), like the live
+computation, so both give identical results.
+"""
+import os
+import numpy as np
+import hdf5plugin
+
+from models.paths import (
+    get_homolog_graph_path,
+    get_protein_embeddings_path,
+)
+from models.utils import (
+    ApproximationFile,
+    get_file_fingerprint,
+    get_source_fingerprint,
+    gather_csr_rows,
+)
+
+
+# This dict has (query organism, target organism) pairs as keys and (graph file fingerprint,
+# graph) tuples as values, where the graph is None if the pair is not in the file
+homolog_graphs = {}
+
+
+def _load_homolog_graph(graph_path, query_organism, target_organism):
+    with ApproximationFile(graph_path) as h5:
+        key = f"{query_organism}/{target_organism}"
+        if key not in h5:
+            return None
+        group = h5[key]
+        graph = {
+            "radius": float(h5.attrs["max_distance"]),
+            "source": (int(h5.attrs["source_mtime_ns"]), int(h5.attrs["source_size"])),
+            "indptr": group["indptr"][:],
+            "indices": group["indices"][:],
+            "distances": group["distances"][:],
+            "ntargets": int(group.attrs["ntargets"]),
+        }
+
+    # Edges are sorted by query and then target, so their linear keys (to look up pairs)
+    # are sorted too
+    nedges = np.diff(graph["indptr"])
+    rows = np.repeat(np.arange(len(nedges), dtype=np.int64), nedges)
+    graph["keys"] = rows * graph["ntargets"] + graph["indices"]
+    return graph
+
+
+def get_homolog_graph(query_organism, target_organism):
+    """Get the homolog graph between two organisms, or None if missing or out of date."""
+    graph_path = get_homolog_graph_path()
+    if not graph_path.exists():
+        return None
+
+    fingerprint = get_file_fingerprint(graph_path)
+    key = (query_organism, target_organism)
+    if (key not in homolog_graphs) or (homolog_graphs[key][0] != fingerprint):
+        graph = _load_homolog_graph(graph_path, query_organism, target_organism)
+        homolog_graphs[key] = (fingerprint, graph)
+    graph = homolog_graphs[key][1]
+
+    # The graph must have been built from the current embeddings
+    if (graph is None) or (graph["source"] != get_source_fingerprint(get_protein_embeddings_path())):
+        return None
+
+    return graph
+
+
+def lookup_homolog_edges(query_organism, target_organism, rows, max_distance):
+    """Look up all targets closer than max_distance to some query features.
+
+    Args:
+        rows: numpy 1D array of query feature rows in the embedding file.
+
+    Returns:
+        triple of numpy 1D arrays, with the position of the query in rows, the target rows,
+        and their distances in int8 units, sorted by query and then target. None if the
+        graph is missing, out of date, or does not reach max_distance, in which case the
+        caller should compute the distances.
+    """
+    graph = get_homolog_graph(query_organism, target_organism)
+    if (graph is None) or (max_distance > graph["radius"]):
+        return None
+
+    idx_query, edges = gather_csr_rows(graph["indptr"], rows)
+    targets = graph["indices"][edges]
+    distances = graph["distances"][edges]
+
+    within = distances < max_distance * 256
+    return idx_query[within], targets[within], distances[within]
+
+
+def lookup_homology_distances(query_organism, target_organism, rows_queries, rows_targets):
+    """Look up the distances of paired query and target features.
+
+    Returns:
+        numpy 1D array of distances in int8 units, with -1 for pairs farther apart than the
+        graph radius, or None if the graph is missing or out of date.
+    """
+    graph = get_homolog_graph(query_organism, target_organism)
+    if graph is None:
+        return None
+
+    distances = np.full(len(rows_queries), -1, np.int32)
+    if len(graph["keys"]) == 0:
+        return distances
+
+    keys = rows_queries.astype(np.int64) * graph["ntargets"] + rows_targets
+    pos = np.minimum(np.searchsorted(graph["keys"], keys), len(graph["keys"]) - 1)
+    found = graph["keys"][pos] == keys
+    distances[found] = graph["distances"][pos[found]]
+    return distances
+
+
+def build_homolog_graph(organisms=None, max_distance=60, block_size=1024):
+    """Precompute homologs between all ordered pairs of organisms.
+
+    Args:
+        organisms: Organisms to include. None means all organisms with protein embeddings.
+        max_distance: Radius of the graph, in PROST units. Queries with a larger max_distance
+            are computed on the fly.
+        block_size: Number of query features compared at a time, to bound memory usage.
+    """
+    # Imported here to avoid a circular import, since homology uses the graph
+    from models.homology import (
+        get_embedding_store,
+        _get_l1_edges,
+    )
+
+    embeddings_path = get_protein_embeddings_path()
+    source_fingerprint = get_source_fingerprint(embeddings_path)
+    if organisms is None:
+        with ApproximationFile(embeddings_path) as h5:
+            organisms = list(h5.keys())
+
+    graph_path = get_homolog_graph_path()
+    graph_path_tmp = graph_path.with_name(graph_path.name + ".tmp")
+    with ApproximationFile(graph_path_tmp, "w") as h5:
+        h5.attrs["max_distance"] = max_distance
+        h5.attrs["source_mtime_ns"] = source_fingerprint[0]
+        h5.attrs["source_size"] = source_fingerprint[1]
+
+        for query_organism in organisms:
+            embeddings_queries = get_embedding_store(query_organism)["embeddings"]
+            nqueries = len(embeddings_queries)
+            for target_organism in organisms:
+                if target_organism == query_organism:
+                    continue
+                embeddings_targets = get_embedding_store(target_organism)["embeddings"]
+
+                indptr = np.zeros(nqueries + 1, np.int64)
+                indices = []
+                distances = []
+                for start in range(0, nqueries, block_size):
+                    stop = min(start + block_size, nqueries)
+                    # Sorted by query and then target
+                    idx_query, idx_target, dis = _get_l1_edges(
+                        embeddings_queries[start:stop], embeddings_targets, max_distance,
+                    )
+                    indptr[start + 1:stop + 1] = np.bincount(idx_query, minlength=stop - start)
+                    indices.append(idx_target.astype(np.int32))
+                    distances.append(dis.astype(np.uint16))
+                data = {
+                    "indptr": np.cumsum(indptr),
+                    "indices": np.concatenate(indices),
+                    "distances": np.concatenate(distances),
+                }
+
+                group = h5.create_group(f"{query_organism}/{target_organism}")
+                group.attrs["ntargets"] = len(embeddings_targets)
+                for name, values in data.items():
+                    # Empty datasets cannot be chunked, hence not compressed either
+                    compression = hdf5plugin.Zstd() if len(values) else {}
+                    group.create_dataset(name, data=values, **compression)
+
+    # Replace atomically, so readers never see a partially written graph
+    os.replace(graph_path_tmp, graph_path)
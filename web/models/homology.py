@@ -1,50 +1,134 @@
 import numpy as np
 import pandas as pd
-import h5py
-import hdf5plugin
 
 from models.paths import get_protein_embeddings_path
+from models.utils import (
+    ApproximationFile,
+    get_file_fingerprint,
+)
 from models.exceptions import OrganismNotFoundError, FeaturesNotPairedError
+from models.homolog_graph import (
+    lookup_homolog_edges,
+    lookup_homology_distances,
+)
 
 
-def _get_prost_embeddings(organism=None, features=None):
-    """Get embeddings for everything or specific organisms/features."""
+# This dict has organisms as keys and (embeddings file fingerprint, store) tuples as values,
+# where the store holds the feature names and the int8 embedding matrix as on disk
+embedding_stores = {}
+
+
+def get_embedding_store(organism):
+    """Get feature names and int8 PROST embeddings of an organism, keeping them in memory.
+
+    NOTE: PROST embeddings are stored as int8, i.e. 256 times the actual values. Keeping them
+    that way uses a quarter of the memory of float32 and makes L1 distances integer sums.
+    """
     fn_embeddings = get_protein_embeddings_path()
-    with h5py.File(fn_embeddings) as h5:
-        if organism is None:
-            raise NotImplementedError("Merging of all embeddings not implemented yet.")
-
-        if organism not in h5:
-            raise OrganismNotFoundError(
-                f"Organism not found: {organism}",
-                organism=organism,
-            )
-
-        group = h5[organism]
-        index = group["features"].asstr()[:]
-        if features is None:
-            embeddings = group["embeddings"][:, :]
-            return {
-                "features": index,
-                "embeddings": embeddings.astype("f4") / 256.0,
+    fingerprint = get_file_fingerprint(fn_embeddings)
+    if (organism not in embedding_stores) or (embedding_stores[organism][0] != fingerprint):
+        with ApproximationFile(fn_embeddings) as h5:
+            if organism not in h5:
+                raise OrganismNotFoundError(
+                    f"Organism not found: {organism}",
+                    organism=organism,
+                )
+            group = h5[organism]
+            store = {
+                "features": group["features"].asstr()[:],
+                "embeddings": group["embeddings"][:, :],
             }
+        store["embeddings"].flags.writeable = False
 
-        # Increasing, numerical indices for the selected features
-        idx_features = pd.Series(index, index=np.arange(len(index)))
-        idx_features = idx_features[idx_features.isin(features)].index
-        if len(idx_features) == 0:
-            return {
-                "features": [],
-                "embeddings": [],
-            }
+        # Hash index from feature names to rows (the first one for duplicate names)
+        index = pd.Series(np.arange(len(store["features"])), index=store["features"])
+        store["index"] = index[~index.index.duplicated()]
+        embedding_stores[organism] = (fingerprint, store)
+    return embedding_stores[organism][1]
+
+
+def _get_feature_rows(store, features):
+    """Get the rows of features in the embedding store, -1 for missing ones.
+
+    NOTE: if a feature name appears more than once in the embeddings, the first row is used.
+    """
+    return store["index"].reindex(features).fillna(-1).values.astype(np.int64)
+
+
+def _get_prost_embeddings(organism=None, features=None):
+    """Get embeddings for everything or specific organisms/features."""
+    if organism is None:
+        raise NotImplementedError("Merging of all embeddings not implemented yet.")
+
+    store = get_embedding_store(organism)
+    index = store["features"]
+    if features is None:
+        return {
+            "features": index,
+            "embeddings": store["embeddings"].astype("f4") / 256.0,
+        }
 
-        features_found = index[idx_features]
-        embeddings_found = group["embeddings"][idx_features, :]
+    # Increasing, numerical indices for the selected features
+    idx_features = _get_feature_rows(store, features)
+    idx_features = np.unique(idx_features[idx_features >= 0])
+    if len(idx_features) == 0:
         return {
-            "features": features_found,
-            "embeddings": embeddings_found.astype("f4") / 256.0,
+            "features": [],
+            "embeddings": [],
         }
 
+    features_found = index[idx_features]
+    embeddings_found = store["embeddings"][idx_features, :]
+    return {
+        "features": features_found,
+        "embeddings": embeddings_found.astype("f4") / 256.0,
+    }
+
+
+def _get_l1_edges(embeddings_queries, embeddings_targets, max_distance, block_elements=1 << 22):
+    """Get all (query, target) pairs closer than max_distance in L1 distance.
+
+    Targets are processed in blocks so that the temporary differences stay within
+    block_elements entries, and only the pairs within max_distance of each block are kept, so
+    memory does not grow with queries x targets. Differences of int8 values fit in int16, and
+    so do their sums over up to 128 dimensions (the PROST embedding size), so no float copy
+    is made.
+
+    Args:
+        max_distance: Distance threshold in PROST units.
+
+    Returns:
+        triple of numpy 1D arrays, with the query and target indices and their distances in
+        int8 units (256 x PROST), sorted by query and then target.
+    """
+    nqueries, ndims = embeddings_queries.shape
+    ntargets = embeddings_targets.shape[0]
+    dtype_sum = np.int16 if ndims * 255 <= np.iinfo(np.int16).max else np.int32
+    block_size = max(1, block_elements // max(1, nqueries * ndims))
+
+    queries = embeddings_queries.astype(np.int16)[:, None, :]
+    idx_query = [np.zeros(0, np.int64)]
+    idx_target = [np.zeros(0, np.int64)]
+    distances = [np.zeros(0, dtype_sum)]
+    for start in range(0, ntargets, block_size):
+        stop = min(start + block_size, ntargets)
+        diff = embeddings_targets[None, start:stop, :].astype(np.int16) - queries
+        np.abs(diff, out=diff)
+        dis = diff.sum(axis=2, dtype=dtype_sum)
+        idx_query_block, idx_target_block = (dis < max_distance * 256).nonzero()
+        idx_query.append(idx_query_block)
+        idx_target.append(idx_target_block + start)
+        distances.append(dis[idx_query_block, idx_target_block])
+
+    # Each block is sorted by query and then target, and blocks are in target order
+    idx_query = np.concatenate(idx_query)
+    order = np.argsort(idx_query, kind="stable")
+    return (
+        idx_query[order],
+        np.concatenate(idx_target)[order],
+        np.concatenate(distances)[order],
+    )
+
 
 def get_homologs(
     query_organism,
@@ -54,38 +138,37 @@ def get_homologs(
     max_distance_over_min=8,
 ):
     """Get homologous features across species using PROST protein embeddings."""
-    emb_queries = _get_prost_embeddings(
-        organism=query_organism, features=query_features
-    )
-    emb_target = _get_prost_embeddings(organism=target_organism)
+    store_queries = get_embedding_store(query_organism)
+    store_target = get_embedding_store(target_organism)
+
+    # Queries in the order of the embedding file, as found
+    idx_queries = _get_feature_rows(store_queries, query_features)
+    idx_queries = np.unique(idx_queries[idx_queries >= 0])
+    features_queries = store_queries["features"][idx_queries]
+
+    # Edges within max_distance, from the precomputed graph if it reaches that far
+    edges = lookup_homolog_edges(query_organism, target_organism, idx_queries, max_distance)
+    if edges is None:
+        # PROST requires L1 distance (thresholds in int8 units)
+        edges = _get_l1_edges(
+            store_queries["embeddings"][idx_queries],
+            store_target["embeddings"],
+            max_distance,
+        )
+    idx_query, idx_target, distances = edges
+    distances = distances.astype(np.int64)
 
+    # Restrict to closest and similia
+    min_distance = np.full(len(idx_queries), np.iinfo(np.int64).max)
+    np.minimum.at(min_distance, idx_query, distances)
+    keep = distances <= min_distance[idx_query] + max_distance_over_min * 256
+
+    # Matches, by query and then by target
     result = {
-        "queries": [],
-        "targets": [],
-        "distances": [],
+        "queries": list(features_queries[idx_query[keep]]),
+        "targets": list(store_target["features"][idx_target[keep]]),
+        "distances": (distances[keep] / 256.0).tolist(),
     }
-    for feature, embedding in zip(emb_queries["features"], emb_queries["embeddings"]):
-        # PROST requires L1 distance
-        dis = np.abs((emb_target["embeddings"] - embedding)).sum(axis=1)
-
-        # Identify all features within distance
-        idx_homologs = (dis < max_distance).nonzero()[0]
-        if len(idx_homologs) == 0:
-            continue
-        homologs = emb_target["features"][idx_homologs]
-        dis_homologs = dis[idx_homologs]
-
-        # Restrict to closest and similia
-        min_distance = dis_homologs.min()
-        idx_homologs = dis_homologs <= max_distance_over_min + min_distance
-        homologs = homologs[idx_homologs]
-        dis_homologs = dis_homologs[idx_homologs]
-
-        # Append to matches
-        for homolog, dis_homolog in zip(homologs, dis_homologs):
-            result["queries"].append(feature)
-            result["targets"].append(homolog)
-            result["distances"].append(float(dis_homolog))
     return result
 
 
@@ -104,42 +187,31 @@ def get_homology_distances(
             features2=target_features,
         )
 
-    emb_queries = _get_prost_embeddings(
-        organism=query_organism, features=query_features
-    )
-    emb_targets = _get_prost_embeddings(
-        organism=target_organism,
-        features=target_features,
-    )
-    found_queries = pd.Index(query_features).isin(emb_queries["features"])
-    found_targets = pd.Index(target_features).isin(emb_targets["features"])
-    found_both = found_queries & found_targets
-
-    query_features_found = np.array(query_features)[found_both]
-    target_features_found = np.array(target_features)[found_both]
-
-    # NOTE: the subfunction returns deduplicated features, so we need to realign them here
-    emb_queries_dup = []
-    emb_targets_dup = []
-    for fea in query_features_found:
-        # There is always only one match
-        idx = emb_queries["features"] == fea
-        emb_queries_dup.append(emb_queries["embeddings"][idx][0])
-    for fea in target_features_found:
-        idx = emb_targets["features"] == fea
-        emb_targets_dup.append(emb_targets["embeddings"][idx][0])
-
-    emb_queries_dup = np.array(emb_queries_dup)
-    emb_targets_dup = np.array(emb_targets_dup)
-
+    store_queries = get_embedding_store(query_organism)
+    store_targets = get_embedding_store(target_organism)
+    rows_queries = _get_feature_rows(store_queries, query_features)
+    rows_targets = _get_feature_rows(store_targets, target_features)
+    found_both = (rows_queries >= 0) & (rows_targets >= 0)
+    rows_queries = rows_queries[found_both]
+    rows_targets = rows_targets[found_both]
+
+    # Pairs within the radius of the precomputed graph are looked up, the others computed
+    dis = lookup_homology_distances(query_organism, target_organism, rows_queries, rows_targets)
+    if dis is None:
+        dis = np.full(len(rows_queries), -1, np.int32)
+    missing = dis < 0
     # PROST requires L1 distance
-    dis = np.abs(emb_queries_dup - emb_targets_dup).sum(axis=1)
+    diff = (
+        store_queries["embeddings"][rows_queries[missing]].astype(np.int16)
+        - store_targets["embeddings"][rows_targets[missing]].astype(np.int16)
+    )
+    dis[missing] = np.abs(diff).sum(axis=1)
 
     result = pd.DataFrame(
         {
-            "queries": query_features_found,
-            "targets": target_features_found,
-            "distances": dis,
+            "queries": np.array(query_features)[found_both],
+            "targets": np.array(target_features)[found_both],
+            "distances": (dis / 256.0).astype(np.float32),
         }
     )
 
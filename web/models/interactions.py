@@ -1,35 +1,248 @@
+"""Cell-cell interactions from OmniPath, as a graph between genes.
+
+Each organism's interaction table is loaded once into memory as integer gene ids: the
+directed (source, target) edges, and a symmetric adjacency matrix in CSR form so that the
+partners of any number of genes are a single gather. Parsing the gzipped table is slow, so
+build_indices.py can cache the arrays as a .npz file next to it, which is ignored once the
+table changes.
+
+Ligand-receptor scores join the graph with the expression of an organ: every interaction
+(source gene as ligand, target gene as receptor) is scored for every (sender, receiver) pair
+of cell types, reading only the genes that take part in some interaction.
+"""
+import os
+import numpy as np
 import pandas as pd
 
 from models.paths import (
+    get_atlas_path,
     get_interactions_path,
+    get_interactions_cache_path,
+)
+from models.utils import (
+    ApproximationFile,
+    get_file_fingerprint,
+    get_source_fingerprint,
+    gather_csr_rows,
+    read_columns,
+)
+from models.exceptions import (
+    MeasurementTypeNotFoundError,
 )
+from models.catalog import get_organ_catalog
+from models.features import get_feature_names
+from models.quantisation import get_quantisation
+from models.topk import top_k
+
+
+# This dict has organisms as keys and (table file fingerprint, graph) tuples as values
+interaction_graphs = {}
+
+
+def _parse_interaction_graph(interaction_path):
+    """Convert an interaction table into integer arrays."""
+    table = pd.read_csv(interaction_path, sep='\t', compression='gzip')
+    genes, ids = np.unique(
+        np.concatenate([table['source_gene'].values, table['target_gene'].values]).astype(str),
+        return_inverse=True,
+    )
+    sources, targets = ids[:len(table)], ids[len(table):]
+
+    # Partners are undirected, each pair counted once
+    ngenes = len(genes)
+    keys = np.unique(np.concatenate([sources * ngenes + targets, targets * ngenes + sources]))
+    indptr = np.zeros(ngenes + 1, np.int64)
+    indptr[1:] = np.cumsum(np.bincount(keys // ngenes, minlength=ngenes))
+
+    return {
+        "genes": genes,
+        "sources": sources.astype(np.int32),
+        "targets": targets.astype(np.int32),
+        "indptr": indptr,
+        "indices": (keys % ngenes).astype(np.int32),
+    }
 
 
+def _load_interaction_graph(organism):
+    """Load the interaction graph from the binary cache, or parse the table if there is none."""
+    interaction_path = get_interactions_path(organism)
+    cache_path = get_interactions_cache_path(organism)
+
+    if cache_path.exists():
+        with np.load(cache_path) as npz:
+            graph = dict(npz)
+        # The cache must have been built from the current table
+        if tuple(graph.pop("source")) == get_source_fingerprint(interaction_path):
+            return graph
+
+    return _parse_interaction_graph(interaction_path)
+
+
+def build_interaction_graph(organism):
+    """Parse the interaction table of an organism and write the binary cache next to it."""
+    interaction_path = get_interactions_path(organism)
+    source_fingerprint = get_source_fingerprint(interaction_path)
+    graph = _parse_interaction_graph(interaction_path)
+
+    cache_path = get_interactions_cache_path(organism)
+    cache_path_tmp = cache_path.with_name(cache_path.name + ".tmp")
+    with open(cache_path_tmp, "wb") as f:
+        np.savez(f, source=np.array(source_fingerprint, np.int64), **graph)
+
+    # Replace atomically, so readers never see a partially written file
+    os.replace(cache_path_tmp, cache_path)
+
+
+def get_interaction_graph(organism):
+    """Get the interaction graph of an organism, loading it once.
+
+    Returns:
+        dictionary with the following key-value pairs:
+           "genes": numpy 1D array of gene names, sorted, the id of a gene is its position,
+           "sources": numpy 1D array of source gene ids of each interaction,
+           "targets": numpy 1D array of target gene ids of each interaction,
+           "indptr": CSR row pointers of the symmetric adjacency matrix,
+           "indices": CSR column ids of the symmetric adjacency matrix,
+           "index": pandas Series from gene names to ids
+    """
+    fingerprint = get_file_fingerprint(get_interactions_path(organism))
+    if (organism not in interaction_graphs) or (interaction_graphs[organism][0] != fingerprint):
+        graph = _load_interaction_graph(organism)
+        graph["index"] = pd.Series(np.arange(len(graph["genes"])), index=graph["genes"])
+        interaction_graphs[organism] = (fingerprint, graph)
+    return interaction_graphs[organism][1]
+
 
 def get_interaction_partners(
     organism,
     features,
     measurement_type="gene_expression",
     ):
-    
+
     if measurement_type != "gene_expression":
         raise MeasurementTypeNotFoundError(
             "Interactions are only available for gene expression at the moment.",
             measurement_type=measurement_type,
         )
 
-    interaction_path = get_interactions_path(organism)
-    table = pd.read_csv(interaction_path, sep='\t', compression='gzip')
-    targets = []
-    queries = []
-    for feature in features:
-        partners = list(table.loc[table['source_gene'] == feature, 'target_gene'].values)
-        partners += list(table.loc[table['target_gene'] == feature, 'source_gene'].values)
-        partners = list(set(partners))
-        targets.extend(partners)
-        queries.extend([feature] * len(partners))
-    
+    graph = get_interaction_graph(organism)
+
+    # Features without interactions have no partners
+    features = np.asarray(features, dtype=str)
+    ids = graph["index"].reindex(features).values
+    found = ~np.isnan(ids)
+    idx_query, entries = gather_csr_rows(graph["indptr"], ids[found].astype(np.int64))
+
+    return {
+        'targets': graph["genes"][graph["indices"][entries]].tolist(),
+        'queries': features[found][idx_query].tolist(),
+    }
+
+
+def get_ligand_receptor_scores(
+    organism,
+    organ,
+    number=50,
+    min_fraction=0.1,
+    measurement_type="gene_expression",
+    block_elements=1 << 22,
+):
+    """Get the strongest ligand-receptor interactions between cell types of an organ.
+
+    Each interaction is scored for each (sender, receiver) pair of cell types as the average
+    expression of the ligand in the sender times that of the receptor in the receiver.
+
+    Args:
+        number: The number of top (interaction, sender, receiver) triples to return.
+        min_fraction: Minimal fraction of cells expressing the ligand in the sender and the
+            receptor in the receiver. Triples below it are not scored.
+        block_elements: Maximal number of scores computed at once, to bound memory usage.
+
+    Returns:
+        dictionary with the following key-value pairs, sorted by decreasing score:
+           "senders": numpy 1D array of cell types expressing the ligand,
+           "receivers": numpy 1D array of cell types expressing the receptor,
+           "ligands": numpy 1D array of ligands,
+           "receptors": numpy 1D array of receptors,
+           "scores": numpy 1D array of scores, all positive
+    """
+    if measurement_type != "gene_expression":
+        raise MeasurementTypeNotFoundError(
+            "Interactions are only available for gene expression at the moment.",
+            measurement_type=measurement_type,
+        )
+
+    celltypes = get_organ_catalog(organism, organ, measurement_type=measurement_type)["celltypes"]
+    celltypes = np.asarray(celltypes)
+    graph = get_interaction_graph(organism)
+
+    # Interactions with both partners measured in the atlas
+    features = get_feature_names(organism, measurement_type)
+    columns_genes = pd.Series(np.arange(len(features)), index=features)
+    columns_genes = columns_genes[~columns_genes.index.duplicated()]
+    columns_genes = columns_genes.reindex(graph["genes"]).values
+    columns_ligands = columns_genes[graph["sources"]]
+    columns_receptors = columns_genes[graph["targets"]]
+    found = ~np.isnan(columns_ligands) & ~np.isnan(columns_receptors)
+    ligands = graph["genes"][graph["sources"][found]]
+    receptors = graph["genes"][graph["targets"][found]]
+    ninteractions = len(ligands)
+
+    # Read only the genes in those interactions
+    columns, idx_genes = np.unique(
+        np.concatenate([columns_ligands[found], columns_receptors[found]]).astype(np.int64),
+        return_inverse=True,
+    )
+    idx_ligands, idx_receptors = idx_genes[:ninteractions], idx_genes[ninteractions:]
+    approx_path = get_atlas_path(organism)
+    with ApproximationFile(approx_path) as db:
+        db_mt = db["measurements"][measurement_type]
+        dequantise = "quantisation" in db_mt
+        group = db_mt["data"]["tissue->celltype"][organ]
+        average = read_columns(group["average"], columns)
+        fraction = read_columns(group["fraction"], columns)
+    if dequantise:
+        quantisation = get_quantisation(organism, measurement_type)
+        average = quantisation[average]
+        fraction = quantisation[fraction]
+
+    # Score blocks of interactions for all (sender, receiver) pairs at once, as tensors with
+    # axes (interaction, sender, receiver). Within each block only the top scores are kept,
+    # in flat order, so ties are broken by interaction and then cell types across blocks
+    ncelltypes = len(celltypes)
+    block_size = max(1, block_elements // max(1, ncelltypes * ncelltypes))
+    candidates = []
+    candidate_scores = []
+    for start in range(0, ninteractions, block_size):
+        stop = min(start + block_size, ninteractions)
+        ligand = average[:, idx_ligands[start:stop]].T
+        receptor = average[:, idx_receptors[start:stop]].T
+        scores = ligand[:, :, None] * receptor[:, None, :]
+        expressed = (
+            (fraction[:, idx_ligands[start:stop]].T >= min_fraction)[:, :, None]
+            & (fraction[:, idx_receptors[start:stop]].T >= min_fraction)[:, None, :]
+        )
+        scores = np.where(expressed, scores, 0).ravel()
+        idx_block = np.sort(top_k(scores, number))
+        candidates.append(idx_block + start * ncelltypes * ncelltypes)
+        candidate_scores.append(scores[idx_block])
+
+    if len(candidates) == 0:
+        candidates = np.zeros(0, np.int64)
+        candidate_scores = np.zeros(0, np.float32)
+    else:
+        candidates = np.concatenate(candidates)
+        candidate_scores = np.concatenate(candidate_scores)
+    idx_top = top_k(candidate_scores, number)
+    idx_top = idx_top[candidate_scores[idx_top] > 0]
+    idx_interaction, idx_sender, idx_receiver = np.unravel_index(
+        candidates[idx_top], (ninteractions, ncelltypes, ncelltypes),
+    )
+
     return {
-        'targets': targets,
-        'queries': queries,
+        "senders": celltypes[idx_sender],
+        "receivers": celltypes[idx_receiver],
+        "ligands": ligands[idx_interaction],
+        "receptors": receptors[idx_interaction],
+        "scores": candidate_scores[idx_top],
     }
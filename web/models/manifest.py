@@ -0,0 +1,124 @@
+"""Manifest of the approximation files in the atlas folder.
+
+Listing organisms, their measurement types and data sources used to mean opening every
+approximation file, once per measurement type and again for each data sources request. The
+manifest keeps that summary in memory, and in a small JSON file in the atlas folder so that
+a restart does not need to open the files either. Each entry stores the mtime and size of
+its file: only new or changed files are opened, and the JSON file is rewritten if any are.
+Files are listed and checked again only when the atlas folder changes or after a while (see
+`models.utils.is_folder_check_due`).
+"""
+import json
+import os
+import pathlib
+
+from config import configuration as config
+from models.utils import (
+    ApproximationFile,
+    get_source_fingerprint,
+    is_folder_check_due,
+)
+
+
+# This dict has atlas folders as keys and manifests as values. A manifest is a dict with
+# organisms as keys and dicts with "fingerprint", "measurement_types" and "sources" as values
+manifests = {}
+
+# This dict has atlas folders as keys and (folder mtime, time) tuples as values, recording
+# when the files were last checked against the manifest
+manifest_checks = {}
+
+
+def get_manifest_path():
+    """Get the file path for the manifest of the atlas folder."""
+    atlas_folder = pathlib.Path(config["paths"]["compressed_atlas"])
+    return atlas_folder / "manifest.json"
+
+
+def _list_atlas_files(atlas_folder):
+    """Get the approximation file of each organism in the atlas folder."""
+    paths = {}
+    for filename in os.listdir(atlas_folder):
+        # Old folders etc.
+        if not filename.endswith('h5'):
+            continue
+        # Precomputed indices next to the approximations, e.g. <organism>.markers.h5
+        if filename.count(".") > 1:
+            continue
+        organism, ending = filename.split(".")
+        paths[organism] = atlas_folder / filename
+    return paths
+
+
+def _read_manifest_entry(approx_path):
+    """Summarise one approximation file."""
+    entry = {
+        "fingerprint": list(get_source_fingerprint(approx_path)),
+        "measurement_types": [],
+        "sources": {},
+    }
+    with ApproximationFile(approx_path) as db:
+        # Old file formats etc.
+        if 'measurements' not in db:
+            return entry
+        for measurement_type, group in db['measurements'].items():
+            entry["measurement_types"].append(measurement_type)
+            entry["sources"][measurement_type] = group.attrs.get("source", "")
+    return entry
+
+
+def _load_manifest_file(manifest_path):
+    """Load the manifest from disk, or an empty one if missing or unreadable."""
+    if not manifest_path.exists():
+        return {}
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest_file(manifest_path, manifest):
+    """Write the manifest to disk, unless the atlas folder is read-only."""
+    # Replace atomically, so readers never see a partially written manifest
+    manifest_path_tmp = manifest_path.with_name(manifest_path.name + ".tmp")
+    try:
+        with open(manifest_path_tmp, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(manifest_path_tmp, manifest_path)
+    except OSError:
+        pass
+
+
+def get_manifest():
+    """Get the manifest of all approximation files, refreshing entries of changed files."""
+    atlas_folder = pathlib.Path(config["paths"]["compressed_atlas"])
+    check_due = is_folder_check_due(manifest_checks, atlas_folder, atlas_folder)
+    if (atlas_folder in manifests) and (not check_due):
+        return manifests[atlas_folder]
+
+    paths = _list_atlas_files(atlas_folder)
+    fingerprints = {
+        organism: list(get_source_fingerprint(approx_path))
+        for organism, approx_path in paths.items()
+    }
+
+    manifest = manifests.get(atlas_folder)
+    if (manifest is not None) and (
+        {organism: entry["fingerprint"] for organism, entry in manifest.items()} == fingerprints
+    ):
+        return manifest
+
+    manifest_path = get_manifest_path()
+    manifest_disk = _load_manifest_file(manifest_path)
+    manifest = {}
+    for organism, approx_path in paths.items():
+        entry = manifest_disk.get(organism)
+        if (entry is None) or (entry.get("fingerprint") != fingerprints[organism]):
+            entry = _read_manifest_entry(approx_path)
+        manifest[organism] = entry
+
+    if manifest != manifest_disk:
+        _write_manifest_file(manifest_path, manifest)
+    manifests[atlas_folder] = manifest
+    return manifest
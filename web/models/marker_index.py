@@ -0,0 +1,170 @@
+"""Precomputed marker index stored next to each approximation file.
+
+Markers of single cell types are requested far more often than the data changes. The index
+stores, for every (measurement type, organ, cell type), the top markers and their margins
+versus other cell types and versus other organs, so that those queries become a lookup. It
+is built offline (see build_indices.py) and ignored if the approximation file has changed
+since, in which case markers are computed on the fly as usual.
+"""
+import os
+import numpy as np
+
+from models.paths import (
+    get_atlas_path,
+    get_marker_index_path,
+)
+from models.utils import (
+    ApproximationFile,
+    get_file_fingerprint,
+    get_source_fingerprint,
+)
+from models.exceptions import (
+    OneOrganError,
+)
+from models.features import get_feature_names
+
+
+# This dict has organisms as keys and (index file fingerprint, index) tuples as values
+marker_indices = {}
+
+
+def _load_marker_index(index_path):
+    """Load a marker index file into memory."""
+    index = {"organs": {}}
+    with ApproximationFile(index_path) as h5:
+        index["number"] = int(h5.attrs["number"])
+        index["source"] = (int(h5.attrs["source_mtime_ns"]), int(h5.attrs["source_size"]))
+        for measurement_type, group_mt in h5.items():
+            for versus, group_versus in group_mt.items():
+                for organ, group in group_versus.items():
+                    celltypes = group["celltypes"].asstr()[:]
+                    index["organs"][(measurement_type, versus, organ)] = {
+                        "celltypes": {ct: i for i, ct in enumerate(celltypes)},
+                        "markers": group["markers"][:],
+                        "scores": group["scores"][:],
+                        "valid": group["valid"][:],
+                    }
+    return index
+
+
+def get_marker_index(organism):
+    """Get the marker index of an organism, or None if missing or out of date."""
+    index_path = get_marker_index_path(organism)
+    if not index_path.exists():
+        return None
+
+    fingerprint = get_file_fingerprint(index_path)
+    if (organism not in marker_indices) or (marker_indices[organism][0] != fingerprint):
+        marker_indices[organism] = (fingerprint, _load_marker_index(index_path))
+    index = marker_indices[organism][1]
+
+    # The index must have been built from the current approximation
+    if index["source"] != get_source_fingerprint(get_atlas_path(organism)):
+        return None
+
+    return index
+
+
+def lookup_markers(
+    organism,
+    organ,
+    cell_type,
+    number,
+    measurement_type="gene_expression",
+    versus="other_celltypes",
+):
+    """Look up precomputed markers for a single cell type.
+
+    Returns:
+        The marker features (best first), or None if they are not in the index, in which case
+        the caller should compute them on the fly.
+    """
+    index = get_marker_index(organism)
+    if (index is None) or (number > index["number"]):
+        return None
+
+    entry = index["organs"].get((measurement_type, versus, organ))
+    if entry is None:
+        return None
+
+    row = entry["celltypes"].get(cell_type)
+    if (row is None) or (not entry["valid"][row]):
+        return None
+
+    idx_markers = entry["markers"][row, :number]
+    idx_markers = idx_markers[idx_markers >= 0]
+    return get_feature_names(organism, measurement_type)[idx_markers]
+
+
+def build_marker_index(organism, number=100):
+    """Precompute the top markers of every cell type and write them next to the approximation."""
+    from models.catalog import get_measurement_catalog
+    from models.markers import (
+        _get_margins_all_celltypes,
+        _get_margins_vs_other_tissues,
+        _get_top_markers,
+    )
+
+    approx_path = get_atlas_path(organism)
+    source_fingerprint = get_source_fingerprint(approx_path)
+    with ApproximationFile(approx_path) as db:
+        measurement_types = list(db["measurements"].keys())
+
+    index_path = get_marker_index_path(organism)
+    index_path_tmp = index_path.with_name(index_path.name + ".tmp")
+    with ApproximationFile(index_path_tmp, "w") as h5:
+        h5.attrs["number"] = number
+        h5.attrs["source_mtime_ns"] = source_fingerprint[0]
+        h5.attrs["source_size"] = source_fingerprint[1]
+
+        for measurement_type in measurement_types:
+            catalog = get_measurement_catalog(organism, measurement_type=measurement_type)
+            versus_list = ["other_celltypes"]
+            if len(catalog.organs) > 1:
+                versus_list.append("other_organs")
+
+            for versus in versus_list:
+                for organ in catalog.organs:
+                    celltypes = catalog.celltypes[organ]
+                    markers = -np.ones((len(celltypes), number), np.int32)
+                    scores = np.zeros((len(celltypes), number), np.float32)
+                    valid = np.ones(len(celltypes), bool)
+
+                    if versus == "other_celltypes":
+                        # All cell types of the organ in one pass
+                        margins = _get_margins_all_celltypes(
+                            organism, organ, measurement_type=measurement_type,
+                        )[1]
+                        # A lone cell type has no markers versus other cell types
+                        if len(celltypes) == 1:
+                            valid[:] = False
+                    else:
+                        margins = []
+                        for i, celltype in enumerate(celltypes):
+                            try:
+                                closest_value = _get_margins_vs_other_tissues(
+                                    organism,
+                                    organ,
+                                    [celltype],
+                                    measurement_type=measurement_type,
+                                )
+                            except OneOrganError:
+                                valid[i] = False
+                                closest_value = None
+                            margins.append(closest_value)
+
+                    for i, closest_value in enumerate(margins):
+                        if not valid[i]:
+                            continue
+                        idx_markers = _get_top_markers(closest_value, number)
+                        markers[i, :len(idx_markers)] = idx_markers
+                        scores[i, :len(idx_markers)] = closest_value[idx_markers]
+
+                    group = h5.create_group(f"{measurement_type}/{versus}/{organ}")
+                    group.create_dataset("celltypes", data=celltypes.astype("S"))
+                    group.create_dataset("markers", data=markers)
+                    group.create_dataset("scores", data=scores)
+                    group.create_dataset("valid", data=valid)
+
+    # Replace atomically, so readers never see a partially written index
+    os.replace(index_path_tmp, index_path)
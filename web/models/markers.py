@@ -2,7 +2,10 @@ import numpy as np
 import pandas as pd
 
 from models.paths import get_atlas_path
-from models.utils import ApproximationFile
+from models.utils import (
+    ApproximationFile,
+    read_columns,
+)
 from models.exceptions import (
     OrganismNotFoundError,
     OrganNotFoundError,
@@ -16,8 +19,11 @@ from models.exceptions import (
     SimilarityMethodError,
     NeighborhoodNotFoundError,
 )
+from models.catalog import (
+    get_organ_catalog,
+)
 from models.celltypes import (
-    get_celltype_index,
+    get_organ_celltype_index,
 )
 from models.quantisation import (
     get_quantisation,
@@ -28,42 +34,60 @@ from models.features import (
     get_feature_names,
 )
 from models.surface import (
-    get_surface_genes,
+    get_surface_columns,
+)
+from models.topk import top_k
+from models.marker_index import (
+    lookup_markers,
 )
 
 
-# FIXME: refactoring the "cell_type" variable in both functions would be a great idea. The only current issue is that it
-# modifies the function signature and therefore requires an internal audit across the codebase.
-def get_markers_vs_other_celltypes(
+def _get_marker_method(measurement_type):
+    """Get the measurement subtype used to find markers."""
+    # In theory, one could use various methods to find markers
+    if measurement_type == "gene_expression":
+        return "fraction"
+    # For ATAC-Seq, average and fraction are the same thing
+    return "average"
+
+
+def _get_marker_features(organism, measurement_type, surface_only):
+    """Get the feature names and, if requested, the indices of surface features."""
+    if not surface_only:
+        return get_feature_names(organism, measurement_type), None
+    return get_surface_columns(organism, measurement_type)
+
+
+def _get_top_markers(closest_value, number):
+    """Get the indices of the top markers, best first, from the margin of each feature."""
+    # Take top features
+    idx_markers = top_k(closest_value, number)
+
+    # Sometimes there are just not enough markers, so make sure the difference
+    # is positive
+    idx_markers = idx_markers[closest_value[idx_markers] > 0]
+
+    return idx_markers
+
+
+def _get_margins_vs_other_celltypes(
     organism,
     organ,
     cell_type,
-    number,
     measurement_type="gene_expression",
-    surface_only=False,
+    columns=None,
 ):
-    """Get marker features for a specific cell type in an organ.
+    """Get the margin of each feature between focal cell type(s) and the closest other one.
 
-    NOTE: cell_type can actually be a sequence of cell types. In the function body below, it is in fact
-    converted to a list pretty early on and treated as one for the rest of the function. That appears to
-    be technically correct, nonetheless it requires care when reading the code.
-    """
-    # In theory, one could use various methods to find markers
-    if measurement_type == "gene_expression":
-        method = "fraction"
-    # For ATAC-Seq, average and fraction are the same thing
-    else:
-        method = "average"
-
-    # One can request multiple types as focal, the average will be used
-    if isinstance(cell_type, str):
-        cell_type = [cell_type]
+    Args:
+        cell_type: list of focal cell types.
+        columns: Sorted indices of the features to consider. None means all features.
 
-    features = get_feature_names(organism, measurement_type)
-    if surface_only:
-        surface_genes = get_surface_genes(organism)
-        surface_ser_sorted = pd.Series(features)
-        surface_ser_sorted = surface_ser_sorted[surface_ser_sorted.isin(surface_genes)]
+    Returns:
+        numpy 1D array with the margin of each feature (positive means higher in the focal
+        cell type(s) than in all other cell types).
+    """
+    method = _get_marker_method(measurement_type)
 
     approx_path = get_atlas_path(organism)
     with ApproximationFile(approx_path) as db:
@@ -73,37 +97,13 @@ def get_markers_vs_other_celltypes(
                 measurement_type=measurement_type,
             )
 
-        gby = db["measurements"][measurement_type]["grouped_by"]["tissue->celltype"]
-        if organ not in gby["values"]["tissue"].asstr()[:]:
-            raise OrganNotFoundError(
-                f"Organ not found: {organ}",
-                organ=organ,
-            )
+        # Cell types and indices
+        cell_types = get_organ_catalog(
+            organism, organ, measurement_type=measurement_type,
+        )["celltypes"]
 
         data = db["measurements"][measurement_type]["data"]["tissue->celltype"][organ]
 
-        # Cell types and indices
-        cell_types = data["obs_names"].asstr()[:]
-
-        # If all markers for the tissue are requested, merge a recursive call and bail
-        # TODO: do this explicitely, it's probably faster by a decent bit
-        if cell_type == ["all"]:
-            markers = []
-            targets = []
-            for ct in cell_types:
-                markers_ct = list(
-                    get_markers_vs_other_celltypes(
-                        organism,
-                        organ,
-                        ct,
-                        number,
-                        measurement_type=measurement_type,
-                    )
-                )
-                markers.extend(markers_ct)
-                targets.extend([ct] * len(markers_ct))
-            return markers, targets
-
         # All those cell types must be there, because this request is focused on a specific organ
         if not pd.Index(cell_type).isin(cell_types).all():
             raise CellTypeNotFoundError(
@@ -112,35 +112,34 @@ def get_markers_vs_other_celltypes(
             )
 
         # Matrix of measurements (rows are cell types)
-        # The last colon is needed to load from memory, which means unordered indexing can be used
-        mat = data[method][:]
-        if surface_only:
-            mat = mat[:, surface_ser_sorted.index.values]
-
-        # Compute focal cell type(s): if a single cell type is requested, the
-        # average is not doing anything. If multiple cell types are requested,
-        # then average across them so they do not compete with each other. this
-        # is useful for cell types that are similar, such as different types of
-        # muscle cells.
-        idx = []
-        for cell_typei in cell_type:
-            celltype_index_dict = get_celltype_index(cell_typei, cell_types)
-            cell_typei = celltype_index_dict["celltype"]
-            idxi = celltype_index_dict["index"]
-            idx.append(idxi)
-        vector = mat[idx].mean(axis=0)
-
-        # Compute background (other cell types)
-        ncell_types = len(cell_types)
-        idx_other = [i for i in range(ncell_types) if i not in idx]
-        mat_other = mat[idx_other]
-
-        # If the data is quantised, undo the quantisation to get real values
+        mat = read_columns(data[method], columns)
+
         dequantise = "quantisation" in db["measurements"][measurement_type]
-        if dequantise:
-            quantisation = get_quantisation(organism, measurement_type)
-            vector = quantisation[vector]
-            mat_other = quantisation[mat_other]
+
+    # If the data is quantised, undo the quantisation to get real values
+    if dequantise:
+        quantisation = get_quantisation(organism, measurement_type)
+        mat = quantisation[mat]
+
+    # Compute focal cell type(s): if a single cell type is requested, the
+    # average is not doing anything. If multiple cell types are requested,
+    # then average across them so they do not compete with each other. this
+    # is useful for cell types that are similar, such as different types of
+    # muscle cells.
+    idx = []
+    for cell_typei in cell_type:
+        celltype_index_dict = get_organ_celltype_index(
+            organism, organ, cell_typei, measurement_type=measurement_type,
+        )
+        cell_typei = celltype_index_dict["celltype"]
+        idxi = celltype_index_dict["index"]
+        idx.append(idxi)
+    vector = mat[idx].mean(axis=0)
+
+    # Compute background (other cell types)
+    ncell_types = len(cell_types)
+    idx_other = [i for i in range(ncell_types) if i not in idx]
+    mat_other = mat[idx_other]
 
     # Compute difference (vector - other)
     mat_other -= vector
@@ -149,52 +148,90 @@ def get_markers_vs_other_celltypes(
     # Find closest cell type among backgroun types, separately for each feature
     closest_value = mat_other.min(axis=0)
 
-    # Take top features
-    idx_markers = np.argsort(closest_value)[-number:][::-1]
+    return closest_value
 
-    # Sometimes there are just not enough markers, so make sure the difference
-    # is positive
-    idx_markers = idx_markers[closest_value[idx_markers] > 0]
 
-    # Get the feature names
-    if surface_only:
-        markers = surface_ser_sorted.values[idx_markers]
-    else:
-        markers = features[idx_markers]
+def _get_margins_all_celltypes(
+    organism,
+    organ,
+    measurement_type="gene_expression",
+    columns=None,
+):
+    """Get the margin of each feature for every cell type in an organ at once.
 
-    return markers
+    The margin of a cell type is its value minus the highest value among the other cell
+    types, i.e. minus the per-feature maximum, except for the cell type that is the maximum,
+    which is compared with the second highest value instead. The organ is read once.
 
+    Args:
+        columns: Sorted indices of the features to consider. None means all features.
 
-def get_markers_vs_other_tissues(
+    Returns:
+        pair with the cell types and a numpy 2D array of margins (rows are cell types).
+    """
+    method = _get_marker_method(measurement_type)
+
+    approx_path = get_atlas_path(organism)
+    with ApproximationFile(approx_path) as db:
+        if measurement_type not in db["measurements"]:
+            raise MeasurementTypeNotFoundError(
+                f"Measurement type not found: {measurement_type}",
+                measurement_type=measurement_type,
+            )
+
+        cell_types = get_organ_catalog(
+            organism, organ, measurement_type=measurement_type,
+        )["celltypes"]
+
+        data = db["measurements"][measurement_type]["data"]["tissue->celltype"][organ]
+
+        # Matrix of measurements (rows are cell types)
+        mat = read_columns(data[method], columns)
+
+        dequantise = "quantisation" in db["measurements"][measurement_type]
+
+    # If the data is quantised, undo the quantisation to get real values
+    if dequantise:
+        quantisation = get_quantisation(organism, measurement_type)
+        mat = quantisation[mat]
+
+    # A lone cell type has no competitors, so its margin is just its value
+    if len(cell_types) == 1:
+        return cell_types, mat
+
+    # Top two values for each feature
+    idx_max = mat.argmax(axis=0)
+    features_range = np.arange(mat.shape[1])
+    max1 = mat[idx_max, features_range]
+    mat[idx_max, features_range] = -np.inf
+    max2 = mat.max(axis=0)
+    mat[idx_max, features_range] = max1
+
+    # Compute difference (vector - closest other)
+    margins = mat - max1
+    margins[idx_max, features_range] = max1 - max2
+
+    return cell_types, margins
+
+
+def _get_margins_vs_other_tissues(
     organism,
     organ,
     cell_type,
-    number,
     measurement_type="gene_expression",
-    surface_only=False,
+    columns=None,
 ):
-    """Get marker features for a specific cell type in an organ.
+    """Get the margin of each feature between focal cell type(s) in an organ and other organs.
 
-    NOTE: cell_type can actually be a sequence of cell types. In the function body below, it is in fact
-    converted to a list pretty early on and treated as one for the rest of the function. That appears to
-    be technically correct, nonetheless it requires care when reading the code.
-    """
-    # In theory, one could use various methods to find markers
-    if measurement_type == "gene_expression":
-        method = "fraction"
-    # For ATAC-Seq, average and fraction are the same thing
-    else:
-        method = "average"
-
-    # One can request multiple types as focal, the average will be used
-    if isinstance(cell_type, str):
-        cell_type = [cell_type]
+    Args:
+        cell_type: list of focal cell types.
+        columns: Sorted indices of the features to consider. None means all features.
 
-    features = get_feature_names(organism, measurement_type)
-    if surface_only:
-        surface_genes = get_surface_genes(organism)
-        surface_ser_sorted = pd.Series(features)
-        surface_ser_sorted = surface_ser_sorted[surface_ser_sorted.isin(surface_genes)]
+    Returns:
+        numpy 1D array with the margin of each feature (positive means higher in the focal
+        organ than in all other organs).
+    """
+    method = _get_marker_method(measurement_type)
 
     approx_path = get_atlas_path(organism)
     with ApproximationFile(approx_path) as db:
@@ -208,31 +245,16 @@ def get_markers_vs_other_tissues(
         organs = gby["values"]["tissue"].asstr()[:]
         if len(organs) == 1:
             raise OneOrganError("Only one organ found")
-        if organ == "all":
-            markers = []
-            targets = []
-            for tissue in organs:
-                try:
-                    markers_organ = list(
-                        get_markers_vs_other_tissues(
-                            organism,
-                            tissue,
-                            cell_type,
-                            number,
-                            measurement_type=measurement_type,
-                        )
-                    )
-                except CellTypeNotFoundError:
-                    continue
-                markers.extend(markers_organ)
-                targets.extend([tissue] * len(markers_organ))
-            return markers, targets
         if organ not in organs:
             raise OrganNotFoundError(
                 f"Organ not found: {organ}",
                 organ=organ,
             )
 
+        dequantise = "quantisation" in db["measurements"][measurement_type]
+        if dequantise:
+            quantisation = get_quantisation(organism, measurement_type)
+
         mat = []
         organs_mat = []
         for tissue in organs:
@@ -240,7 +262,9 @@ def get_markers_vs_other_tissues(
                 "tissue->celltype"
             ][tissue]
             # Cell types and indices
-            cell_types = list(data_tissue["obs_names"].asstr()[:])
+            cell_types = list(get_organ_catalog(
+                organism, tissue, measurement_type=measurement_type,
+            )["celltypes"])
 
             # This request is across organs, and different variants of a cell type can be found across organs.
             # Therefore, it is reasonalbe that only some of the mentioned cell types are found in each organ.
@@ -258,32 +282,32 @@ def get_markers_vs_other_tissues(
             # Sort it to access only those numbers from disk (HDF5 requirement)
             idx = np.sort(idx)
 
-            # Average across focal cell types if more than one selected
-            vect_tissue = data_tissue[method][idx].mean(axis=0)
+            if columns is None:
+                mat_tissue = data_tissue[method][idx]
+            else:
+                mat_tissue = np.vstack([
+                    read_columns(data_tissue[method], columns, row=i) for i in idx
+                ])
 
-            if surface_only:
-                vect_tissue = vect_tissue[surface_ser_sorted.index.values]
-            mat.append(vect_tissue)
-            organs_mat.append(tissue)
+            # If the data is quantised, undo the quantisation to get real values
+            if dequantise:
+                mat_tissue = quantisation[mat_tissue]
 
-        # Matrix of measurements (rows are tissues)
-        mat = np.vstack(mat)
+            # Average across focal cell types if more than one selected
+            mat.append(mat_tissue.mean(axis=0))
+            organs_mat.append(tissue)
 
-        # Index organs
-        norgans = len(organs_mat)
-        if norgans == 1:
-            raise OneOrganError(f"Only one organ with {cell_type} found")
-        idx = list(organs_mat).index(organ)
-        idx_other = [i for i in range(norgans) if i != idx]
-        vector = mat[idx]
-        mat_other = mat[idx_other]
+    # Matrix of measurements (rows are tissues)
+    mat = np.vstack(mat)
 
-        # If the data is quantised, undo the quantisation to get real values
-        dequantise = "quantisation" in db["measurements"][measurement_type]
-        if dequantise:
-            quantisation = get_quantisation(organism, measurement_type)
-            vector = quantisation[vector]
-            mat_other = quantisation[mat_other]
+    # Index organs
+    norgans = len(organs_mat)
+    if norgans == 1:
+        raise OneOrganError(f"Only one organ with {cell_type} found")
+    idx = list(organs_mat).index(organ)
+    idx_other = [i for i in range(norgans) if i != idx]
+    vector = mat[idx]
+    mat_other = mat[idx_other]
 
     # Compute difference (vector - other)
     mat_other -= vector
@@ -292,17 +316,157 @@ def get_markers_vs_other_tissues(
     # Find closest cell type for each feature
     closest_value = mat_other.min(axis=0)
 
-    # Take top features
-    idx_markers = np.argsort(closest_value)[-number:][::-1]
+    return closest_value
 
-    # Sometimes there are just not enough markers, so make sure the difference
-    # is positive
-    idx_markers = idx_markers[closest_value[idx_markers] > 0]
+
+# FIXME: refactoring the "cell_type" variable in both functions would be a great idea. The only current issue is that it
+# modifies the function signature and therefore requires an internal audit across the codebase.
+def get_markers_vs_other_celltypes(
+    organism,
+    organ,
+    cell_type,
+    number,
+    measurement_type="gene_expression",
+    surface_only=False,
+):
+    """Get marker features for a specific cell type in an organ.
+
+    NOTE: cell_type can actually be a sequence of cell types. In the function body below, it is in fact
+    converted to a list pretty early on and treated as one for the rest of the function. That appears to
+    be technically correct, nonetheless it requires care when reading the code.
+
+    NOTE: single cell types are looked up in the precomputed marker index if there is an up-to-date one
+    (see models/marker_index.py), otherwise markers are computed on the fly.
+    """
+    # One can request multiple types as focal, the average will be used
+    if isinstance(cell_type, str):
+        cell_type = [cell_type]
+
+    # If all markers for the tissue are requested, compute all cell types in one pass
+    if cell_type == ["all"]:
+        features, columns = _get_marker_features(organism, measurement_type, surface_only)
+        cell_types, margins = _get_margins_all_celltypes(
+            organism,
+            organ,
+            measurement_type=measurement_type,
+            columns=columns,
+        )
+        markers = []
+        targets = []
+        for ct, closest_value in zip(cell_types, margins):
+            markers_ct = list(features[_get_top_markers(closest_value, number)])
+            markers.extend(markers_ct)
+            targets.extend([ct] * len(markers_ct))
+        return markers, targets
+
+    if (not surface_only) and (len(cell_type) == 1):
+        markers = lookup_markers(
+            organism,
+            organ,
+            cell_type[0],
+            number,
+            measurement_type=measurement_type,
+            versus="other_celltypes",
+        )
+        if markers is not None:
+            return markers
+
+    features, columns = _get_marker_features(organism, measurement_type, surface_only)
+
+    closest_value = _get_margins_vs_other_celltypes(
+        organism,
+        organ,
+        cell_type,
+        measurement_type=measurement_type,
+        columns=columns,
+    )
+
+    idx_markers = _get_top_markers(closest_value, number)
+
+    # Get the feature names
+    markers = features[idx_markers]
+
+    return markers
+
+
+def get_markers_vs_other_tissues(
+    organism,
+    organ,
+    cell_type,
+    number,
+    measurement_type="gene_expression",
+    surface_only=False,
+):
+    """Get marker features for a specific cell type in an organ.
+
+    NOTE: cell_type can actually be a sequence of cell types. In the function body below, it is in fact
+    converted to a list pretty early on and treated as one for the rest of the function. That appears to
+    be technically correct, nonetheless it requires care when reading the code.
+
+    NOTE: single cell types are looked up in the precomputed marker index if there is an up-to-date one
+    (see models/marker_index.py), otherwise markers are computed on the fly.
+    """
+    # One can request multiple types as focal, the average will be used
+    if isinstance(cell_type, str):
+        cell_type = [cell_type]
+
+    if organ == "all":
+        approx_path = get_atlas_path(organism)
+        with ApproximationFile(approx_path) as db:
+            if measurement_type not in db["measurements"]:
+                raise MeasurementTypeNotFoundError(
+                    f"Measurement type not found: {measurement_type}",
+                    measurement_type=measurement_type,
+                )
+            gby = db["measurements"][measurement_type]["grouped_by"]["tissue->celltype"]
+            organs = gby["values"]["tissue"].asstr()[:]
+        if len(organs) == 1:
+            raise OneOrganError("Only one organ found")
+
+        markers = []
+        targets = []
+        for tissue in organs:
+            try:
+                markers_organ = list(
+                    get_markers_vs_other_tissues(
+                        organism,
+                        tissue,
+                        cell_type,
+                        number,
+                        measurement_type=measurement_type,
+                    )
+                )
+            except CellTypeNotFoundError:
+                continue
+            markers.extend(markers_organ)
+            targets.extend([tissue] * len(markers_organ))
+        return markers, targets
+
+    if (not surface_only) and (len(cell_type) == 1):
+        markers = lookup_markers(
+            organism,
+            organ,
+            cell_type[0],
+            number,
+            measurement_type=measurement_type,
+            versus="other_organs",
+        )
+        if markers is not None:
+            return markers
+
+    features, columns = _get_marker_features(organism, measurement_type, surface_only)
+
+    closest_value = _get_margins_vs_other_tissues(
+        organism,
+        organ,
+        cell_type,
+        measurement_type=measurement_type,
+        columns=columns,
+    )
+
+    idx_markers = _get_top_markers(closest_value, number)
 
     # Get the feature names
-    if surface_only:
-        markers = surface_ser_sorted.values[idx_markers]
-    else:
-        markers = features[idx_markers]
+    markers = features[idx_markers]
 
     return markers
@@ -4,103 +4,118 @@ import pandas as pd
 
 from config import configuration as config
 from models.paths import get_atlas_path
-from models.utils import ApproximationFile
+from models.utils import (
+    ApproximationFile,
+    read_columns,
+)
 from models.exceptions import (
     OrganismNotFoundError,
     MeasurementTypeNotFoundError,
-    FeatureNotFoundError,
     SomeFeaturesNotFoundError,
     TooManyFeaturesError,
     OrganCellTypeError,
     OrganNotFoundError,
+    CellTypeNotFoundError,
     NeighborhoodNotFoundError,
 )
 from models.features import (
-    get_feature_index,
+    resolve_features,
+)
+from models.catalog import get_organ_catalog
+from models.celltypes import (
+    get_organ_celltype_index,
+    resolve_celltype,
 )
-from models.celltypes import get_celltype_index
 from models.quantisation import get_quantisation
 
 
+def _get_feature_order(
+    organism,
+    features,
+    measurement_type,
+):
+    """Resolve features and sort them for reading from the h5 file.
+
+    Returns:
+        None if all features are requested, otherwise a pair of numpy 1D arrays: the sorted,
+        deduplicated feature indices in the h5 file and the indices that restore the original
+        order of the features.
+    """
+    if features is None:
+        return None
+
+    resolved = resolve_features(organism, features, measurement_type=measurement_type)
+    if resolved["missing"].any():
+        raise SomeFeaturesNotFoundError(
+            f"Some features not found: {features}",
+            features=list(np.asarray(features, dtype=object)[resolved["missing"]]),
+        )
+
+    # Sort and deduplicate for the h5 file
+    return np.unique(resolved["index"], return_inverse=True)
+
+
 def _get_sorted_feature_index(
     db,
     organism,
     organ,
-    features,
+    feature_order,
     measurement_type,
-    measurement_subtype,
+    measurement_subtypes,
     celltype_index=None,
     use_neighborhood=False,
 ):
-    """Get auxiliary data structures for sorted dict of features.
+    """Read sorted features from one organ, for one or more measurement subtypes.
 
     Args:
-        measurement_subtype (str): "average" or "fraction".
+        feature_order: The output of _get_feature_order.
+        measurement_subtypes (sequence of str): "average" and/or "fraction".
         use_neighborhood (bool): Whether to zoom into sub-cell-type detail.
+
+    Returns:
+        list of numpy arrays, one per measurement subtype.
     """
-    gby = db['measurements'][measurement_type]['grouped_by']['tissue->celltype']
-    if organ not in gby['values']['tissue'].asstr()[:]:
-        raise OrganNotFoundError(
-            f"Organ not found: {organ}",
-            organ=organ,
-        )
+    # Check that the organ exists
+    get_organ_catalog(organism, organ, measurement_type=measurement_type)
 
-    db_dataset = db['measurements'][measurement_type]["data"]['tissue->celltype'][organ]
+    db_group = db['measurements'][measurement_type]["data"]['tissue->celltype'][organ]
     if use_neighborhood:
         try:
-            db_dataset = db_dataset["neighborhood"]
+            db_group = db_group["neighborhood"]
         except KeyError:
             raise NeighborhoodNotFoundError(
                 organism, organ,
             )
-    db_dataset = db_dataset[measurement_subtype]
 
-    if features is None:
-        return db_dataset[:, :]
+    result = []
+    for measurement_subtype in measurement_subtypes:
+        db_dataset = db_group[measurement_subtype]
 
-    features_not_found = []
-    idx_series = {}
-    for fea in features:
-        try:
-            idx = get_feature_index(organism, fea.lower(), measurement_type)
-        except FeatureNotFoundError as exc:
-            features_not_found.append(fea)
+        if feature_order is None:
+            result.append(read_columns(db_dataset))
             continue
 
-        idx_series[fea] = idx
-
-    if len(features_not_found):
-        raise SomeFeaturesNotFoundError(
-            f"Some features not found: {features}",
-            features=features_not_found,
-        )
-
-    idx_series = pd.Series(idx_series)
-
-    # Sort for the h5 file
-    idx_sorted = idx_series.sort_values()
-    idx_sort_back = pd.Series(np.arange(len(features)), index=idx_sorted.index)
-    idx_sort_back = idx_sort_back.loc[features].values
+        idx_sorted, idx_sort_back = feature_order
 
-    # Extract data from the file and resort in the original order
-    if celltype_index is not None:
-        data = db_dataset[celltype_index, idx_sorted.values]
-    else:
-        data = db_dataset[:, idx_sorted.values].T
+        # Extract data from the file and resort in the original order
+        if celltype_index is not None:
+            data = read_columns(db_dataset, idx_sorted, row=celltype_index)
+        else:
+            data = read_columns(db_dataset, idx_sorted).T
 
-    data = data[idx_sort_back]
-    return data
+        result.append(data[idx_sort_back])
+    return result
 
 
 def _collate_measurement_across_organs(
     db,
     organism,
-    features,
+    feature_order,
     cell_type,
     measurement_type,
-    measurement_subtype,
+    measurement_subtypes,
 ):
-    from models import get_celltype_location, get_celltypes
+    from models import get_celltype_location
 
     organs = get_celltype_location(
         organism,
@@ -112,49 +127,50 @@ def _collate_measurement_across_organs(
             f"Cell type not found: {cell_type}.",
             cell_type=cell_type,
         )
+    # The cell type might be known in this organism under an alias
+    cell_type = resolve_celltype(organism, cell_type, measurement_type=measurement_type)
 
-    avgs = []
+    avgs = [[] for measurement_subtype in measurement_subtypes]
     for organ in organs:
-        celltypes_organ = list(
-            get_celltypes(
-                organism,
-                organ,
-                measurement_type=measurement_type,
-            )
-        )
-
-        celltype_index_dict = get_celltype_index(cell_type, celltypes_organ)
-        cell_type = celltype_index_dict["celltype"]
-        celltype_index = celltype_index_dict["index"]
+        celltype_index = get_organ_celltype_index(
+            organism,
+            organ,
+            cell_type,
+            measurement_type=measurement_type,
+        )["index"]
 
-        avg = _get_sorted_feature_index(
+        avgs_organ = _get_sorted_feature_index(
             db,
             organism,
             organ,
-            features,
+            feature_order,
             measurement_type,
-            measurement_subtype,
+            measurement_subtypes,
             celltype_index=celltype_index,
         )
-        avgs.append(avg)
-    avgs = np.vstack(avgs)
+        for avgs_subtype, avg in zip(avgs, avgs_organ):
+            avgs_subtype.append(avg)
+    avgs = [np.vstack(avgs_subtype) for avgs_subtype in avgs]
     return avgs
 
 
-def get_measurement(
+def _get_measurements(
     organism,
     features,
     measurement_type,
-    measurement_subtype,
+    measurement_subtypes,
     organ=None,
     cell_type=None,
     nmax=500,
     use_neighborhood=False,
 ):
-    """Get measurements by cell type
+    """Get measurements by cell type for one or more measurement subtypes at once.
+
+    The file is opened once and features are resolved once, no matter how many
+    measurement subtypes are requested.
 
     Returns:
-        numpy 2D array where each row is a **feature**
+        list of numpy 2D arrays (one per measurement subtype) where each row is a **feature**
     """
     if (features is not None) and (len(features) > nmax):
         nfeas = len(features)
@@ -176,25 +192,27 @@ def get_measurement(
         # If the data is quantised, undo the quantisation to get real values
         dequantise = "quantisation" in db['measurements'][measurement_type]
 
+        # Get index for each feature, then sort for speed, then reorder
+        feature_order = _get_feature_order(organism, features, measurement_type)
+
         if organ is not None:
-            # Get index for each feature, then sort for speed, then reorder
             result = _get_sorted_feature_index(
                 db,
                 organism,
                 organ,
-                features,
+                feature_order,
                 measurement_type,
-                measurement_subtype,
+                measurement_subtypes,
                 use_neighborhood=use_neighborhood,
             )
         elif not use_neighborhood:
             result = _collate_measurement_across_organs(
                 db,
                 organism,
-                features,
+                feature_order,
                 cell_type,
                 measurement_type,
-                measurement_subtype,
+                measurement_subtypes,
             )
         else:
             raise ValueError("Neighborhoods are only defined within an organ")
@@ -203,11 +221,74 @@ def get_measurement(
     # might involve opening the same file again
     if dequantise:
         quantisation = get_quantisation(organism, measurement_type)
-        result = quantisation[result]
+        result = [quantisation[data] for data in result]
 
     return result
 
 
+def get_measurement(
+    organism,
+    features,
+    measurement_type,
+    measurement_subtype,
+    organ=None,
+    cell_type=None,
+    nmax=500,
+    use_neighborhood=False,
+):
+    """Get measurements by cell type
+
+    Returns:
+        numpy 2D array where each row is a **feature**
+    """
+    return _get_measurements(
+        organism,
+        features,
+        measurement_type,
+        (measurement_subtype,),
+        organ=organ,
+        cell_type=cell_type,
+        nmax=nmax,
+        use_neighborhood=use_neighborhood,
+    )[0]
+
+
+def get_dotplot_data(
+    organism,
+    features,
+    organ=None,
+    cell_type=None,
+    measurement_type="gene_expression",
+    use_neighborhood=False,
+):
+    """Get average measurement and fraction detected by cell type in a single pass
+
+    Returns:
+        dictionary with the following key-value pairs:
+           "average": numpy 2D array where each row is a **feature**,
+           "fraction": numpy 2D array where each row is a **feature**
+    """
+    # For ATAC-Seq, fraction detected is the same as average
+    if measurement_type in ("chromatin_accessibility",):
+        measurement_subtypes = ("average",)
+    else:
+        measurement_subtypes = ("average", "fraction")
+
+    result = _get_measurements(
+        organism,
+        features,
+        measurement_type,
+        measurement_subtypes,
+        organ=organ,
+        cell_type=cell_type,
+        use_neighborhood=use_neighborhood,
+    )
+    return {
+        "average": result[0],
+        "fraction": result[-1],
+    }
+
+
 def get_averages(
     organism,
     features,
@@ -277,31 +358,20 @@ def get_neighborhoods(
     """Get data (average, fraction, coordinates) for local neighborhoods in a tissue."""
 
     if (features is not None) and len(features):
-        averages = get_averages(
+        dotplot_data = get_dotplot_data(
             organism,
             features,
             organ=organ,
             measurement_type=measurement_type,
             use_neighborhood=True,
         )
-        fractions = get_fraction_detected(
-            organism,
-            features,
-            organ=organ,
-            measurement_type=measurement_type,
-            use_neighborhood=True, 
-        )
 
     # Cell types (always), coords and hulls (if requested)
+    # Check that the organ exists
+    get_organ_catalog(organism, organ, measurement_type=measurement_type)
+
     approx_path = get_atlas_path(organism)
     with ApproximationFile(approx_path) as db:
-        gby = db['measurements'][measurement_type]['grouped_by']['tissue->celltype']
-        if organ not in gby['values']['tissue'].asstr()[:]:
-            raise OrganNotFoundError(
-                f"Organ not found: {organ}",
-                organ=organ,
-            )
-
         db_dataset = db['measurements'][measurement_type]["data"]['tissue->celltype'][organ]["neighborhood"]
         ncells_per_cluster = db_dataset["cell_count"][:]
 
@@ -318,8 +388,8 @@ def get_neighborhoods(
 
     if (features is not None) and len(features):
         result.update({
-            "average": averages,
-            "fraction": fractions,
+            "average": dotplot_data["average"],
+            "fraction": dotplot_data["fraction"],
         })
 
     if include_embedding:
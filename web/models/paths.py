@@ -18,6 +18,61 @@ def get_atlas_path(organism):
     return approx_path
 
 
+def get_marker_index_path(organism):
+    """Get the file path for the precomputed marker index of an organism.
+
+    NOTE: the file might not exist, in which case markers are computed on the fly.
+    """
+    atlas_folder = pathlib.Path(config["paths"]["compressed_atlas"])
+    return atlas_folder / f"{organism}.markers.h5"
+
+
+def get_feature_store_path(organism):
+    """Get the file path for the feature-major store of an organism.
+
+    NOTE: the file might not exist, in which case the approximation file is used.
+    """
+    atlas_folder = pathlib.Path(config["paths"]["compressed_atlas"])
+    return atlas_folder / f"{organism}.features.h5"
+
+
+def get_similar_features_path(organism):
+    """Get the file path for the precomputed nearest features of an organism.
+
+    NOTE: the file might not exist, in which case similar features are computed on the fly.
+    """
+    atlas_folder = pathlib.Path(config["paths"]["compressed_atlas"])
+    return atlas_folder / f"{organism}.similar_features.h5"
+
+
+def get_similar_ann_path(organism):
+    """Get the file path for the approximate nearest neighbour index of an organism.
+
+    NOTE: the file might not exist, in which case similar features are found exactly.
+    """
+    atlas_folder = pathlib.Path(config["paths"]["compressed_atlas"])
+    return atlas_folder / f"{organism}.similar_ann.h5"
+
+
+def get_celltype_vectors_path(organism):
+    """Get the file path for the precomputed cell type vectors of an organism.
+
+    NOTE: the file might not exist, in which case the vectors are computed on first use.
+    """
+    atlas_folder = pathlib.Path(config["paths"]["compressed_atlas"])
+    return atlas_folder / f"{organism}.celltype_vectors.h5"
+
+
+def get_presence_index_path():
+    """Get the file path for the presence index of cell types across organisms.
+
+    NOTE: the file might not exist, in which case the index is built in memory.
+    """
+    atlas_folder = pathlib.Path(config["paths"]["compressed_atlas"])
+    # Two dots, so that it is not taken for the approximation of an organism
+    return atlas_folder / "atlas.presence.h5"
+
+
 def get_interactions_path(organism):
     """Get the file path for a set of interactions."""
     interaction_folder = pathlib.Path(config["paths"]["interactions"])
@@ -31,6 +86,23 @@ def get_interactions_path(organism):
     return interaction_path
 
 
+def get_interactions_cache_path(organism):
+    """Get the file path for the binary cache of a set of interactions.
+
+    NOTE: the file might not exist, in which case the table is parsed on the fly.
+    """
+    interaction_folder = pathlib.Path(config["paths"]["interactions"])
+    return interaction_folder / f"{organism}_omnipath_nocomplex_dedup.npz"
+
+
 def get_protein_embeddings_path():
     """Get the file containing all protein embeddings."""
     return pathlib.Path(config["paths"]["protein_embeddings"])
+
+
+def get_homolog_graph_path():
+    """Get the file containing the precomputed homolog graph between organisms.
+
+    NOTE: the file might not exist, in which case homologs are computed on the fly.
+    """
+    return pathlib.Path(config["paths"]["homolog_graph"])
@@ -0,0 +1,305 @@
+"""Presence tables of cell types across organs and organisms.
+
+The tables are built from the in-memory catalog (see `models.catalog`): cell types and
+organs are turned into integer codes and cell counts are accumulated into a matrix in one
+vectorised step. The matrix of each organism is kept in memory and rebuilt together with its
+catalog.
+
+Tables across organisms are served from a presence index instead: the cell type x organism
+matrix plus, for every cell type, the list of (organism, organ) where it is found. The index
+is built offline (see build_indices.py) into a single file next to the approximations, loaded
+at startup, and ignored if any approximation file changes later on, in which case it is
+rebuilt in memory from the tables above.
+
+Checking every approximation file on each request would cost as much as the lookup saves, so
+the files are only checked when the atlas folder changes or after a while (see
+`models.utils.is_folder_check_due`).
+"""
+import os
+import numpy as np
+import pandas as pd
+
+from config import configuration as config
+from models.paths import get_presence_index_path
+from models.manifest import get_manifest
+from models.catalog import (
+    get_measurement_catalog,
+    get_organ_catalog,
+)
+from models.utils import (
+    ApproximationFile,
+    is_folder_check_due,
+)
+
+
+# This dict has (organism, measurement_type) as keys and (catalog, table) tuples as values,
+# where the table has sorted "celltypes" and "organs" and matrices of cell "counts" and
+# "presence" with cell types as rows and organs as columns
+celltypexorgan_tables = {}
+
+# This dict has measurement types as keys and (approximation file fingerprints, index) tuples
+# as values, where the fingerprints are a dict with organisms as keys
+presence_indices = {}
+
+# This dict has measurement types as keys and (atlas folder mtime, time) tuples as values,
+# recording when the index was last checked against the approximation files
+presence_checks = {}
+
+
+def _get_celltypexorgan_table(organism, measurement_type="gene_expression"):
+    """Get cell counts for all cell types and organs of an organism, building them once."""
+    catalog = get_measurement_catalog(organism, measurement_type=measurement_type)
+    key = (organism, measurement_type)
+    if (key not in celltypexorgan_tables) or (celltypexorgan_tables[key][0] is not catalog):
+        organs = np.array(catalog.organs, dtype=object)
+        ncelltypes_organs = [len(catalog.celltypes[organ]) for organ in organs]
+        # Start from an empty array so that an organism without organs gives an empty table
+        celltypes, codes_celltypes = np.unique(
+            np.concatenate(
+                [np.array([], dtype=object)] + [catalog.celltypes[organ] for organ in organs]
+            ),
+            return_inverse=True,
+        )
+        codes_organs = np.repeat(np.arange(len(organs)), ncelltypes_organs)
+
+        counts = np.zeros((len(celltypes), len(organs)), np.int64)
+        np.add.at(
+            counts,
+            (codes_celltypes, codes_organs),
+            np.concatenate(
+                [np.array([], dtype=np.int64)] + [catalog.cell_counts[organ] for organ in organs]
+            ),
+        )
+        presence = np.zeros((len(celltypes), len(organs)), bool)
+        presence[codes_celltypes, codes_organs] = True
+
+        table = {
+            "celltypes": celltypes,
+            "organs": organs,
+            "counts": counts,
+            "presence": presence,
+        }
+        celltypexorgan_tables[key] = (catalog, table)
+    return celltypexorgan_tables[key][1]
+
+
+def get_celltypexorgan(
+    organism,
+    organs=None,
+    measurement_type="gene_expression",
+    boolean=False,
+):
+    """Get a presence/absence matrix for cell types in organs"""
+    table = _get_celltypexorgan_table(organism, measurement_type=measurement_type)
+
+    # Get organs
+    if organs is None:
+        idx_organs = np.arange(len(table["organs"]))
+    else:
+        for organ in organs:
+            # Check that the organ exists
+            get_organ_catalog(organism, organ, measurement_type=measurement_type)
+        idx_organs = np.searchsorted(table["organs"], sorted(set(organs)))
+
+    # Cell types found in any of those organs
+    idx_celltypes = np.flatnonzero(table["presence"][:, idx_organs].any(axis=1))
+
+    dtype = bool if boolean else int
+    # Cell types are rows, organs are columns
+    data = pd.DataFrame(
+        table["counts"][np.ix_(idx_celltypes, idx_organs)],
+        index=pd.Index(table["celltypes"][idx_celltypes].tolist()),
+        columns=pd.Index(table["organs"][idx_organs].tolist()),
+    ).astype(dtype)
+
+    # Sort from the cell types with the highest abundance
+    # NOTE: a double sort by this and secondarily by organ name might be
+    # even better perhaps
+    data = data.loc[(data != 0).sum(axis=1).sort_values(ascending=False).index]
+
+    return data
+
+
+def _get_celltypes_present(organism, measurement_type="gene_expression"):
+    """Get the cell types with at least one cell in any organ, and which organs those are."""
+    table = _get_celltypexorgan_table(organism, measurement_type=measurement_type)
+    present = table["counts"] > 0
+    idx_celltypes = np.flatnonzero(present.any(axis=1))
+    return table["celltypes"][idx_celltypes], table["organs"], present[idx_celltypes]
+
+
+def _get_manifest_fingerprints(measurement_type="gene_expression"):
+    """Get the fingerprints of the approximation files of all organisms with a measurement type."""
+    return {
+        organism: [int(x) for x in entry["fingerprint"]]
+        for organism, entry in get_manifest().items()
+        if measurement_type in entry["measurement_types"]
+    }
+
+
+def _build_presence_index(organisms, measurement_type="gene_expression"):
+    """Collect where each cell type is found across organisms and organs."""
+    # Start from an empty array so that no organisms give an empty index
+    hits_celltypes = [np.array([], dtype=object)]
+    hits_organisms = [np.array([], dtype=object)]
+    hits_organs = [np.array([], dtype=object)]
+    for organism in organisms:
+        celltypes, organs, present = _get_celltypes_present(
+            organism, measurement_type=measurement_type,
+        )
+        idx_celltypes, idx_organs = present.nonzero()
+        hits_celltypes.append(celltypes[idx_celltypes])
+        hits_organs.append(organs[idx_organs])
+        hits_organisms.append(np.repeat(organism, len(idx_celltypes)))
+
+    celltypes, codes_celltypes = np.unique(np.concatenate(hits_celltypes), return_inverse=True)
+    organisms, codes_organisms = np.unique(np.concatenate(hits_organisms), return_inverse=True)
+    organs, codes_organs = np.unique(np.concatenate(hits_organs), return_inverse=True)
+
+    # Hits sorted by cell type, then organ, then organism, so each cell type is one slice
+    order = np.lexsort((codes_organisms, codes_organs, codes_celltypes))
+    indptr = np.zeros(len(celltypes) + 1, np.int64)
+    indptr[1:] = np.cumsum(np.bincount(codes_celltypes, minlength=len(celltypes)))
+
+    celltypexorganism = np.zeros((len(celltypes), len(organisms)), np.int8)
+    celltypexorganism[codes_celltypes, codes_organisms] = 1
+
+    index = {
+        "celltypes": celltypes.astype(str),
+        "organisms": organisms.astype(str),
+        "organs": organs.astype(str),
+        "celltypexorganism": celltypexorganism,
+        "indptr": indptr,
+        "hit_organisms": codes_organisms[order].astype(np.int32),
+        "hit_organs": codes_organs[order].astype(np.int32),
+    }
+    return index
+
+
+def _load_presence_index(index_path, measurement_type="gene_expression"):
+    """Load the presence index of one measurement type, with the fingerprints it was built from."""
+    with ApproximationFile(index_path) as h5:
+        if measurement_type not in h5:
+            return None, None
+        group = h5[measurement_type]
+        fingerprints = dict(zip(
+            group["fingerprint_organisms"].asstr()[:],
+            group["fingerprints"][:].tolist(),
+        ))
+        index = {
+            "celltypes": group["celltypes"].asstr()[:],
+            "organisms": group["organisms"].asstr()[:],
+            "organs": group["organs"].asstr()[:],
+            "celltypexorganism": group["celltypexorganism"][:],
+            "indptr": group["indptr"][:],
+            "hit_organisms": group["hit_organisms"][:],
+            "hit_organs": group["hit_organs"][:],
+        }
+    return fingerprints, index
+
+
+def get_presence_index(measurement_type="gene_expression"):
+    """Get the presence index of cell types across organisms, rebuilding it if out of date."""
+    index_path = get_presence_index_path()
+    check_due = is_folder_check_due(presence_checks, measurement_type, index_path.parent)
+    if (measurement_type in presence_indices) and (not check_due):
+        return presence_indices[measurement_type][1]
+
+    fingerprints = _get_manifest_fingerprints(measurement_type=measurement_type)
+    if (measurement_type in presence_indices) and (
+        presence_indices[measurement_type][0] == fingerprints
+    ):
+        return presence_indices[measurement_type][1]
+
+    index = None
+    if index_path.exists():
+        fingerprints_index, index = _load_presence_index(
+            index_path, measurement_type=measurement_type,
+        )
+        # The index must have been built from the current approximations
+        if fingerprints_index != fingerprints:
+            index = None
+    if index is None:
+        index = _build_presence_index(sorted(fingerprints), measurement_type=measurement_type)
+
+    index["celltype_positions"] = {
+        celltype: i for i, celltype in enumerate(index["celltypes"])
+    }
+    presence_indices[measurement_type] = (fingerprints, index)
+    return index
+
+
+def load_presence_index():
+    """Load the presence index of all measurement types in memory."""
+    for measurement_type in config["feature_types"]:
+        get_presence_index(measurement_type=measurement_type)
+
+
+def build_presence_index(measurement_types=None):
+    """Precompute the presence index of cell types across organisms and write it to disk."""
+    if measurement_types is None:
+        measurement_types = config["feature_types"]
+
+    index_path = get_presence_index_path()
+    index_path_tmp = index_path.with_name(index_path.name + ".tmp")
+    with ApproximationFile(index_path_tmp, "w") as h5:
+        for measurement_type in measurement_types:
+            fingerprints = _get_manifest_fingerprints(measurement_type=measurement_type)
+            organisms = sorted(fingerprints)
+            index = _build_presence_index(organisms, measurement_type=measurement_type)
+
+            group = h5.create_group(measurement_type)
+            group.create_dataset(
+                "fingerprint_organisms", data=np.array(organisms, dtype=object).astype("S"),
+            )
+            fingerprints_organisms = [fingerprints[organism] for organism in organisms]
+            group.create_dataset(
+                "fingerprints",
+                data=np.array(fingerprints_organisms, np.int64).reshape(-1, 2),
+            )
+            for name in ["celltypes", "organisms", "organs"]:
+                group.create_dataset(name, data=index[name].astype("S"))
+            for name in ["celltypexorganism", "indptr", "hit_organisms", "hit_organs"]:
+                group.create_dataset(name, data=index[name])
+
+    # Replace atomically, so readers never see a partially written index
+    os.replace(index_path_tmp, index_path)
+
+
+def get_organxorganism(
+    celltype,
+    measurement_type="gene_expression",
+):
+    """Get a presence/absence matrix of a cell type across organs and organisms."""
+    index = get_presence_index(measurement_type=measurement_type)
+
+    pos = index["celltype_positions"].get(celltype)
+    if pos is None:
+        return pd.DataFrame(index=pd.Index([]), columns=pd.Index([]), dtype=np.int64)
+
+    start, end = index["indptr"][pos], index["indptr"][pos + 1]
+    idx_organs, codes_organs = np.unique(index["hit_organs"][start:end], return_inverse=True)
+    idx_organisms, codes_organisms = np.unique(
+        index["hit_organisms"][start:end], return_inverse=True,
+    )
+    res = np.zeros((len(idx_organs), len(idx_organisms)), np.int64)
+    res[codes_organs, codes_organisms] = 1
+
+    return pd.DataFrame(
+        res,
+        index=pd.Index(index["organs"][idx_organs].tolist()),
+        columns=pd.Index(index["organisms"][idx_organisms].tolist()),
+    )
+
+
+def get_celltypexorganism(
+    measurement_type="gene_expression",
+):
+    """Get a presence/absence matrix of a cell type across organs and organisms."""
+    index = get_presence_index(measurement_type=measurement_type)
+
+    return pd.DataFrame(
+        index["celltypexorganism"].astype(np.int64),
+        index=pd.Index(index["celltypes"].tolist()),
+        columns=pd.Index(index["organisms"].tolist()),
+    )
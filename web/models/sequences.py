@@ -1,16 +1,58 @@
 """Feature sequences (e.g. genes, transcripts, peaks)"""
+import numpy as np
+
 from config import configuration as config
 from models.paths import get_atlas_path
 from models.utils import ApproximationFile
-from models.features import get_feature_index
+from models.features import resolve_features
 from models.exceptions import (
     FeatureSequencesNotFoundError,
-    FeatureNotFoundError,
     SomeFeaturesNotFoundError,
     MeasurementTypeNotFoundError,
 )
 
 
+def _get_sequence_indices(db, organism, features, measurement_type):
+    """Check that sequences are stored and get the index of each feature."""
+    if measurement_type not in db['measurements']:
+        raise MeasurementTypeNotFoundError(
+            f"Measurement type not found: {measurement_type}",
+            measurement_type=measurement_type,
+        )
+    if 'feature_sequences' not in db['measurements'][measurement_type]:
+        raise FeatureSequencesNotFoundError(
+            "Feature sequences not found",
+            organism=organism,
+        )
+
+    sequence_type = db['measurements'][measurement_type]["feature_sequences"].attrs["type"]
+    resolved = resolve_features(organism, features, measurement_type=measurement_type)
+    if resolved["missing"].any():
+        raise SomeFeaturesNotFoundError(
+            f"Some features not found: {features}",
+            features=list(np.asarray(features, dtype=object)[resolved["missing"]]),
+        )
+    return sequence_type, resolved["index"]
+
+
+def _read_sequences(db_sequences, index):
+    """Read the sequences at some indices with a single selection.
+
+    NOTE: vlen strings are read one HDF5 call per selection, so the indices are sorted and
+    deduplicated first, and read as one contiguous slice if they are dense enough.
+    """
+    idx_unique, idx_inverse = np.unique(index, return_inverse=True)
+    if len(idx_unique) == 0:
+        return np.array([], dtype=object)
+
+    start, stop = idx_unique[0], idx_unique[-1] + 1
+    if stop - start <= 4 * len(idx_unique):
+        sequences = db_sequences.asstr()[start:stop][idx_unique - start]
+    else:
+        sequences = db_sequences.asstr()[idx_unique]
+    return sequences[idx_inverse]
+
+
 def get_feature_sequences(
     organism,
     features,
@@ -19,38 +61,40 @@ def get_feature_sequences(
     """Get the sequences of a list of features."""
     approx_path = get_atlas_path(organism)
     with ApproximationFile(approx_path) as db:
-        if measurement_type not in db['measurements']:
-            raise MeasurementTypeNotFoundError(
-                f"Measurement type not found: {measurement_type}",
-                measurement_type=measurement_type,
-            )
-        if 'feature_sequences' not in db['measurements'][measurement_type]:
-            raise FeatureSequencesNotFoundError(
-                "Feature sequences not found",
-                organism=organism,
-            )
-
-        sequence_type = db['measurements'][measurement_type]["feature_sequences"].attrs["type"]
-        sequences = []
-        features_not_found = []
-        for fea in features:
-            try:
-                idx = get_feature_index(organism, fea.lower(), measurement_type)
-            except FeatureNotFoundError as exc:
-                features_not_found.append(fea)
-                continue
-
-            # If there are features not found, don't bother collecting sequences anymore
-            if len(features_not_found):
-                continue
-
-            seq = db['measurements'][measurement_type]["feature_sequences"]["sequences"].asstr()[idx]
-            sequences.append(seq)
-
-        if len(features_not_found):
-            raise SomeFeaturesNotFoundError(
-                f"Some features not found: {features}",
-                features=features_not_found,
-            )
-
-    return features, sequences, sequence_type
+        sequence_type, index = _get_sequence_indices(db, organism, features, measurement_type)
+        db_sequences = db['measurements'][measurement_type]["feature_sequences"]["sequences"]
+        sequences = _read_sequences(db_sequences, index)
+
+    return features, list(sequences), sequence_type
+
+
+def get_feature_sequences_fasta(
+    organism,
+    features,
+    measurement_type="gene_expression",
+    batch_size=1000,
+):
+    """Get the sequences of a list of features as a stream of FASTA records.
+
+    Features are checked right away, so errors are raised before anything is streamed. The
+    sequences are then read in batches, which bounds memory use for large requests.
+
+    Returns:
+        pair with the sequence type and a generator of FASTA records (strings).
+    """
+    approx_path = get_atlas_path(organism)
+    with ApproximationFile(approx_path) as db:
+        sequence_type, index = _get_sequence_indices(db, organism, features, measurement_type)
+
+    def iter_fasta():
+        with ApproximationFile(approx_path) as db:
+            db_sequences = db['measurements'][measurement_type]["feature_sequences"]["sequences"]
+            for start in range(0, len(index), batch_size):
+                stop = start + batch_size
+                sequences = _read_sequences(db_sequences, index[start:stop])
+                yield "".join(
+                    f">{feature}\n{sequence}\n"
+                    for feature, sequence in zip(features[start:stop], sequences)
+                )
+
+    return sequence_type, iter_fasta()
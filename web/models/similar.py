@@ -5,91 +5,256 @@ from models.exceptions import (
     CellTypeNotFoundError,
     SimilarityMethodError,
 )
+from models.paths import get_atlas_path
+from models.utils import (
+    ApproximationFile,
+    read_columns,
+)
 from models.features import (
     get_features,
+    get_feature_index,
     get_feature_names,
 )
-from models.measurement import get_measurement
-from models.celltypes import get_celltype_index
+from models.catalog import get_organ_catalog
+from models.feature_store import get_feature_profiles
+from models.celltypes import get_organ_celltype_index
+from models.quantisation import get_quantisation
+from models.topk import top_k
+from models.similar_index import lookup_similar_features
+from models.similar_ann import get_ann_candidates
 
 
-def get_similar_features(
-    organism,
-    organ,
-    feature_name,
-    number=10,
-    method="correlation",
-    measurement_type="gene_expression",
-    similar_type="gene_expression",
-):
-    """Get features similar to the focal one."""
-    features_lowercase = get_features(
-        organism,
-        measurement_type=similar_type,
-    )
+def _get_distances(mat, vector, method):
+    """Get the distance between each column of a matrix and a focal vector.
 
-    idx = (features_lowercase == feature_name.lower()).nonzero()[0][0]
+    Args:
+        mat: numpy 2D array, with cell types as rows.
+        vector: numpy 1D array, the focal profile across the same cell types.
+        method: "correlation", "cosine", "euclidean", "manhattan", or "log-euclidean".
 
+    Returns:
+        numpy 1D array with one distance per column.
+    """
     if method in ("correlation", "cosine"):
-        if similar_type == measurement_type == 'gene_expression':
-            measurement_subtype = 'fraction'
-        else:
-            measurement_subtype = 'average'
-        fracs = get_measurement(
-            organism,
-            features=None,
-            organ=organ,
-            measurement_type=similar_type,
-            measurement_subtype=measurement_subtype,
-        )
-        frac = fracs[:, idx]
-
         if method == "correlation":
             # Center around 0
-            dm = fracs - fracs.mean(axis=0)
-            db = frac - frac.mean()
+            dm = mat - mat.mean(axis=0)
+            db = vector - vector.mean()
         else:
-            dm = fracs
-            db = frac
+            dm = mat
+            db = vector
 
         # Compute covariance and then correlation
         num = dm.T @ db
         den = np.sqrt((dm**2).sum(axis=0) * (db @ db))
         corr = num / (den + 1e-9)
-        delta = 1 - corr
+        return 1 - corr
+
+    if method == "log-euclidean":
+        mat = np.log(mat + 1e-3)
+        vector = np.log(vector + 1e-3)
+
+    if method == "euclidean":
+        return np.sqrt(((mat.T - vector)**2).mean(axis=1))
 
-    elif method in ("euclidean", "manhattan", "log-euclidean"):
-        avgs = get_measurement(
+    return (np.abs((mat.T - vector))).mean(axis=1)
+
+
+def _get_similar_features_ann(
+    organism,
+    organ,
+    idx,
+    number,
+    method,
+    measurement_type,
+    measurement_subtype,
+):
+    """Find the closest features to a focal one among the candidates of the LSH index.
+
+    Returns:
+        pair of numpy 1D arrays with the indices of the closest features (including the focal
+        one itself, usually first) and their distances, or None if there is no index or it
+        yields too few candidates.
+    """
+    # Check that the organ exists
+    get_organ_catalog(organism, organ, measurement_type=measurement_type)
+
+    approx_path = get_atlas_path(organism)
+    with ApproximationFile(approx_path) as db:
+        db_dataset = db["measurements"][measurement_type]["data"]["tissue->celltype"][organ][
+            measurement_subtype
+        ]
+        if "quantisation" in db["measurements"][measurement_type]:
+            quantisation = get_quantisation(organism, measurement_type)
+        else:
+            quantisation = None
+
+        vector = read_columns(db_dataset, np.array([idx]))[:, 0]
+        if quantisation is not None:
+            vector = quantisation[vector]
+
+        candidates = get_ann_candidates(
             organism,
-            features=None,
-            organ=organ,
-            measurement_type=similar_type,
-            measurement_subtype="average",
+            organ,
+            vector,
+            method=method,
+            measurement_type=measurement_type,
         )
-        if method == "log-euclidean":
-            avgs = np.log(avgs + 1e-3)
+        if (candidates is None) or (len(candidates) < number):
+            return None
+
+        # Rerank the candidates with the exact distance
+        mat = read_columns(db_dataset, candidates)
+        if quantisation is not None:
+            mat = quantisation[mat]
+
+    delta = _get_distances(mat, vector, method)
+    idx_best = top_k(delta, number, largest=False)
+    return candidates[idx_best], delta[idx_best]
 
-        avg = avgs[:, idx]
 
-        if method == "euclidean":
-            delta = np.sqrt(((avgs.T - avg)**2).mean(axis=1))
+def _get_similar_features_blocked(
+    organism,
+    organ,
+    idx,
+    number,
+    method,
+    measurement_type,
+    measurement_subtype,
+    block_size=65536,
+):
+    """Find the closest features to a focal one, streaming the organ in column blocks.
+
+    Only one block of features is in memory at a time, together with a running shortlist of
+    the best candidates, so memory use does not grow with the number of features (~1M for
+    chromatin peaks).
+
+    Returns:
+        pair of numpy 1D arrays with the indices of the closest features (including the focal
+        one itself, usually first) and their distances.
+    """
+    # Check that the organ exists
+    get_organ_catalog(organism, organ, measurement_type=measurement_type)
+
+    approx_path = get_atlas_path(organism)
+    with ApproximationFile(approx_path) as db:
+        db_dataset = db["measurements"][measurement_type]["data"]["tissue->celltype"][organ][
+            measurement_subtype
+        ]
+        if "quantisation" in db["measurements"][measurement_type]:
+            quantisation = get_quantisation(organism, measurement_type)
         else:
-            delta = (np.abs((avgs.T - avg))).mean(axis=1)
+            quantisation = None
 
-    else:
+        # Align blocks with chunks, so each chunk is decompressed once
+        if db_dataset.chunks is not None:
+            block_size = max(1, block_size // db_dataset.chunks[1]) * db_dataset.chunks[1]
+
+        vector = read_columns(db_dataset, np.array([idx]))[:, 0]
+        if quantisation is not None:
+            vector = quantisation[vector]
+
+        nfeatures = db_dataset.shape[1]
+        idx_candidates = np.zeros(0, np.int64)
+        delta_candidates = np.zeros(0, vector.dtype)
+        for start in range(0, nfeatures, block_size):
+            mat = db_dataset[:, start:min(start + block_size, nfeatures)]
+            if quantisation is not None:
+                mat = quantisation[mat]
+            delta = _get_distances(mat, vector, method)
+
+            # Keep the best of this block, in feature order so ties stay deterministic
+            idx_block = np.sort(top_k(delta, number, largest=False))
+            idx_candidates = np.concatenate([idx_candidates, start + idx_block])
+            delta_candidates = np.concatenate([delta_candidates, delta[idx_block]])
+
+            idx_keep = np.sort(top_k(delta_candidates, number, largest=False))
+            idx_candidates = idx_candidates[idx_keep]
+            delta_candidates = delta_candidates[idx_keep]
+
+    idx_best = top_k(delta_candidates, number, largest=False)
+    return idx_candidates[idx_best], delta_candidates[idx_best]
+
+
+def get_similar_features(
+    organism,
+    organ,
+    feature_name,
+    number=10,
+    method="correlation",
+    measurement_type="gene_expression",
+    similar_type="gene_expression",
+    exact=False,
+):
+    """Get features similar to the focal one.
+
+    NOTE: if there is an up-to-date cache of nearest features (see models/similar_index.py),
+    the result is looked up. Otherwise, unless exact is True, an approximate nearest neighbour
+    index is used if there is one (see models/similar_ann.py, usually only for chromatin
+    accessibility). Otherwise, the organ is streamed from disk.
+    """
+    idx = get_feature_index(
+        organism,
+        feature_name,
+        measurement_type=similar_type,
+    )
+
+    if method not in ("correlation", "cosine", "euclidean", "manhattan", "log-euclidean"):
         raise SimilarityMethodError(
             f"Similarity method invalid: {method}",
             method=method,
         )
 
+    cached = None
+    if similar_type == measurement_type:
+        cached = lookup_similar_features(
+            organism,
+            organ,
+            idx,
+            number,
+            method=method,
+            measurement_type=measurement_type,
+        )
+
+    if cached is not None:
+        idx_max, delta_similar = cached
+    else:
+        if (method in ("correlation", "cosine")) and (similar_type == measurement_type == 'gene_expression'):
+            measurement_subtype = 'fraction'
+        else:
+            measurement_subtype = 'average'
+
+        closest = None
+        if (not exact) and (similar_type == measurement_type) and (method in ("correlation", "cosine")):
+            closest = _get_similar_features_ann(
+                organism,
+                organ,
+                idx,
+                number + 1,
+                method,
+                similar_type,
+                measurement_subtype,
+            )
+        if closest is None:
+            closest = _get_similar_features_blocked(
+                organism,
+                organ,
+                idx,
+                number + 1,
+                method,
+                similar_type,
+                measurement_subtype,
+            )
+
+        # The closest one is the focal feature itself
+        idx_max, delta_similar = closest[0][1:], closest[1][1:]
+
     # Take closest features
     features_all = get_feature_names(
         organism,
         measurement_type=measurement_type,
     )
-    idx_max = delta.argsort()[1:number+1]
     similar = features_all[idx_max]
-    delta_similar = delta[idx_max]
 
     return {
         'features': similar,
@@ -112,104 +277,42 @@ def get_similar_celltypes(
     "euclidean" will be used instead because those metrics are not defined if there
     is only one sample (i.e. feature).
     """
-    from models import (
-        get_organs,
-        get_celltypes,
-    )
-
     if (len(features) == 1) and (method in ("correlation", "cosine")):
         method = "euclidean"
 
-    celltypes = []
-    organs = []
-    if method in ("correlation", "cosine"):
-        fracs = []
-        for organ_i in get_organs(organism, measurement_type):
-            celltypes_i = list(get_celltypes(
-                organism,
-                organ_i,
-                measurement_type,
-            ))
-            fracs_i = get_measurement(
-                organism,
-                features=features,
-                organ=organ_i,
-                measurement_type=measurement_type,
-                measurement_subtype="fraction",
-            )
-            if organ_i == organ:
-                celltype_index_dict = get_celltype_index(
-                    celltype, celltypes_i,
-                )
-                celltype = celltype_index_dict['celltype']
-                idx = celltype_index_dict['index']
-                frac = fracs_i[:, idx]
-            celltypes.extend(celltypes_i)
-            organs.extend([organ_i for ct in celltypes_i])
-            fracs.append(fracs_i)
-        # Take the transpose to share code with similar features
-        fracs = np.hstack(fracs)
-
-        if method == "correlation":
-            # Center around 0
-            dm = fracs - fracs.mean(axis=0)
-            db = frac - frac.mean()
-        else:
-            dm = fracs
-            db = frac
-
-        # Compute covariance and then correlation
-        num = dm.T @ db
-        den = np.sqrt((dm**2).sum(axis=0) * (db @ db))
-        corr = num / (den + 1e-9)
-        delta = 1 - corr
-
-    elif method in ("euclidean", "manhattan", "log-euclidean"):
-        avgs = []
-        for organ_i in get_organs(organism, measurement_type):
-            celltypes_i = list(get_celltypes(
-                organism,
-                organ_i,
-                measurement_type,
-            ))
-            avgs_i = get_measurement(
-                organism,
-                features=features,
-                organ=organ_i,
-                measurement_type=measurement_type,
-                measurement_subtype="average",
-            )
-            if organ_i == organ:
-                celltype_index_dict = get_celltype_index(
-                    celltype, celltypes_i,
-                )
-                celltype = celltype_index_dict['celltype']
-                idx = celltype_index_dict['index']
-                avg = avgs_i[:, idx]
-            celltypes.extend(celltypes_i)
-            organs.extend([organ_i for ct in celltypes_i])
-            avgs.append(avgs_i)
-        # Take the transpose to share code with similar features
-        avgs = np.hstack(avgs)
-
-        if method == "log-euclidean":
-            avgs = np.log(avgs + 1e-3)
-
-        if method == "euclidean":
-            delta = np.sqrt(((avgs.T - avg)**2).mean(axis=1))
-        else:
-            delta = (np.abs((avgs.T - avg))).mean(axis=1)
-
-    else:
+    if method not in ("correlation", "cosine", "euclidean", "manhattan", "log-euclidean"):
         raise SimilarityMethodError(
             f"Similarity method invalid: {method}",
             method=method,
         )
 
-    # Take closest features
-    idx_max = delta.argsort()[1:number+1]
-    celltypes_similar = np.array(celltypes)[idx_max]
-    organs_similar = np.array(organs)[idx_max]
+    # Features are resolved once and all organs are read through a single handle (or from
+    # the feature-major store). Organs are read one after the other: h5py holds a global
+    # lock, so threads would not read in parallel anyway.
+    profiles = get_feature_profiles(
+        organism,
+        features,
+        measurement_type=measurement_type,
+    )
+    celltypes = profiles["celltypes"]
+    organs = profiles["organs"]
+
+    # Locate the focal cell type among all (organ, cell type) columns
+    celltype_index_dict = get_organ_celltype_index(
+        organism, organ, celltype, measurement_type=measurement_type,
+    )
+    idx = np.flatnonzero(organs == organ)[celltype_index_dict['index']]
+
+    if method in ("correlation", "cosine"):
+        mat = profiles["fraction"]
+    else:
+        mat = profiles["average"]
+    delta = _get_distances(mat, mat[:, idx], method)
+
+    # Take closest cell types (the closest one is the focal one itself)
+    idx_max = top_k(delta, number + 1, largest=False)[1:]
+    celltypes_similar = celltypes[idx_max]
+    organs_similar = organs[idx_max]
     delta_similar = delta[idx_max]
 
     return {
@@ -0,0 +1,227 @@
+"""Approximate nearest neighbours for similar features, using random-projection LSH.
+
+Chromatin accessibility has ~1M peaks, so even a streamed exact scan of an organ is slow.
+This index hashes every feature profile (across the cell types of an organ) with several
+tables of random hyperplanes: the hash bits are the signs of the projections, so features
+pointing in similar directions (cosine, or correlation after centering) tend to share
+buckets. A query only looks at the buckets of the focal feature, plus those one bit away,
+and the caller reranks those candidates with the exact distance.
+
+The index is built offline per (organism, measurement type, method, organ) and written next
+to the approximation file (see build_indices.py). Buckets are read from disk on demand, so
+memory use does not grow with the number of peaks.
+"""
+import os
+import numpy as np
+import hdf5plugin
+
+from models.paths import (
+    get_atlas_path,
+    get_similar_ann_path,
+)
+from models.utils import (
+    ApproximationFile,
+    get_file_fingerprint,
+    get_source_fingerprint,
+    read_columns,
+)
+from models.catalog import get_measurement_catalog
+from models.quantisation import get_quantisation
+from models.topk import top_k
+
+
+# Number of set bits in each byte, to compute Hamming distances between hash codes
+_popcount_byte = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+# This dict has organisms as keys and (index file fingerprint, source fingerprint) tuples
+# as values
+similar_ann_indices = {}
+
+
+def _get_hash_codes(mat, hyperplanes, method):
+    """Hash the columns of a matrix into one integer code per table.
+
+    Args:
+        mat: numpy 2D array with cell types as rows and features as columns.
+        hyperplanes: numpy 3D array (tables x bits x cell types).
+
+    Returns:
+        numpy 2D array (tables x features) of codes.
+    """
+    if method == "correlation":
+        # Center around 0
+        mat = mat - mat.mean(axis=0)
+    ntables, nbits, ncelltypes = hyperplanes.shape
+    bits = (hyperplanes.reshape(ntables * nbits, ncelltypes) @ mat) > 0
+    bits = bits.reshape(ntables, nbits, -1)
+    powers = 1 << np.arange(nbits, dtype=np.int64)
+    return np.einsum("tbf,b->tf", bits, powers)
+
+
+def get_ann_candidates(
+    organism,
+    organ,
+    vector,
+    method="correlation",
+    measurement_type="chromatin_accessibility",
+    max_candidates=1024,
+):
+    """Get candidate neighbours of a focal feature from the LSH index.
+
+    Args:
+        vector: numpy 1D array, the focal feature profile across the cell types of the organ.
+        max_candidates: Keep at most this many candidates, preferring those whose hash codes
+            are closest to the focal one across all tables (Hamming distance, which estimates
+            the angle between profiles). This bounds the cost of reranking.
+
+    Returns:
+        sorted numpy 1D array of feature indices (including the focal feature itself), or None
+        if there is no up-to-date index for this organ and method.
+    """
+    index_path = get_similar_ann_path(organism)
+    if not index_path.exists():
+        return None
+
+    fingerprint = get_file_fingerprint(index_path)
+    if (organism not in similar_ann_indices) or (similar_ann_indices[organism][0] != fingerprint):
+        with ApproximationFile(index_path) as h5:
+            source = (int(h5.attrs["source_mtime_ns"]), int(h5.attrs["source_size"]))
+        similar_ann_indices[organism] = (fingerprint, source)
+
+    # The index must have been built from the current approximation
+    if similar_ann_indices[organism][1] != get_source_fingerprint(get_atlas_path(organism)):
+        return None
+
+    with ApproximationFile(index_path) as h5:
+        key = f"{measurement_type}/{method}/{organ}"
+        if key not in h5:
+            return None
+        group = h5[key]
+
+        hyperplanes = group["hyperplanes"][:]
+        codes = _get_hash_codes(vector[:, None], hyperplanes, method)[:, 0]
+
+        # Probe the focal bucket and all buckets one bit away, in each table
+        nbits = hyperplanes.shape[1]
+        flips = np.concatenate([[0], 1 << np.arange(nbits, dtype=np.int64)])
+        db_offsets = group["offsets"]
+        db_order = group["order"]
+        candidates = []
+        for table, code in enumerate(codes):
+            codes_probe = np.unique(code ^ flips)
+            # Bucket i spans offsets[i] to offsets[i + 1], read both ends at once
+            idx_offsets = np.union1d(codes_probe, codes_probe + 1)
+            offsets = dict(zip(idx_offsets, db_offsets[table, idx_offsets]))
+            for code_probe in codes_probe:
+                start, stop = offsets[code_probe], offsets[code_probe + 1]
+                if stop > start:
+                    candidates.append(db_order[table, start:stop])
+
+        if len(candidates) == 0:
+            return np.zeros(0, np.int64)
+        candidates = np.unique(np.concatenate(candidates))
+
+        if len(candidates) > max_candidates:
+            codes_candidates = read_columns(group["codes"], candidates)
+            xor = (codes_candidates ^ codes[:, None].astype(np.int32)).view(np.uint8)
+            hamming = _popcount_byte[xor].reshape(len(codes), len(candidates), -1).sum(axis=(0, 2))
+            candidates = np.sort(candidates[top_k(hamming, max_candidates, largest=False)])
+
+    return candidates
+
+
+def build_similar_ann(
+    organism,
+    methods=("correlation", "cosine"),
+    measurement_types=("chromatin_accessibility",),
+    ntables=10,
+    nbits=None,
+    bucket_size=16,
+    block_size=65536,
+    seed=0,
+):
+    """Build the LSH index of feature profiles in every organ.
+
+    Args:
+        methods: Similarity methods, among "correlation" and "cosine".
+        measurement_types: Measurement types to include.
+        ntables: Number of hash tables. More tables mean higher recall and more candidates.
+        nbits: Bits per hash. None picks it so that buckets hold ~bucket_size features.
+        block_size: Number of features hashed at a time, to bound memory usage.
+        seed: Seed for the random hyperplanes.
+    """
+    for method in methods:
+        if method not in ("correlation", "cosine"):
+            raise ValueError(f"Approximate neighbours are only available for correlation and cosine: {method}")
+
+    rng = np.random.default_rng(seed)
+    approx_path = get_atlas_path(organism)
+    source_fingerprint = get_source_fingerprint(approx_path)
+
+    index_path = get_similar_ann_path(organism)
+    index_path_tmp = index_path.with_name(index_path.name + ".tmp")
+    with ApproximationFile(approx_path) as db, ApproximationFile(index_path_tmp, "w") as h5:
+        h5.attrs["source_mtime_ns"] = source_fingerprint[0]
+        h5.attrs["source_size"] = source_fingerprint[1]
+
+        for measurement_type in measurement_types:
+            if measurement_type not in db["measurements"]:
+                continue
+            db_mt = db["measurements"][measurement_type]
+            catalog = get_measurement_catalog(organism, measurement_type=measurement_type)
+            if "quantisation" in db_mt:
+                quantisation = get_quantisation(organism, measurement_type)
+            else:
+                quantisation = None
+
+            # Same measurement subtype as the exact computation
+            if measurement_type == "gene_expression":
+                measurement_subtype = "fraction"
+            else:
+                measurement_subtype = "average"
+
+            for organ in catalog.organs:
+                db_dataset = db_mt["data"]["tissue->celltype"][organ][measurement_subtype]
+                ncelltypes, nfeatures = db_dataset.shape
+                nbits_organ = nbits
+                if nbits_organ is None:
+                    nbits_organ = int(np.clip(np.round(np.log2(nfeatures / bucket_size)), 1, 24))
+
+                for method in methods:
+                    hyperplanes = rng.standard_normal(
+                        (ntables, nbits_organ, ncelltypes),
+                    ).astype(np.float32)
+
+                    codes = np.empty((ntables, nfeatures), np.int32)
+                    for start in range(0, nfeatures, block_size):
+                        stop = min(start + block_size, nfeatures)
+                        mat = db_dataset[:, start:stop]
+                        if quantisation is not None:
+                            mat = quantisation[mat]
+                        codes[:, start:stop] = _get_hash_codes(mat, hyperplanes, method)
+
+                    # Buckets as CSR: features sorted by code, and where each code starts.
+                    # Small chunks, since queries read a few short slices
+                    order = np.argsort(codes, axis=1, kind="stable").astype(np.int32)
+                    offsets = np.zeros((ntables, (1 << nbits_organ) + 1), np.int64)
+                    for table in range(ntables):
+                        counts = np.bincount(codes[table], minlength=1 << nbits_organ)
+                        offsets[table, 1:] = np.cumsum(counts)
+
+                    group = h5.create_group(f"{measurement_type}/{method}/{organ}")
+                    group.create_dataset("hyperplanes", data=hyperplanes)
+                    group.create_dataset(
+                        "offsets", data=offsets,
+                        chunks=(1, min(4096, offsets.shape[1])), **hdf5plugin.Zstd(),
+                    )
+                    group.create_dataset(
+                        "codes", data=codes,
+                        chunks=(ntables, min(4096, nfeatures)), **hdf5plugin.Zstd(),
+                    )
+                    group.create_dataset(
+                        "order", data=order,
+                        chunks=(1, min(1024, nfeatures)), **hdf5plugin.Zstd(),
+                    )
+
+    # Replace atomically, so readers never see a partially written index
+    os.replace(index_path_tmp, index_path)
@@ -0,0 +1,169 @@
+"""Precomputed nearest features within each organ, stored next to the approximation file.
+
+Similar features are found by comparing the focal feature with every other one in the
+organ, which means streaming the whole organ from disk on every request. The cache stores
+the closest features of every feature (top 100 by default, the API returns at most 50), so
+repeat queries are a single row read. It is built offline (see build_indices.py) for the
+correlation and cosine methods, which can be computed for all features at once as matrix
+products; other methods, or a missing or out-of-date cache, are computed on the fly.
+
+NOTE: distances in the cache agree with the on-the-fly computation up to floating point
+rounding, so the order of nearly tied features might differ.
+"""
+import os
+import numpy as np
+import hdf5plugin
+
+from models.paths import (
+    get_atlas_path,
+    get_similar_features_path,
+)
+from models.utils import (
+    ApproximationFile,
+    get_file_fingerprint,
+    get_source_fingerprint,
+)
+from models.catalog import get_measurement_catalog
+from models.quantisation import get_quantisation
+from models.topk import top_k
+
+
+# This dict has organisms as keys and (cache file fingerprint, metadata) tuples as values
+similar_indices = {}
+
+
+def _load_similar_index_metadata(index_path):
+    with ApproximationFile(index_path) as h5:
+        return {
+            "number": int(h5.attrs["number"]),
+            "source": (int(h5.attrs["source_mtime_ns"]), int(h5.attrs["source_size"])),
+        }
+
+
+def lookup_similar_features(
+    organism,
+    organ,
+    idx,
+    number,
+    method="correlation",
+    measurement_type="gene_expression",
+):
+    """Look up the features closest to a focal one (excluding itself).
+
+    Returns:
+        pair of numpy 1D arrays with the indices of the closest features and their distances,
+        or None if they are not in the cache, in which case the caller should compute them.
+    """
+    index_path = get_similar_features_path(organism)
+    if not index_path.exists():
+        return None
+
+    fingerprint = get_file_fingerprint(index_path)
+    if (organism not in similar_indices) or (similar_indices[organism][0] != fingerprint):
+        similar_indices[organism] = (fingerprint, _load_similar_index_metadata(index_path))
+    metadata = similar_indices[organism][1]
+
+    # The cache must have been built from the current approximation
+    if metadata["source"] != get_source_fingerprint(get_atlas_path(organism)):
+        return None
+    if number > metadata["number"]:
+        return None
+
+    with ApproximationFile(index_path) as h5:
+        key = f"{measurement_type}/{method}/{organ}"
+        if key not in h5:
+            return None
+        group = h5[key]
+        neighbors = group["neighbors"][idx, :number]
+        distances = group["distances"][idx, :number]
+
+    # Organs with fewer features than stored neighbors are padded with -1
+    found = neighbors >= 0
+    return neighbors[found], distances[found]
+
+
+def _get_nearest_features(mat, method, number, block_size=1024):
+    """Get the nearest features of every feature (columns of mat), excluding the feature itself."""
+    if method == "correlation":
+        # Center around 0
+        mat = mat - mat.mean(axis=0)
+    sum_squares = (mat**2).sum(axis=0)
+
+    nfeatures = mat.shape[1]
+    neighbors = -np.ones((nfeatures, number), np.int32)
+    distances = np.full((nfeatures, number), np.nan, np.float32)
+    for start in range(0, nfeatures, block_size):
+        stop = min(start + block_size, nfeatures)
+
+        # Covariance and then correlation, for a block of focal features at once
+        num = mat[:, start:stop].T @ mat
+        den = np.sqrt(np.outer(sum_squares[start:stop], sum_squares))
+        delta = 1 - num / (den + 1e-9)
+
+        for i, delta_i in enumerate(delta):
+            # The closest one is the focal feature itself
+            idx_i = top_k(delta_i, number + 1, largest=False)[1:]
+            neighbors[start + i, :len(idx_i)] = idx_i
+            distances[start + i, :len(idx_i)] = delta_i[idx_i]
+
+    return neighbors, distances
+
+
+def build_similar_index(
+    organism,
+    number=100,
+    methods=("correlation",),
+    measurement_types=("gene_expression",),
+):
+    """Precompute the nearest features of every feature in every organ.
+
+    Args:
+        number: How many neighbors to store per feature.
+        methods: Similarity methods, among "correlation" and "cosine".
+        measurement_types: Measurement types to include. Chromatin accessibility has ~1M
+            features, so all-vs-all neighbors are expensive to compute.
+    """
+    for method in methods:
+        if method not in ("correlation", "cosine"):
+            raise ValueError(f"Similar features can only be precomputed for correlation and cosine: {method}")
+
+    approx_path = get_atlas_path(organism)
+    source_fingerprint = get_source_fingerprint(approx_path)
+
+    index_path = get_similar_features_path(organism)
+    index_path_tmp = index_path.with_name(index_path.name + ".tmp")
+    with ApproximationFile(approx_path) as db, ApproximationFile(index_path_tmp, "w") as h5:
+        h5.attrs["number"] = number
+        h5.attrs["source_mtime_ns"] = source_fingerprint[0]
+        h5.attrs["source_size"] = source_fingerprint[1]
+
+        for measurement_type in measurement_types:
+            if measurement_type not in db["measurements"]:
+                continue
+            db_mt = db["measurements"][measurement_type]
+            catalog = get_measurement_catalog(organism, measurement_type=measurement_type)
+
+            # Same measurement subtype as the on-the-fly computation
+            if measurement_type == "gene_expression":
+                measurement_subtype = "fraction"
+            else:
+                measurement_subtype = "average"
+
+            for organ in catalog.organs:
+                mat = db_mt["data"]["tissue->celltype"][organ][measurement_subtype][:]
+                if "quantisation" in db_mt:
+                    mat = get_quantisation(organism, measurement_type)[mat]
+
+                for method in methods:
+                    neighbors, distances = _get_nearest_features(mat, method, number)
+                    group = h5.create_group(f"{measurement_type}/{method}/{organ}")
+                    chunks = (min(64, len(neighbors)), number)
+                    group.create_dataset(
+                        "neighbors", data=neighbors, chunks=chunks, **hdf5plugin.Zstd(),
+                    )
+                    group.create_dataset(
+                        "distances", data=distances, chunks=chunks, **hdf5plugin.Zstd(),
+                    )
+
+    # Replace atomically, so readers never see a partially written cache
+    os.replace(index_path_tmp, index_path)
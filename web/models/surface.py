@@ -1,19 +1,53 @@
-import h5py
+import numpy as np
+import pandas as pd
 
 from config import configuration as config
-
+from models.utils import (
+    ApproximationFile,
+    get_file_fingerprint,
+)
 from models.exceptions import (
     OrganismNotFoundError,
 )
+from models.features import get_feature_names
+
+
+# This dict has organisms as keys and (surface file fingerprint, genes) tuples as values
+surface_genes = {}
+
+# This dict has (organism, measurement_type) as keys and (surface file fingerprint, features,
+# columns) tuples as values, where columns are the sorted indices of surface features
+surface_columns = {}
 
 
 def get_surface_genes(organism):
     """Get the genes that encode for cell surface proteins in an organism."""
-    with h5py.File(config['paths']['surface_genes']) as h5:
-        if organism not in h5:
-            raise OrganismNotFoundError(
-                f"Surface genes not available for organism: {organism}",
-                organism=organism,
-            )
-        genes = h5[organism].asstr()[:]
-    return genes
+    fn_surface = config['paths']['surface_genes']
+    fingerprint = get_file_fingerprint(fn_surface)
+    if (organism not in surface_genes) or (surface_genes[organism][0] != fingerprint):
+        with ApproximationFile(fn_surface) as h5:
+            if organism not in h5:
+                raise OrganismNotFoundError(
+                    f"Surface genes not available for organism: {organism}",
+                    organism=organism,
+                )
+            genes = h5[organism].asstr()[:]
+        surface_genes[organism] = (fingerprint, genes)
+    return surface_genes[organism][1]
+
+
+def get_surface_columns(organism, measurement_type="gene_expression"):
+    """Get the surface features of an organism and their columns in the approximation file.
+
+    Returns:
+        pair of numpy 1D arrays, with the surface feature names and their sorted indices
+        among all features.
+    """
+    key = (organism, measurement_type)
+    fingerprint = get_file_fingerprint(config['paths']['surface_genes'])
+    if (key not in surface_columns) or (surface_columns[key][0] != fingerprint):
+        genes = get_surface_genes(organism)
+        features = get_feature_names(organism, measurement_type)
+        columns = np.flatnonzero(pd.Index(features).isin(genes))
+        surface_columns[key] = (fingerprint, features[columns], columns)
+    return surface_columns[key][1:]
@@ -0,0 +1,87 @@
+"""Top-k selection shared by the ranking functions (markers, similarity, highest measurement).
+
+Ranking endpoints score up to ~1M features but only return a handful of them, so sorting
+all scores is wasted work. These helpers partition first (linear time) and sort only the
+selected entries. Ties are always broken by position (lowest index first) and NaN scores
+are ranked last, so results do not depend on the sorting algorithm.
+"""
+import numpy as np
+
+
+def _get_sort_keys(values, largest):
+    """Convert values into float keys where smaller is better and NaN is worst."""
+    values = np.asarray(values)
+    # Negating floats is exact, so keep their precision; integers might overflow
+    dtype = values.dtype if values.dtype.kind == "f" else np.float64
+    keys = values.astype(dtype)
+    if largest:
+        np.negative(keys, out=keys)
+    keys[np.isnan(keys)] = np.inf
+    return keys
+
+
+def top_k(values, number, largest=True):
+    """Get the indices of the top values, best first.
+
+    Args:
+        values: numpy 1D array of scores.
+        number: How many indices to return (fewer if there are not enough values).
+        largest: Whether higher values are better (e.g. averages) or lower ones (e.g.
+            distances).
+
+    Returns:
+        numpy 1D array of indices into values.
+    """
+    keys = _get_sort_keys(values, largest)
+    number = min(number, len(keys))
+    if number <= 0:
+        return np.zeros(0, np.intp)
+
+    if number < len(keys):
+        # Partition around the k-th best key, then keep everything strictly better plus
+        # as many ties as needed, taking the lowest indices first
+        threshold = np.partition(keys, number - 1)[number - 1]
+        idx_better = np.flatnonzero(keys < threshold)
+        idx_ties = np.flatnonzero(keys == threshold)[:number - len(idx_better)]
+        idx = np.concatenate([idx_better, idx_ties])
+    else:
+        idx = np.arange(len(keys))
+
+    # Sort the few selected entries, by key first and index second
+    return idx[np.lexsort((idx, keys[idx]))]
+
+
+def top_k_per_group(values, groups, number, largest=True):
+    """Get the indices of the top values within each group, best first within each group.
+
+    Args:
+        values: numpy 1D array of scores.
+        groups: Sequence with the group (e.g. organ) of each value.
+        number: How many indices to return per group.
+        largest: Whether higher values are better or lower ones.
+
+    Returns:
+        numpy 1D array of indices into values. Groups are listed in order of first
+        appearance.
+    """
+    groups = np.asarray(groups)
+    if len(groups) == 0:
+        return np.zeros(0, np.intp)
+
+    group_names, idx_first, group_codes = np.unique(
+        groups, return_index=True, return_inverse=True,
+    )
+    # Rank groups by first appearance rather than alphabetically
+    group_rank = np.argsort(np.argsort(idx_first))[group_codes.ravel()]
+
+    # Indices of each group as contiguous slices, keeping the original order within groups
+    idx_by_group = np.argsort(group_rank, kind="stable")
+    counts = np.bincount(group_rank, minlength=len(group_names))
+    stops = np.cumsum(counts)
+
+    values = np.asarray(values)
+    idx_top = []
+    for start, stop in zip(stops - counts, stops):
+        idx_group = idx_by_group[start:stop]
+        idx_top.append(idx_group[top_k(values[idx_group], number, largest=largest)])
+    return np.concatenate(idx_top)
@@ -1,6 +1,339 @@
+from collections import OrderedDict
+import os
+import threading
+import time
+import numpy as np
 import h5py
 import hdf5plugin  # needed for compressed chunked data
 
+from config import configuration as config
+
+
+def get_file_fingerprint(file_name):
+    """Get a cheap fingerprint of a file on disk (inode, mtime, size).
+
+    This is a single stat call and is used to detect when a file has been modified or
+    replaced, e.g. when new approximations are deployed while the server is running.
+    """
+    stat = os.stat(file_name)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def get_source_fingerprint(file_name):
+    """Get the part of a file fingerprint that survives copying the file (mtime, size).
+
+    Precomputed indices record this for the approximation file they were built from, so
+    they can be shipped together with it and are ignored once it changes.
+    """
+    inode, mtime_ns, size = get_file_fingerprint(file_name)
+    return (mtime_ns, size)
+
+
+def is_folder_check_due(checks, key, folder):
+    """Check whether the files in a folder should be looked at again for changes.
+
+    Checking every file of a folder on each request can cost as much as what it protects.
+    Files are therefore only checked again once the folder itself changes (files added,
+    removed or replaced) or every cache.atlas_folder.check_interval_seconds (see config.yml).
+
+    Args:
+        checks: Dict of (folder mtime, time) of the last check of each key, updated in place
+            when a check is due.
+        key: What the check is for, e.g. a measurement type.
+        folder: The folder containing the files.
+    """
+    folder_mtime = os.stat(folder).st_mtime_ns
+    now = time.monotonic()
+    if key in checks:
+        folder_mtime_checked, time_checked = checks[key]
+        interval = config["cache"]["atlas_folder"]["check_interval_seconds"]
+        if (folder_mtime == folder_mtime_checked) and (now - time_checked < interval):
+            return False
+    checks[key] = (folder_mtime, now)
+    return True
+
+
+class _PooledHandle():
+    """One open, read-only h5py file held by the pool."""
+    __slots__ = ("handle", "fingerprint", "users", "last_used")
+
+    def __init__(self, handle, fingerprint, now):
+        self.handle = handle
+        self.fingerprint = fingerprint
+        self.users = 0
+        self.last_used = now
+
+
+class FileHandlePool():
+    """Process-wide, thread-safe pool of read-only HDF5 file handles keyed by path.
+
+    Opening an HDF5 file means parsing its superblock and B-trees, which for small queries
+    takes longer than reading the data itself. The pool keeps each file open across requests
+    and hands out the same handle to every reader (h5py serialises access internally).
+
+    Handles are reopened if the file changes on disk (inode, mtime or size) and closed once
+    they have not been used for a while. Handles that are still in use when they become stale
+    or idle are only closed after the last reader releases them.
+    """
+    def __init__(self, max_idle_seconds=600):
+        self.max_idle_seconds = max_idle_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._retired = []
+        self.hits = 0
+        self.misses = 0
+        self.reopens = 0
+        self.evictions = 0
+
+    def acquire(self, file_name):
+        """Get a pooled handle for a file, opening it if needed."""
+        key = str(file_name)
+        fingerprint = get_file_fingerprint(key)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+
+            entry = self._entries.get(key)
+            if (entry is not None) and (entry.fingerprint != fingerprint):
+                self._retire(key)
+                self.reopens += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                entry = _PooledHandle(h5py.File(key, "r"), fingerprint, now)
+                self._entries[key] = entry
+            else:
+                self.hits += 1
+
+            entry.users += 1
+            entry.last_used = now
+        return entry
+
+    def release(self, entry):
+        """Return a handle to the pool after use."""
+        with self._lock:
+            entry.users -= 1
+            entry.last_used = time.monotonic()
+            self._close_retired()
+
+    def clear(self):
+        """Close all handles that are not in use and forget about them."""
+        with self._lock:
+            for key in list(self._entries):
+                self._retire(key)
+            self._close_retired()
+
+    def stats(self):
+        """Get hit/miss counters and the number of open handles."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "reopens": self.reopens,
+                "evictions": self.evictions,
+                "open": len(self._entries),
+                "retired": len(self._retired),
+            }
+
+    def _retire(self, key):
+        self._retired.append(self._entries.pop(key))
+
+    def _evict_idle(self, now):
+        for key, entry in list(self._entries.items()):
+            if (entry.users == 0) and (now - entry.last_used > self.max_idle_seconds):
+                self._retire(key)
+                self.evictions += 1
+        self._close_retired()
+
+    def _close_retired(self):
+        in_use = []
+        for entry in self._retired:
+            if entry.users > 0:
+                in_use.append(entry)
+            else:
+                entry.handle.close()
+        self._retired = in_use
+
+
+file_handle_pool = FileHandlePool(
+    max_idle_seconds=config["cache"]["file_handles"]["max_idle_seconds"],
+)
+
+
+def get_file_handle_stats():
+    """Get usage statistics for the pool of open approximation files."""
+    return file_handle_pool.stats()
+
+
+class ChunkCache():
+    """Process-wide LRU cache of decompressed dataset chunks with a memory budget in bytes.
+
+    Keys are (file name, file fingerprint, dataset name, row chunk, column chunk), so the
+    cache is shared across organisms and entries of a file that changed on disk are never
+    hit again (they just age out). Values are read-only numpy arrays.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Get a chunk, or None if it is not cached."""
+        with self._lock:
+            chunk = self._entries.get(key)
+            if chunk is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return chunk
+
+    def put(self, key, chunk):
+        """Store a chunk, evicting the least recently used ones to stay within budget."""
+        chunk.flags.writeable = False
+        if chunk.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = chunk
+            self.nbytes += chunk.nbytes
+            while self.nbytes > self.max_bytes:
+                key_old, chunk_old = self._entries.popitem(last=False)
+                self.nbytes -= chunk_old.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all cached chunks."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Get hit/miss/eviction counters and memory usage."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+chunk_cache = ChunkCache(
+    max_bytes=config["cache"]["chunks"]["max_bytes"],
+)
+
+
+def get_chunk_cache_stats():
+    """Get usage statistics for the cache of decompressed chunks."""
+    return chunk_cache.stats()
+
+
+def _get_chunk(db_dataset, dataset_key, chunks, row_chunk, column_chunk, cache=True):
+    """Get one decompressed chunk of a dataset, from the cache if possible."""
+    key = dataset_key + (row_chunk, column_chunk)
+    if cache:
+        chunk = chunk_cache.get(key)
+        if chunk is not None:
+            return chunk
+
+    row_start = row_chunk * chunks[0]
+    col_start = column_chunk * chunks[1]
+    chunk = db_dataset[
+        row_start:min(row_start + chunks[0], db_dataset.shape[0]),
+        col_start:min(col_start + chunks[1], db_dataset.shape[1]),
+    ]
+    if cache:
+        chunk_cache.put(key, chunk)
+    return chunk
+
+
+def read_columns(db_dataset, columns=None, row=None, cache=True):
+    """Read sorted columns of a 2D dataset, decompressing each touched chunk once.
+
+    h5py turns scattered column selections into hyperslab unions, which are slow on
+    compressed chunks when the columns are spread across a wide matrix (e.g. ~1M ATAC
+    peaks). Here the requested columns are grouped by chunk, each chunk is decompressed at
+    most once (or taken from the shared cache of hot chunks) and the output is assembled
+    with numpy.
+
+    Args:
+        db_dataset: The h5py dataset, with cell types as rows and features as columns.
+        columns: Sorted, unique numpy 1D array of column indices. None means all columns.
+        row: If not None, read only this row and return a numpy 1D array.
+        cache: Whether to use the shared cache of chunks. Offline index builds read most of
+            the atlas once and should not push the hot chunks of live requests out of it.
+
+    Reads of all columns touch every chunk once anyway, so they go straight to h5py and
+    bypass the cache for the same reason.
+    """
+    chunks = db_dataset.chunks
+    if (chunks is None) or (columns is None):
+        if columns is None:
+            columns = slice(None)
+        if row is None:
+            return db_dataset[:, columns]
+        return db_dataset[row, columns]
+
+    nrows = db_dataset.shape[0]
+    if row is None:
+        row_chunks = range((nrows + chunks[0] - 1) // chunks[0])
+        data = np.empty((nrows, len(columns)), dtype=db_dataset.dtype)
+    else:
+        row_chunks = [row // chunks[0]]
+        data = np.empty(len(columns), dtype=db_dataset.dtype)
+
+    # NOTE: the low-level calls are much faster than Dataset.file.filename and Dataset.name
+    file_name = h5py.h5f.get_name(db_dataset.id)
+    dataset_key = (
+        file_name,
+        get_file_fingerprint(file_name),
+        h5py.h5i.get_name(db_dataset.id),
+    )
+
+    # Group the columns by chunk: columns are sorted, so each group is a contiguous slice
+    column_chunks = columns // chunks[1]
+    starts = np.flatnonzero(np.diff(column_chunks, prepend=-1))
+    stops = np.append(starts[1:], len(columns))
+    for start, stop in zip(starts, stops):
+        column_chunk = column_chunks[start]
+        columns_chunk = columns[start:stop] - column_chunk * chunks[1]
+        for row_chunk in row_chunks:
+            chunk = _get_chunk(
+                db_dataset, dataset_key, chunks, row_chunk, column_chunk, cache=cache,
+            )
+            row_start = row_chunk * chunks[0]
+            if row is None:
+                data[row_start:row_start + chunk.shape[0], start:stop] = chunk[:, columns_chunk]
+            else:
+                data[start:stop] = chunk[row - row_start, columns_chunk]
+    return data
+
+
+def gather_csr_rows(indptr, rows):
+    """Get the entries of some rows of a sparse matrix in CSR form, in one vectorised step.
+
+    Args:
+        indptr: numpy 1D array, row i spans entries indptr[i] to indptr[i + 1].
+        rows: numpy 1D array of rows, in any order and possibly repeated.
+
+    Returns:
+        pair of numpy 1D arrays, with the position in rows and the index of each entry.
+    """
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    offsets = np.cumsum(counts) - counts
+    entries = np.arange(counts.sum()) - np.repeat(offsets - starts, counts)
+    return np.repeat(np.arange(len(rows)), counts), entries
+
 
 class ApproximationFile():
     """Abstraction for accessing atlas approximation files."""
@@ -18,11 +351,20 @@ class ApproximationFile():
         latter has a lot more features (~50k GE vs ~1M CA), ballooning the file size. Fortunately,
         data compression can be achieved at the Dataset level in HDF5 files, so we do that
         using Facebook's zstd algorithm, which is why we need to import hdf5plugin.
+
+        NOTE: Read-only access to uncompressed files goes through a process-wide pool of open
+        handles, so leaving the `with` block does not close the file. Other modes open and
+        close the file as usual.
         """
         self.file_name = file_name
         self.mode = mode
+        self.pooled = None
 
     def __enter__(self):
+        if (self.mode == 'r') and (not str(self.file_name).endswith('.gz')):
+            self.pooled = file_handle_pool.acquire(self.file_name)
+            return self.pooled.handle
+
         self.handles = [self.file_name]
 
         # NOTE: gzip (or zip) slows down access *considerably*
@@ -36,6 +378,11 @@ class ApproximationFile():
 
 
     def __exit__(self, *args):
+        if self.pooled is not None:
+            file_handle_pool.release(self.pooled)
+            self.pooled = None
+            return
+
         for handle in self.handles[::-1]:
             handle.close()
         self.handles = []
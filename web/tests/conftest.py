@@ -1,12 +1,34 @@
 import os
+import sys
 import pytest
 import pathlib
 import subprocess as sp
 
+# Some tests call the models directly rather than through the web server
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
 server_prefix = "http://127.0.0.1:5000/"
 api_version = "v1"
 
 
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "local_atlas: calls the models on the approximations in the atlas folder of config.yml",
+    )
+
+
+@pytest.fixture(autouse=True)
+def local_atlas(request):
+    """Skip tests that need local approximations if there are none."""
+    if request.node.get_closest_marker("local_atlas") is None:
+        return
+    from config import configuration as config
+    atlas_folder = pathlib.Path(config["paths"]["compressed_atlas"])
+    if not any(atlas_folder.glob("*.h5")):
+        pytest.skip(f"No approximations found in {atlas_folder}")
+
+
 @pytest.fixture(scope="session")
 def webserver():
     #  TODO
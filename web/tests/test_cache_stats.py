@@ -0,0 +1,16 @@
+import pytest
+import requests
+
+
+def test_cache_stats(host):
+    response = requests.get(f"{host}/cache_stats")
+    if response.status_code == 404:
+        pytest.skip("cache_stats is disabled in config.yml")
+    resp_content = response.json()
+
+    assert list(resp_content.keys()) == ["file_handles", "chunks"]
+    assert list(resp_content["file_handles"].keys()) == [
+        "hits", "misses", "reopens", "evictions", "open", "retired"]
+    assert list(resp_content["chunks"].keys()) == [
+        "hits", "misses", "evictions", "entries", "bytes", "max_bytes"]
+    assert resp_content["chunks"]["bytes"] <= resp_content["chunks"]["max_bytes"]
@@ -0,0 +1,59 @@
+import h5py
+import numpy as np
+import pytest
+
+from models import celltype_homology
+from models.celltype_homology import (
+    build_celltype_vectors,
+    get_celltype_vectors,
+)
+
+
+organism = "h_sapiens"
+
+pytestmark = pytest.mark.local_atlas
+
+
+@pytest.fixture
+def vectors_path(tmp_path, monkeypatch):
+    """Cell type vectors built into a temporary folder, with an empty cache."""
+    path = tmp_path / f"{organism}.celltype_vectors.h5"
+    monkeypatch.setattr(celltype_homology, "get_celltype_vectors_path", lambda organism: path)
+    monkeypatch.setattr(celltype_homology, "celltype_vectors", {})
+    build_celltype_vectors(organism)
+
+    calls = []
+    build = celltype_homology._build_celltype_vectors
+
+    def build_counted(*args, **kwargs):
+        calls.append(args)
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(celltype_homology, "_build_celltype_vectors", build_counted)
+    return path, calls
+
+
+def test_celltype_vectors_lookup(vectors_path):
+    path, calls = vectors_path
+    vectors = get_celltype_vectors(organism)
+    assert len(calls) == 0
+
+    vectors_live = celltype_homology._build_celltype_vectors(organism)
+    assert list(vectors["organs"]) == list(vectors_live["organs"])
+    assert list(vectors["celltypes"]) == list(vectors_live["celltypes"])
+    assert np.allclose(vectors["vectors"], vectors_live["vectors"])
+
+    # Loaded once
+    get_celltype_vectors(organism)
+    assert len(calls) == 1
+
+
+def test_celltype_vectors_stale(vectors_path):
+    path, calls = vectors_path
+
+    # As if the approximation file had changed after the vectors were built
+    with h5py.File(path, "a") as h5:
+        h5.attrs["source_size"] += 1
+
+    get_celltype_vectors(organism)
+    assert len(calls) == 1
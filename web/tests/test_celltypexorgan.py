@@ -15,3 +15,52 @@ def test_celltypes(host):
     assert resp_content["organism"] == "h_sapiens"
     assert len(resp_content["organs"]) > 4
     assert "fibroblast" in resp_content["celltypes"]
+
+
+def test_celltypexorgan_organs(host):
+    organs = requests.get(
+        f"{host}/organs",
+        params={"organism": "h_sapiens"},
+    ).json()["organs"][:2]
+    response = requests.get(
+        f"{host}/celltypexorgan",
+        params={
+            "organism": "h_sapiens",
+            "organs": ",".join(organs),
+        },
+    )
+    resp_content = response.json()
+
+    assert resp_content["organs"] == sorted(organs)
+    assert len(resp_content["detected"]) == len(resp_content["celltypes"])
+    # Every cell type is found in at least one of the organs, most widespread first
+    ndetected = [sum(value > 0 for value in row) for row in resp_content["detected"]]
+    assert min(ndetected) > 0
+    assert ndetected == sorted(ndetected, reverse=True)
+
+
+def test_celltypexorgan_boolean(host):
+    params = {"organism": "h_sapiens"}
+    counts = requests.get(f"{host}/celltypexorgan", params=params).json()
+    response = requests.get(
+        f"{host}/celltypexorgan",
+        params={**params, "boolean": "true"},
+    )
+    resp_content = response.json()
+
+    assert resp_content["celltypes"] == counts["celltypes"]
+    assert resp_content["detected"] == [
+        [value > 0 for value in row] for row in counts["detected"]
+    ]
+
+
+def test_celltypexorgan_invalid_organ(host):
+    response = requests.get(
+        f"{host}/celltypexorgan",
+        params={
+            "organism": "h_sapiens",
+            "organs": "notanorgan",
+        },
+    )
+
+    assert response.status_code == 400
@@ -0,0 +1,28 @@
+import requests
+
+
+def test_celltypexorganism(host):
+    response = requests.get(
+        f"{host}/celltypexorganism",
+    )
+    resp_content = response.json()
+
+    assert list(resp_content.keys()) == [
+        "celltypes", "measurement_type", "organisms", "detected"]
+    assert "fibroblast" in resp_content["celltypes"]
+    assert "h_sapiens" in resp_content["organisms"]
+    assert resp_content["celltypes"] == sorted(resp_content["celltypes"])
+    assert len(resp_content["detected"]) == len(resp_content["celltypes"])
+    # Every cell type is found in some organism
+    assert all(max(row) == 1 for row in resp_content["detected"])
+
+
+def test_celltypexorganism_unknown_measurement_type(host):
+    response = requests.get(
+        f"{host}/celltypexorganism",
+        params={"measurement_type": "notameasurement"},
+    )
+    resp_content = response.json()
+
+    assert resp_content["celltypes"] == []
+    assert resp_content["organisms"] == []
@@ -0,0 +1,102 @@
+import numpy as np
+import h5py
+import pytest
+
+from models import utils
+from models.utils import (
+    ChunkCache,
+    read_columns,
+)
+
+
+@pytest.fixture
+def matrix_path(tmp_path):
+    matrix = np.arange(60, dtype=np.float32).reshape(6, 10)
+    path = tmp_path / "matrix.h5"
+    with h5py.File(path, "w") as h5:
+        h5.create_dataset("chunked", data=matrix, chunks=(4, 3))
+        h5.create_dataset("unchunked", data=matrix)
+    return path, matrix
+
+
+def test_chunk_cache_eviction():
+    chunk = np.zeros(10, np.float64)
+    cache = ChunkCache(max_bytes=3 * chunk.nbytes)
+    for i in range(5):
+        cache.put(i, chunk.copy())
+
+    stats = cache.stats()
+    assert stats["entries"] == 3
+    assert stats["evictions"] == 2
+    assert stats["bytes"] <= stats["max_bytes"]
+
+    # Least recently used chunks are gone
+    assert cache.get(0) is None
+    assert cache.get(4) is not None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_chunk_cache_recency():
+    chunk = np.zeros(10, np.float64)
+    cache = ChunkCache(max_bytes=2 * chunk.nbytes)
+    cache.put("a", chunk.copy())
+    cache.put("b", chunk.copy())
+    cache.get("a")
+    cache.put("c", chunk.copy())
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+
+
+def test_chunk_cache_too_large():
+    cache = ChunkCache(max_bytes=10)
+    chunk = np.zeros(10, np.float64)
+    cache.put("a", chunk)
+
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+    # Cached chunks are shared, so they must not be modified
+    assert not chunk.flags.writeable
+
+
+@pytest.mark.parametrize("dataset", ["chunked", "unchunked"])
+@pytest.mark.parametrize("columns", [[], [0, 4, 5, 9], None])
+@pytest.mark.parametrize("row", [None, 5])
+def test_read_columns(matrix_path, dataset, columns, row):
+    path, matrix = matrix_path
+    expected = matrix if row is None else matrix[row]
+    if columns is not None:
+        columns = np.array(columns, np.int64)
+        expected = expected[..., columns]
+
+    with h5py.File(path, "r") as h5:
+        data = read_columns(h5[dataset], columns, row=row)
+        # A second read comes from the cache of chunks
+        data_cached = read_columns(h5[dataset], columns, row=row)
+
+    assert data.shape == expected.shape
+    assert (data == expected).all()
+    assert (data_cached == expected).all()
+
+
+def test_read_columns_keeps_hot_chunks(matrix_path, monkeypatch):
+    path, matrix = matrix_path
+    cache = ChunkCache(max_bytes=1 << 20)
+    monkeypatch.setattr(utils, "chunk_cache", cache)
+    columns = np.array([0, 4], np.int64)
+
+    with h5py.File(path, "r") as h5:
+        read_columns(h5["chunked"], columns)
+        entries = cache.stats()["entries"]
+        assert entries > 0
+
+        # Full matrices and offline builds neither use nor fill the cache
+        assert (read_columns(h5["chunked"]) == matrix).all()
+        assert (read_columns(h5["chunked"], np.array([7, 8]), cache=False) == matrix[:, 7:9]).all()
+        assert cache.stats()["entries"] == entries
+
+        # The hot chunks are still there
+        hits = cache.stats()["hits"]
+        read_columns(h5["chunked"], columns)
+        assert cache.stats()["hits"] == hits + entries
@@ -0,0 +1,84 @@
+import pytest
+import requests
+
+
+@pytest.fixture
+def pairs(host):
+    """A few thousand pairs of human and mouse genes."""
+    features = {}
+    for organism in ["h_sapiens", "m_musculus"]:
+        features[organism] = requests.get(
+            f"{host}/features",
+            params={"organism": organism},
+        ).json()["features"]
+
+    npairs = 3000
+    source_features = [features["h_sapiens"][i % len(features["h_sapiens"])] for i in range(npairs)]
+    target_features = [features["m_musculus"][i % len(features["m_musculus"])] for i in range(npairs)]
+    return source_features, target_features
+
+
+def test_homology_distances(host, pairs):
+    source_features, target_features = pairs
+    response = requests.get(
+        f"{host}/homology_distances",
+        params={
+            "source_organism": "h_sapiens",
+            "target_organism": "m_musculus",
+            "source_features": ",".join(source_features[:10]),
+            "target_features": ",".join(target_features[:10]),
+        },
+    )
+    resp_content = response.json()
+
+    assert list(resp_content.keys()) == ["queries", "targets", "distances"]
+    assert 0 < len(resp_content["queries"]) <= 10
+    assert len(resp_content["targets"]) == len(resp_content["queries"])
+    assert len(resp_content["distances"]) == len(resp_content["queries"])
+
+
+def test_homology_distances_post(host, pairs):
+    source_features, target_features = pairs
+    response = requests.post(
+        f"{host}/homology_distances",
+        json={
+            "source_organism": "h_sapiens",
+            "target_organism": "m_musculus",
+            "source_features": source_features,
+            "target_features": target_features,
+        },
+    )
+    resp_content = response.json()
+
+    assert response.status_code == 200
+    assert 0 < len(resp_content["queries"]) <= len(source_features)
+    assert len(resp_content["targets"]) == len(resp_content["queries"])
+    assert len(resp_content["distances"]) == len(resp_content["queries"])
+
+    # Same as asking for fewer pairs in the URL
+    response_get = requests.get(
+        f"{host}/homology_distances",
+        params={
+            "source_organism": "h_sapiens",
+            "target_organism": "m_musculus",
+            "source_features": ",".join(source_features[:10]),
+            "target_features": ",".join(target_features[:10]),
+        },
+    ).json()
+    nget = len(response_get["queries"])
+    for key in ["queries", "targets", "distances"]:
+        assert resp_content[key][:nget] == response_get[key]
+
+
+def test_homology_distances_post_missing(host, pairs):
+    source_features, target_features = pairs
+    response = requests.post(
+        f"{host}/homology_distances",
+        json={
+            "source_organism": "h_sapiens",
+            "target_organism": "m_musculus",
+            "source_features": source_features,
+        },
+    )
+
+    assert response.status_code == 400
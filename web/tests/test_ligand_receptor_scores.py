@@ -0,0 +1,97 @@
+import pytest
+import requests
+
+
+def test_ligand_receptor_scores(host):
+    response = requests.get(
+        f"{host}/ligand_receptor_scores",
+        params={
+            "organism": "h_sapiens",
+            "organ": "lung",
+        },
+    )
+    resp_content = response.json()
+
+    assert list(resp_content.keys()) == [
+        "organism",
+        "organ",
+        "senders",
+        "receivers",
+        "ligands",
+        "receptors",
+        "scores",
+    ]
+    assert resp_content["organism"] == "h_sapiens"
+    assert resp_content["organ"] == "lung"
+    # 50 by default
+    assert 0 < len(resp_content["scores"]) <= 50
+    for key in ["senders", "receivers", "ligands", "receptors"]:
+        assert len(resp_content[key]) == len(resp_content["scores"])
+    # Strongest first
+    assert resp_content["scores"] == sorted(resp_content["scores"], reverse=True)
+    assert min(resp_content["scores"]) > 0
+
+
+def test_ligand_receptor_scores_min_fraction(host):
+    min_fraction = 0.5
+    response = requests.get(
+        f"{host}/ligand_receptor_scores",
+        params={
+            "organism": "h_sapiens",
+            "organ": "lung",
+            "number": 10,
+            "min_fraction": min_fraction,
+        },
+    )
+    resp_content = response.json()
+    assert len(resp_content["scores"]) <= 10
+
+    # Ligands must be detected in senders and receptors in receivers
+    for sender, receiver, ligand, receptor in zip(
+        resp_content["senders"],
+        resp_content["receivers"],
+        resp_content["ligands"],
+        resp_content["receptors"],
+    ):
+        fractions = requests.get(
+            f"{host}/fraction_detected",
+            params={
+                "organism": "h_sapiens",
+                "organ": "lung",
+                "features": f"{ligand},{receptor}",
+            },
+        ).json()
+        celltypes = fractions["celltypes"]
+        fraction_ligand = fractions["fraction_detected"][0][celltypes.index(sender)]
+        fraction_receptor = fractions["fraction_detected"][1][celltypes.index(receiver)]
+        assert fraction_ligand >= min_fraction - 1e-6
+        assert fraction_receptor >= min_fraction - 1e-6
+
+    # A stricter threshold keeps a subset of the interactions
+    counts = []
+    for min_fraction in [0.1, 0.5]:
+        response = requests.get(
+            f"{host}/ligand_receptor_scores",
+            params={
+                "organism": "h_sapiens",
+                "organ": "lung",
+                "number": 10000,
+                "min_fraction": min_fraction,
+            },
+        )
+        counts.append(len(response.json()["scores"]))
+    assert counts[0] >= counts[1]
+
+
+@pytest.mark.parametrize("params,status", [
+    ({"organ": "notanorgan"}, 400),
+    ({"organ": "lung", "min_fraction": 2}, 400),
+    ({"organ": "lung", "number": "many"}, 400),
+])
+def test_ligand_receptor_scores_invalid(host, params, status):
+    response = requests.get(
+        f"{host}/ligand_receptor_scores",
+        params={"organism": "h_sapiens", **params},
+    )
+
+    assert response.status_code == status
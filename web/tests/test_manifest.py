@@ -0,0 +1,37 @@
+import h5py
+
+from config import configuration as config
+from models.manifest import get_manifest
+from models.utils import file_handle_pool
+
+
+def _write_approximation(path, measurement_types):
+    with h5py.File(path, "w") as h5:
+        group = h5.create_group("measurements")
+        for measurement_type in measurement_types:
+            group.create_group(measurement_type).attrs["source"] = "synthetic"
+
+
+def test_manifest_folder_checks(monkeypatch, tmp_path):
+    monkeypatch.setitem(config["paths"], "compressed_atlas", str(tmp_path))
+    monkeypatch.setitem(config["cache"]["atlas_folder"], "check_interval_seconds", 3600)
+    _write_approximation(tmp_path / "h_sapiens.h5", ["gene_expression"])
+
+    assert sorted(get_manifest()) == ["h_sapiens"]
+    assert (tmp_path / "manifest.json").exists()
+
+    # New files change the folder, so they are noticed right away
+    _write_approximation(tmp_path / "m_musculus.h5", ["gene_expression"])
+    assert sorted(get_manifest()) == ["h_sapiens", "m_musculus"]
+    # Rewriting manifest.json changed the folder too, this check finds nothing new
+    get_manifest()
+
+    # Files changed in place are only noticed after the check interval
+    file_handle_pool.clear()
+    _write_approximation(tmp_path / "h_sapiens.h5", ["gene_expression", "chromatin_accessibility"])
+    assert get_manifest()["h_sapiens"]["measurement_types"] == ["gene_expression"]
+
+    monkeypatch.setitem(config["cache"]["atlas_folder"], "check_interval_seconds", 0)
+    assert sorted(get_manifest()["h_sapiens"]["measurement_types"]) == [
+        "chromatin_accessibility", "gene_expression",
+    ]
@@ -0,0 +1,49 @@
+import requests
+
+
+def test_organxorganism(host):
+    response = requests.get(
+        f"{host}/organxorganism",
+        params={
+            "celltype": "fibroblast",
+        },
+    )
+    resp_content = response.json()
+
+    assert list(resp_content.keys()) == [
+        "celltype", "measurement_type", "organs", "organisms", "detected"]
+    assert resp_content["celltype"] == "fibroblast"
+    assert "h_sapiens" in resp_content["organisms"]
+    assert resp_content["organs"] == sorted(resp_content["organs"])
+    assert len(resp_content["detected"]) == len(resp_content["organs"])
+    assert all(len(row) == len(resp_content["organisms"]) for row in resp_content["detected"])
+
+    # Consistent with the cell types of each organism
+    organs = requests.get(
+        f"{host}/celltype_location",
+        params={
+            "organism": "h_sapiens",
+            "celltype": "fibroblast",
+        },
+    ).json()["organs"]
+    idx = resp_content["organisms"].index("h_sapiens")
+    organs_detected = [
+        organ for organ, row in zip(resp_content["organs"], resp_content["detected"]) if row[idx]
+    ]
+    assert len(organs_detected) > 0
+    assert set(organs_detected) <= set(organs)
+
+
+def test_organxorganism_unknown(host):
+    response = requests.get(
+        f"{host}/organxorganism",
+        params={
+            "celltype": "notacelltype",
+        },
+    )
+    resp_content = response.json()
+
+    assert response.status_code == 200
+    assert resp_content["organs"] == []
+    assert resp_content["organisms"] == []
+    assert resp_content["detected"] == []
@@ -0,0 +1,73 @@
+import pytest
+
+from config import configuration as config
+from models import presence
+from models.presence import (
+    build_presence_index,
+    get_celltypexorganism,
+    get_organxorganism,
+)
+
+
+pytestmark = pytest.mark.local_atlas
+
+
+@pytest.fixture
+def presence_index(tmp_path, monkeypatch):
+    """A presence index built into a temporary folder, with empty caches."""
+    monkeypatch.setattr(
+        presence, "get_presence_index_path", lambda: tmp_path / "atlas.presence.h5",
+    )
+    monkeypatch.setattr(presence, "presence_indices", {})
+    monkeypatch.setattr(presence, "presence_checks", {})
+    build_presence_index()
+
+    calls = {"manifest": 0, "build": 0}
+    get_manifest_fingerprints = presence._get_manifest_fingerprints
+    build = presence._build_presence_index
+
+    def get_manifest_fingerprints_counted(*args, **kwargs):
+        calls["manifest"] += 1
+        return get_manifest_fingerprints(*args, **kwargs)
+
+    def build_counted(*args, **kwargs):
+        calls["build"] += 1
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(presence, "_get_manifest_fingerprints", get_manifest_fingerprints_counted)
+    monkeypatch.setattr(presence, "_build_presence_index", build_counted)
+    return calls
+
+
+def test_presence_index_lookup(presence_index):
+    table = get_celltypexorganism()
+    assert presence_index == {"manifest": 1, "build": 0}
+
+    # Further requests do not check the approximation files again
+    organxorganism = get_organxorganism(table.index[0])
+    get_celltypexorganism()
+    assert presence_index == {"manifest": 1, "build": 0}
+
+    assert (organxorganism.sum(axis=0) > 0).all()
+    assert list(organxorganism.columns) == list(table.columns[table.iloc[0] > 0])
+
+
+def test_presence_index_stale(presence_index, monkeypatch):
+    table = get_celltypexorganism()
+
+    # An approximation file changes after the index was built
+    get_manifest_fingerprints = presence._get_manifest_fingerprints
+
+    def get_manifest_fingerprints_changed(*args, **kwargs):
+        fingerprints = get_manifest_fingerprints(*args, **kwargs)
+        organism = sorted(fingerprints)[0]
+        fingerprints[organism] = [fingerprints[organism][0] + 1, fingerprints[organism][1]]
+        return fingerprints
+
+    monkeypatch.setattr(presence, "_get_manifest_fingerprints", get_manifest_fingerprints_changed)
+    monkeypatch.setitem(config["cache"]["atlas_folder"], "check_interval_seconds", 0)
+
+    # The file is ignored and the index rebuilt from the approximations
+    table_rebuilt = get_celltypexorganism()
+    assert presence_index == {"manifest": 2, "build": 1}
+    assert table_rebuilt.equals(table)
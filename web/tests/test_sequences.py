@@ -0,0 +1,69 @@
+import pytest
+import requests
+
+
+@pytest.fixture
+def features(host):
+    response = requests.get(
+        f"{host}/features",
+        params={"organism": "h_sapiens"},
+    )
+    return response.json()["features"][:3]
+
+
+def test_sequences(host, features):
+    response = requests.get(
+        f"{host}/sequences",
+        params={
+            "organism": "h_sapiens",
+            "features": ",".join(features),
+        },
+    )
+    resp_content = response.json()
+
+    assert list(resp_content.keys()) == [
+        "measurement_type",
+        "organism",
+        "features",
+        "sequences",
+        "type",
+    ]
+    assert resp_content["organism"] == "h_sapiens"
+    assert resp_content["features"] == features
+    assert len(resp_content["sequences"]) == len(features)
+    assert resp_content["type"] == "protein"
+
+
+def test_sequences_fasta(host, features):
+    params = {
+        "organism": "h_sapiens",
+        "features": ",".join(features),
+    }
+    sequences = requests.get(
+        f"{host}/sequences",
+        params=params,
+    ).json()["sequences"]
+    response = requests.get(
+        f"{host}/sequences",
+        params={**params, "format": "fasta"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/x-fasta")
+    # One ">name\nSEQUENCE" record per feature, in the requested order
+    records = response.text.strip("\n").split("\n")
+    assert records[::2] == [f">{feature}" for feature in features]
+    assert records[1::2] == sequences
+
+
+def test_sequences_invalid_format(host, features):
+    response = requests.get(
+        f"{host}/sequences",
+        params={
+            "organism": "h_sapiens",
+            "features": ",".join(features),
+            "format": "genbank",
+        },
+    )
+
+    assert response.status_code == 400
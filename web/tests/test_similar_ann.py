@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from models import (
+    get_organs,
+    get_celltypes,
+    get_feature_names,
+    get_averages,
+)
+from models import similar
+from models.similar import get_similar_features
+from models import similar_ann
+from models.similar_ann import (
+    _get_hash_codes,
+    build_similar_ann,
+)
+
+
+organism = "h_sapiens"
+measurement_type = "chromatin_accessibility"
+
+
+@pytest.fixture
+def focal():
+    """A small organ and a peak that varies across its cell types."""
+    organ = min(
+        get_organs(organism, measurement_type=measurement_type),
+        key=lambda organ: len(get_celltypes(organism, organ, measurement_type=measurement_type)),
+    )
+    features = get_feature_names(organism, measurement_type=measurement_type)[:500]
+    averages = get_averages(organism, list(features), organ, measurement_type=measurement_type)
+    return organ, features[np.argmax(averages.std(axis=1))]
+
+
+@pytest.fixture
+def live(monkeypatch):
+    # Compute neighbours rather than looking them up in the cache of nearest features
+    monkeypatch.setattr(similar, "lookup_similar_features", lambda *args, **kwargs: None)
+
+
+def test_hash_codes():
+    rng = np.random.default_rng(0)
+    hyperplanes = rng.standard_normal((4, 8, 20))
+    vector = rng.random(20)
+    mat = np.stack([vector, 3 * vector, 3 * vector + 1, -vector], axis=1)
+
+    # Cosine hashes depend on direction only, correlation also ignores offsets
+    codes = _get_hash_codes(mat, hyperplanes, "cosine")
+    assert (codes[:, 0] == codes[:, 1]).all()
+    assert (codes[:, 0] != codes[:, 3]).any()
+    codes = _get_hash_codes(mat, hyperplanes, "correlation")
+    assert (codes[:, 0] == codes[:, 2]).all()
+
+
+@pytest.mark.local_atlas
+def test_lsh_candidates(focal, monkeypatch, tmp_path):
+    organ, feature = focal
+    features = get_feature_names(organism, measurement_type=measurement_type)
+    idx = list(features).index(feature)
+
+    # Build a small index away from the approximations
+    monkeypatch.setattr(
+        similar_ann, "get_similar_ann_path", lambda organism: tmp_path / "similar_ann.h5",
+    )
+    build_similar_ann(
+        organism, methods=["correlation"], measurement_types=[measurement_type], ntables=2,
+    )
+
+    vector = get_averages(organism, [feature], organ, measurement_type=measurement_type)[0]
+    candidates = similar_ann.get_ann_candidates(
+        organism, organ, vector, method="correlation", measurement_type=measurement_type,
+    )
+    # The focal feature always falls in its own buckets
+    assert idx in candidates
+    assert (np.diff(candidates) > 0).all()
+
+
+@pytest.mark.local_atlas
+@pytest.mark.parametrize("method", ["correlation", "cosine"])
+def test_ann_matches_exact(focal, live, monkeypatch, method):
+    organ, feature = focal
+    nfeatures = len(get_feature_names(organism, measurement_type=measurement_type))
+
+    # With every feature as a candidate, reranking must find the exact neighbours
+    monkeypatch.setattr(
+        similar, "get_ann_candidates", lambda *args, **kwargs: np.arange(nfeatures),
+    )
+
+    kwargs = dict(
+        number=5,
+        method=method,
+        measurement_type=measurement_type,
+        similar_type=measurement_type,
+    )
+    result_ann = get_similar_features(organism, organ, feature, **kwargs)
+    result_exact = get_similar_features(organism, organ, feature, exact=True, **kwargs)
+
+    assert list(result_ann["features"]) == list(result_exact["features"])
+    assert np.allclose(result_ann["distances"], result_exact["distances"])
+
+
+@pytest.mark.local_atlas
+def test_exact_flag(focal, live, monkeypatch):
+    organ, feature = focal
+    calls = []
+
+    def get_ann_candidates(*args, **kwargs):
+        calls.append(args)
+        return None
+
+    monkeypatch.setattr(similar, "get_ann_candidates", get_ann_candidates)
+
+    kwargs = dict(
+        number=5,
+        measurement_type=measurement_type,
+        similar_type=measurement_type,
+    )
+    result_exact = get_similar_features(organism, organ, feature, exact=True, **kwargs)
+    assert len(calls) == 0
+
+    # Without an index, the default falls back to the exact scan
+    result = get_similar_features(organism, organ, feature, **kwargs)
+    assert len(calls) == 1
+    assert list(result["features"]) == list(result_exact["features"])
@@ -0,0 +1,97 @@
+import pytest
+import requests
+
+
+def test_similar_celltypes_across_organisms(host):
+    response = requests.get(
+        f"{host}/similar_celltypes_across_organisms",
+        params={
+            "organism": "h_sapiens",
+            "organ": "lung",
+            "celltype": "fibroblast",
+            "number": 5,
+        },
+    )
+    resp_content = response.json()
+
+    assert list(resp_content.keys()) == [
+        "organism",
+        "organ",
+        "celltype",
+        "similar_organisms",
+        "similar_organs",
+        "similar_celltypes",
+        "distances",
+    ]
+    assert resp_content["organism"] == "h_sapiens"
+    assert 0 < len(resp_content["similar_celltypes"]) <= 5
+    assert len(resp_content["similar_organs"]) == len(resp_content["similar_celltypes"])
+    # All other organisms by default, closest first
+    assert "h_sapiens" not in resp_content["similar_organisms"]
+    assert resp_content["distances"] == sorted(resp_content["distances"])
+
+
+def test_similar_celltypes_across_organisms_targets(host):
+    response = requests.get(
+        f"{host}/similar_celltypes_across_organisms",
+        params={
+            "organism": "h_sapiens",
+            "organ": "lung",
+            "celltype": "fibroblast",
+            "number": 3,
+            "target_organisms": "m_musculus",
+        },
+    )
+    resp_content = response.json()
+
+    assert 0 < len(resp_content["similar_celltypes"]) <= 3
+    assert set(resp_content["similar_organisms"]) == {"m_musculus"}
+
+
+def test_similar_celltypes_across_organisms_per_organism(host):
+    params = {
+        "organism": "h_sapiens",
+        "organ": "lung",
+        "celltype": "fibroblast",
+        "number": 2,
+    }
+    response = requests.get(
+        f"{host}/similar_celltypes_across_organisms",
+        params=params,
+    )
+    response_per_organism = requests.get(
+        f"{host}/similar_celltypes_across_organisms",
+        params={**params, "per_organism": "true"},
+    )
+    organisms = response.json()["similar_organisms"]
+    resp_content = response_per_organism.json()
+    organisms_per_organism = resp_content["similar_organisms"]
+
+    # Up to two per organism, each organism in one block, closest first within each
+    assert set(organisms) <= set(organisms_per_organism)
+    for organism in set(organisms_per_organism):
+        idx = [i for i, org in enumerate(organisms_per_organism) if org == organism]
+        assert 0 < len(idx) <= 2
+        assert idx == list(range(idx[0], idx[-1] + 1))
+        distances = [resp_content["distances"][i] for i in idx]
+        assert distances == sorted(distances)
+
+
+@pytest.mark.parametrize(
+    "param,value",
+    [("organ", "notanorgan"), ("celltype", "notacelltypeatall€")],
+)
+def test_similar_celltypes_across_organisms_invalid(host, param, value):
+    params = {
+        "organism": "h_sapiens",
+        "organ": "lung",
+        "celltype": "fibroblast",
+        "number": 3,
+    }
+    params[param] = value
+    response = requests.get(
+        f"{host}/similar_celltypes_across_organisms",
+        params=params,
+    )
+
+    assert response.status_code == 400
@@ -0,0 +1,51 @@
+import numpy as np
+
+from models.topk import (
+    top_k,
+    top_k_per_group,
+)
+
+
+def test_top_k():
+    values = np.array([0.5, 3.0, 1.0, 2.0])
+
+    assert top_k(values, 2).tolist() == [1, 3]
+    assert top_k(values, 2, largest=False).tolist() == [0, 2]
+
+
+def test_top_k_ties():
+    values = np.array([1.0, 3.0, 2.0, 3.0, 2.0, 3.0])
+
+    # Ties are broken by index, also across the partition threshold
+    assert top_k(values, 2).tolist() == [1, 3]
+    assert top_k(values, 4).tolist() == [1, 3, 5, 2]
+    assert top_k(values, 2, largest=False).tolist() == [0, 2]
+
+
+def test_top_k_nan():
+    values = np.array([np.nan, 1.0, np.nan, 2.0])
+
+    assert top_k(values, 4).tolist() == [3, 1, 0, 2]
+    assert top_k(values, 4, largest=False).tolist() == [1, 3, 0, 2]
+    assert top_k(values, 1).tolist() == [3]
+
+
+def test_top_k_number():
+    values = np.array([2, 0, 1], np.uint8)
+
+    # Fewer entries than requested
+    assert top_k(values, 10).tolist() == [0, 2, 1]
+    assert len(top_k(values, 0)) == 0
+    assert len(top_k(values[:0], 3)) == 0
+
+
+def test_top_k_per_group():
+    values = np.array([1.0, 5.0, 3.0, 4.0, 2.0, 6.0])
+    groups = ["lung", "lung", "heart", "heart", "lung", "heart"]
+
+    # Groups in order of first appearance, not alphabetical
+    assert top_k_per_group(values, groups, 2).tolist() == [1, 4, 5, 3]
+    assert top_k_per_group(values, groups, 1, largest=False).tolist() == [0, 2]
+    assert top_k_per_group(values, groups, 10).tolist() == [1, 4, 0, 5, 3, 2]
+    assert len(top_k_per_group(values, groups, 0)) == 0
+    assert len(top_k_per_group(values[:0], [], 2)) == 0